@@ -129,6 +129,10 @@ def start(self):
         self.out_binary = self.register(srd.OUTPUT_BINARY)
         self.out_bitrate = self.register(srd.OUTPUT_META,
                 meta=(int, 'Bitrate', 'Bitrate from Start bit to Stop bit'))
+        self.fmt_byte = {}
+        for cmd in ('ADDRESS READ', 'ADDRESS WRITE', 'DATA READ', 'DATA WRITE'):
+            self.fmt_byte[cmd] = self.register_ann_format(['%s: %%02X' %
+                proto[cmd][1], '%s: %%02X' % proto[cmd][2], '%02X'])
 
     def putx(self, data):
         self.put(self.ss, self.es, self.out_ann, data)
@@ -207,8 +211,9 @@ def handle_address_or_data(self, pins):
 
         self.putb([bin_class, bytes([d])])
 
-        for bit in self.bits:
-            self.put(bit[1], bit[2], self.out_ann, [5, ['%d' % bit[0]]])
+        if self.is_ann_enabled(5):
+            for bit in self.bits:
+                self.put(bit[1], bit[2], self.out_ann, [5, ['%d' % bit[0]]])
 
         if cmd.startswith('ADDRESS'):
             self.ss, self.es = self.samplenum, self.samplenum + self.bitwidth
@@ -216,8 +221,7 @@ def handle_address_or_data(self, pins):
             self.putx([proto[cmd][0], w])
             self.ss, self.es = self.ss_byte, self.samplenum
 
-        self.putx([proto[cmd][0], ['%s: %02X' % (proto[cmd][1], d),
-                   '%s: %02X' % (proto[cmd][2], d), '%02X' % d]])
+        self.putx([proto[cmd][0], self.fmt_byte[cmd], d])
 
         # Done with this packet.
         self.bitcount = self.databyte = 0
@@ -18,7 +18,6 @@
 ##
 
 import sigrokdecode as srd
-from common.srdhelper import bitpack
 
 '''
 OUTPUT_PYTHON format:
@@ -225,8 +224,7 @@ def decode(self):
         # which provide input data.
         conds = []
         cond_idx_clock = None
-        cond_idx_data_0 = None
-        cond_idx_data_N = None
+        cond_idx_data = None
         cond_idx_reset = None
         has_clock = self.has_channel(Pin.CLOCK)
         if has_clock:
@@ -238,9 +236,8 @@ def decode(self):
             }.get(self.options['clock_edge'])
             conds.append({Pin.CLOCK: edge})
         else:
-            cond_idx_data_0 = len(conds)
-            conds.extend([{idx: 'e'} for idx in has_data])
-            cond_idx_data_N = len(conds)
+            cond_idx_data = len(conds)
+            conds.append({'changed': sum(1 << idx for idx in has_data)})
         has_reset = self.has_channel(Pin.RESET)
         if has_reset:
             cond_idx_reset = len(conds)
@@ -250,20 +247,22 @@ def decode(self):
                 'high-active': 1,
             }.get(self.options['reset_polarity'])
 
-        # Keep processing the input stream. Assume "always zero" for
-        # not-connected input lines. Pass data bits (all inputs except
-        # clock and reset) to the handle_bits() method. Handle reset
-        # edges first and data changes then, within the same iteration.
-        # This results in robust operation for low-oversampled input.
+        # Keep processing the input stream. Not-connected input lines
+        # read as zero in the packed pin values. Pass data bits (all
+        # inputs except clock and reset) to the handle_bits() method.
+        # Handle reset edges first and data changes then, within the
+        # same iteration. This results in robust operation for
+        # low-oversampled input.
+        item_mask = (1 << num_item_bits) - 1
         in_reset = False
         while True:
-            pins = self.wait(conds)
+            pins = self.wait(conds, packed=True)
             clock_edge = cond_idx_clock is not None and self.matched[cond_idx_clock]
-            data_edge = cond_idx_data_0 is not None and [idx for idx in range(cond_idx_data_0, cond_idx_data_N) if self.matched[idx]]
+            data_edge = cond_idx_data is not None and self.matched[cond_idx_data]
             reset_edge = cond_idx_reset is not None and self.matched[cond_idx_reset]
 
             if reset_edge:
-                in_reset = pins[Pin.RESET] == reset_active
+                in_reset = ((pins >> Pin.RESET) & 1) == reset_active
                 if in_reset:
                     self.handle_bits(self.samplenum, None, num_item_bits)
                     self.flush_word(num_item_bits)
@@ -271,7 +270,5 @@ def decode(self):
                 continue
 
             if clock_edge or data_edge:
-                data_bits = [0 if idx is None else pins[idx] for idx in data_indices]
-                data_bits = data_bits[:num_item_bits]
-                item = bitpack(data_bits)
+                item = (pins >> Pin.DATA_0) & item_mask
                 self.handle_bits(self.samplenum, item, num_item_bits)
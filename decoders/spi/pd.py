@@ -148,6 +148,7 @@ def start(self):
         self.out_bitrate = self.register(srd.OUTPUT_META,
                 meta=(int, 'Bitrate', 'Bitrate during transfers'))
         self.bw = (self.options['wordsize'] + 7) // 8
+        self.fmt_word = self.register_ann_format(['%02X'])
 
     def metadata(self, key, value):
        if key == srd.SRD_CONF_SAMPLERATE:
@@ -181,18 +182,18 @@ def putdata(self):
             self.mosibytes.append(Data(ss=ss, es=es, val=si))
 
         # Bit annotations.
-        if self.have_miso:
+        if self.have_miso and self.is_ann_enabled(2):
             for bit in self.misobits:
                 self.put(bit[1], bit[2], self.out_ann, [2, ['%d' % bit[0]]])
-        if self.have_mosi:
+        if self.have_mosi and self.is_ann_enabled(3):
             for bit in self.mosibits:
                 self.put(bit[1], bit[2], self.out_ann, [3, ['%d' % bit[0]]])
 
         # Dataword annotations.
         if self.have_miso:
-            self.put(ss, es, self.out_ann, [0, ['%02X' % self.misodata]])
+            self.put(ss, es, self.out_ann, [0, self.fmt_word, self.misodata])
         if self.have_mosi:
-            self.put(ss, es, self.out_ann, [1, ['%02X' % self.mosidata]])
+            self.put(ss, es, self.out_ann, [1, self.fmt_word, self.mosidata])
 
     def reset_decoder_state(self):
         self.misodata = 0 if self.have_miso else None
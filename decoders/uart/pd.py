@@ -209,6 +209,7 @@ def reset(self):
         self.frame_valid = [None, None]
         self.startbit = [-1, -1]
         self.cur_data_bit = [0, 0]
+        self.data_bit_anns = [True, True]
         self.datavalue = [0, 0]
         self.paritybit = [-1, -1]
         self.stopbit1 = [-1, -1]
@@ -225,6 +226,20 @@ def start(self):
         self.out_binary = self.register(srd.OUTPUT_BINARY)
         self.out_ann = self.register(srd.OUTPUT_ANN)
         self.bw = (self.options['data_bits'] + 7) // 8
+        self.fmt_value = self.register_value_format()
+
+    def register_value_format(self):
+        # Data values which don't need ASCII or binary representation
+        # get rendered by the library, only when their text is needed.
+        # Same representation as format_value().
+        fmt, bits = self.options['format'], self.options['data_bits']
+        if fmt == 'dec':
+            return self.register_ann_format(['%d'])
+        if fmt == 'hex':
+            return self.register_ann_format(['%%0%dX' % ((bits + 4 - 1) // 4)])
+        if fmt == 'oct':
+            return self.register_ann_format(['%%0%do' % ((bits + 3 - 1) // 3)])
+        return None
 
     def metadata(self, key, value):
         if key == srd.SRD_CONF_SAMPLERATE:
@@ -270,6 +285,7 @@ def get_start_bit(self, rxtx, signal):
             return
 
         self.cur_data_bit[rxtx] = 0
+        self.data_bit_anns[rxtx] = self.is_ann_enabled(Ann.RX_DATA_BIT + rxtx)
         self.datavalue[rxtx] = 0
         self.startsample[rxtx] = -1
 
@@ -307,7 +323,8 @@ def get_data_bits(self, rxtx, signal):
         if self.startsample[rxtx] == -1:
             self.startsample[rxtx] = self.samplenum
 
-        self.putg([Ann.RX_DATA_BIT + rxtx, ['%d' % signal]])
+        if self.data_bit_anns[rxtx]:
+            self.putg([Ann.RX_DATA_BIT + rxtx, ['%d' % signal]])
 
         # Store individual data bits and their start/end samplenumbers.
         s, halfbit = self.samplenum, int(self.bit_width / 2)
@@ -327,9 +344,12 @@ def get_data_bits(self, rxtx, signal):
             (self.datavalue[rxtx], self.databits[rxtx])])
 
         b = self.datavalue[rxtx]
-        formatted = self.format_value(b)
-        if formatted is not None:
-            self.putx(rxtx, [rxtx, [formatted]])
+        if self.fmt_value is not None:
+            self.putx(rxtx, [rxtx, self.fmt_value, b])
+        else:
+            formatted = self.format_value(b)
+            if formatted is not None:
+                self.putx(rxtx, [rxtx, [formatted]])
 
         bdata = b.to_bytes(self.bw, byteorder='big')
         self.putbin(rxtx, [Bin.RX + rxtx, bdata])
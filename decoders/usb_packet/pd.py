@@ -372,6 +372,14 @@ def handle_packet(self):
 
         self.packet, self.packet_summary = [], ''
 
+    def decode_batch(self, packets):
+        # Most packets are the bits of a USB packet, collect them here.
+        for ss, es, data in packets:
+            if self.state == 'GET BIT' and data[0] == 'BIT':
+                self.bits.append([data[1], ss, es])
+            else:
+                self.decode(ss, es, data)
+
     def decode(self, ss, es, data):
         (ptype, pdata) = data
 
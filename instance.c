@@ -32,6 +32,12 @@ extern SRD_PRIV GSList *sessions;
 
 /** @endcond */
 
+/*
+ * The maximum number of distinct sets of values whose texts get cached
+ * per annotation format. Texts beyond that get rendered for each use.
+ */
+#define ANN_FORMAT_CACHE_SIZE 4096
+
 /**
  * @file
  *
@@ -407,6 +413,9 @@ SRD_API struct srd_decoder_inst *srd_inst_new(struct srd_session *sess,
 		return NULL;
 	}
 
+	/* Allow for the lookup of the instance from its Python object. */
+	((srd_Decoder *)di->py_inst)->di = di;
+
 	PyGILState_Release(gstate);
 
 	if (options && srd_inst_option_set(di, options) != SRD_OK) {
@@ -416,11 +425,28 @@ SRD_API struct srd_decoder_inst *srd_inst_new(struct srd_session *sess,
 	}
 
 	di->condition_list = NULL;
+	di->condition_cache = NULL;
 	di->match_array = NULL;
 	di->abs_start_samplenum = 0;
 	di->abs_end_samplenum = 0;
 	di->inbuf = NULL;
 	di->inbuflen = 0;
+	di->transitions = NULL;
+	di->runs = NULL;
+	di->run_cursor = 0;
+	di->planes = NULL;
+	di->plane_sample = NULL;
+	di->ann_batch = NULL;
+	di->ann_texts = NULL;
+	di->ann_formats = NULL;
+	di->py_decode = NULL;
+	di->decode_batched = FALSE;
+	di->py_pending = NULL;
+	di->disabled_outputs = 0;
+	di->disabled_ann_classes = di->disabled_bin_classes = NULL;
+	di->decimation = 1;
+	di->decim_buf = di->decim_state = NULL;
+	di->decim_buf_size = di->decim_count = 0;
 	di->abs_cur_samplenum = 0;
 	di->thread_handle = NULL;
 	di->got_new_samples = FALSE;
@@ -491,13 +517,24 @@ static void srd_inst_reset_state(struct srd_decoder_inst *di)
 
 	/* Reset internal state of the decoder. */
 	condition_list_free(di);
+	condition_cache_free(di);
 	match_array_free(di);
 	di->abs_start_samplenum = 0;
 	di->abs_end_samplenum = 0;
 	di->inbuf = NULL;
 	di->inbuflen = 0;
+	di->transitions = NULL;
+	di->runs = NULL;
+	di->run_cursor = 0;
+	di->planes = NULL;
+	g_free(di->decim_state);
+	di->decim_state = NULL;
+	di->decim_count = 0;
 	di->abs_cur_samplenum = 0;
 	oldpins_array_free(di);
+	di->width_channels = 0;
+	g_free(di->last_change);
+	di->last_change = NULL;
 	di->got_new_samples = FALSE;
 	di->handled_all_samples = FALSE;
 	di->want_wait_terminate = FALSE;
@@ -506,9 +543,56 @@ static void srd_inst_reset_state(struct srd_decoder_inst *di)
 	/* Conditions and mutex got reset after joining the thread. */
 }
 
+/* Apply a stack's decimation factor to an instance and the ones on top. */
+static void inst_decimation_propagate(struct srd_decoder_inst *di,
+		uint64_t factor)
+{
+	GSList *l;
+
+	di->decimation = factor;
+	for (l = di->next_di; l; l = l->next)
+		inst_decimation_propagate(l->data, factor);
+}
+
+/*
+ * Look up the method which receives a stacked instance's input, once,
+ * rather than for each piece of data. Decoders which implement
+ * decode_batch() take lists of (ss, es, data) tuples.
+ */
+static int inst_decode_method_lookup(struct srd_decoder_inst *di)
+{
+	PyObject *py_decode;
+	gboolean batched;
+	PyGILState_STATE gstate;
+
+	gstate = PyGILState_Ensure();
+
+	batched = PyObject_HasAttrString(di->py_inst, "decode_batch");
+	py_decode = PyObject_GetAttrString(di->py_inst,
+		batched ? "decode_batch" : "decode");
+	if (!py_decode) {
+		srd_exception_catch("Failed to look up decode() of %s",
+			di->inst_id);
+		PyGILState_Release(gstate);
+		return SRD_ERR_PYTHON;
+	}
+	Py_XDECREF(di->py_decode);
+	di->py_decode = py_decode;
+	di->decode_batched = batched;
+
+	PyGILState_Release(gstate);
+
+	return SRD_OK;
+}
+
 /**
  * Stack a decoder instance on top of another.
  *
+ * If di_top's decoder implements decode_batch(), it receives the Python
+ * output of di_bottom as lists of (ss, es, data) tuples, at the latest
+ * when di_bottom is done with a chunk of sample data. Otherwise decode()
+ * gets called for each output.
+ *
  * @param sess The session holding the protocol decoder instances.
  *             Must not be NULL.
  * @param di_bottom The instance on top of which di_top will be stacked.
@@ -522,6 +606,8 @@ SRD_API int srd_inst_stack(struct srd_session *sess,
 		struct srd_decoder_inst *di_bottom,
 		struct srd_decoder_inst *di_top)
 {
+	int ret;
+
 	if (!sess)
 		return SRD_ERR_ARG;
 
@@ -530,6 +616,9 @@ SRD_API int srd_inst_stack(struct srd_session *sess,
 		return SRD_ERR_ARG;
 	}
 
+	if ((ret = inst_decode_method_lookup(di_top)) != SRD_OK)
+		return ret;
+
 	if (g_slist_find(sess->di_list, di_top)) {
 		/* Remove from the unstacked list. */
 		sess->di_list = g_slist_remove(sess->di_list, di_top);
@@ -558,6 +647,7 @@ SRD_API int srd_inst_stack(struct srd_session *sess,
 
 	/* Stack on top of source di. */
 	di_bottom->next_di = g_slist_append(di_bottom->next_di, di_top);
+	inst_decimation_propagate(di_top, di_bottom->decimation);
 
 	srd_dbg("Stacking %s onto %s.", di_top->inst_id, di_bottom->inst_id);
 
@@ -678,19 +768,271 @@ SRD_API int srd_inst_initial_pins_set_all(struct srd_decoder_inst *di, GArray *i
 	return SRD_OK;
 }
 
+/**
+ * Have a decoder stack decode a decimated version of its input.
+ *
+ * Each block of 'factor' input samples is reduced to one sample. Channels
+ * which change within a block become the opposite of their level in the
+ * previous decimated sample, such that short pulses are not lost. The
+ * decoders of the stack see sample numbers and a samplerate which are
+ * divided by the factor, the sample numbers of their output are scaled
+ * back to the input's timebase. To decimate to a target samplerate, pass
+ * the integer part of the input samplerate divided by the target.
+ *
+ * Must be called for the bottom instance of a stack, before the stack
+ * receives sample data. A samplerate which was already set with
+ * srd_session_metadata_set() is passed to the stack's decoders again.
+ *
+ * @param di The bottom decoder instance of the stack. Must not be NULL.
+ * @param factor The decimation factor. Must be > 0, 1 disables decimation.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_inst_decimation_set(struct srd_decoder_inst *di,
+		uint64_t factor)
+{
+	if (!di) {
+		srd_err("Invalid decoder instance.");
+		return SRD_ERR_ARG;
+	}
+
+	if (!factor)
+		return SRD_ERR_ARG;
+
+	if (!g_slist_find(di->sess->di_list, di)) {
+		srd_err("Instance %s is stacked, decimation applies to the "
+			"bottom of a stack.", di->inst_id);
+		return SRD_ERR_ARG;
+	}
+
+	if (di->thread_handle) {
+		srd_err("Instance %s already received sample data.", di->inst_id);
+		return SRD_ERR;
+	}
+
+	inst_decimation_propagate(di, factor);
+	srd_dbg("Decimating the input of instance %s by %" PRIu64 ".",
+		di->inst_id, factor);
+
+	/* The decoders may have seen the undivided samplerate already. */
+	if (di->sess->samplerate)
+		return srd_inst_send_meta(di, SRD_CONF_SAMPLERATE,
+			di->sess->samplerate);
+
+	return SRD_OK;
+}
+
+/**
+ * Enable or disable an output type of a decoder instance.
+ *
+ * Disabled output is dropped as soon as the decoder puts it, before it's
+ * converted for the frontend. Use this when a frontend doesn't consume
+ * an output type of an instance. SRD_OUTPUT_PYTHON feeds the instances
+ * which are stacked on top, it can't be disabled.
+ *
+ * Call this before sending sample data, or between chunks of it.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ * @param output_type The output type (SRD_OUTPUT_ANN, SRD_OUTPUT_BINARY,
+ *                    SRD_OUTPUT_LOGIC or SRD_OUTPUT_META).
+ * @param enable TRUE to enable the output type, FALSE to disable it.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_inst_output_type_enable(struct srd_decoder_inst *di,
+		int output_type, gboolean enable)
+{
+	if (!di) {
+		srd_err("Invalid decoder instance.");
+		return SRD_ERR_ARG;
+	}
+
+	if (output_type < SRD_OUTPUT_ANN || output_type > SRD_OUTPUT_META
+			|| output_type == SRD_OUTPUT_PYTHON) {
+		srd_err("Invalid output type %d.", output_type);
+		return SRD_ERR_ARG;
+	}
+
+	if (enable)
+		di->disabled_outputs &= ~(1U << output_type);
+	else
+		di->disabled_outputs |= 1U << output_type;
+
+	return SRD_OK;
+}
+
+static int inst_class_enable(struct srd_decoder_inst *di,
+		GArray **disabled_classes, unsigned int num_classes,
+		int class_idx, gboolean enable)
+{
+	if (class_idx < 0 || (unsigned int)class_idx >= num_classes) {
+		srd_err("Invalid class %d for instance %s.", class_idx,
+			di->inst_id);
+		return SRD_ERR_ARG;
+	}
+
+	if (!*disabled_classes) {
+		if (enable)
+			return SRD_OK;
+		*disabled_classes = g_array_sized_new(FALSE, TRUE,
+			sizeof(gboolean), num_classes);
+		g_array_set_size(*disabled_classes, num_classes);
+	}
+	g_array_index(*disabled_classes, gboolean, class_idx) = !enable;
+
+	return SRD_OK;
+}
+
+/**
+ * Enable or disable an annotation class of a decoder instance.
+ *
+ * Annotations of disabled classes are dropped as soon as the decoder puts
+ * them. Decoders can check for enabled classes with self.is_ann_enabled(),
+ * and skip preparing annotations which would be dropped.
+ *
+ * Call this before sending sample data, or between chunks of it.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ * @param ann_class The annotation class' index.
+ * @param enable TRUE to enable the class, FALSE to disable it.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_inst_ann_class_enable(struct srd_decoder_inst *di,
+		int ann_class, gboolean enable)
+{
+	if (!di) {
+		srd_err("Invalid decoder instance.");
+		return SRD_ERR_ARG;
+	}
+
+	return inst_class_enable(di, &di->disabled_ann_classes,
+		g_slist_length(di->decoder->annotations), ann_class, enable);
+}
+
+/**
+ * Enable or disable the annotation classes of an annotation row.
+ *
+ * This is srd_inst_ann_class_enable() for all classes of the row.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ * @param ann_row The annotation row's index.
+ * @param enable TRUE to enable the row's classes, FALSE to disable them.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_inst_ann_row_enable(struct srd_decoder_inst *di,
+		int ann_row, gboolean enable)
+{
+	struct srd_decoder_annotation_row *row;
+	GSList *l;
+	int ret;
+
+	if (!di) {
+		srd_err("Invalid decoder instance.");
+		return SRD_ERR_ARG;
+	}
+
+	if (ann_row < 0 || !(row = g_slist_nth_data(di->decoder->annotation_rows, ann_row))) {
+		srd_err("Invalid annotation row %d for instance %s.", ann_row,
+			di->inst_id);
+		return SRD_ERR_ARG;
+	}
+
+	for (l = row->ann_classes; l; l = l->next) {
+		ret = srd_inst_ann_class_enable(di, GPOINTER_TO_INT(l->data), enable);
+		if (ret != SRD_OK)
+			return ret;
+	}
+
+	return SRD_OK;
+}
+
+/**
+ * Enable or disable a binary class of a decoder instance.
+ *
+ * Binary output of disabled classes is dropped as soon as the decoder
+ * puts it.
+ *
+ * Call this before sending sample data, or between chunks of it.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ * @param bin_class The binary class' index.
+ * @param enable TRUE to enable the class, FALSE to disable it.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_inst_binary_class_enable(struct srd_decoder_inst *di,
+		int bin_class, gboolean enable)
+{
+	if (!di) {
+		srd_err("Invalid decoder instance.");
+		return SRD_ERR_ARG;
+	}
+
+	return inst_class_enable(di, &di->disabled_bin_classes,
+		g_slist_length(di->decoder->binary), bin_class, enable);
+}
+
+static GArray *class_mask_copy(const GArray *disabled_classes)
+{
+	GArray *copy;
+
+	if (!disabled_classes)
+		return NULL;
+
+	copy = g_array_sized_new(FALSE, FALSE, sizeof(gboolean),
+		disabled_classes->len);
+	g_array_append_vals(copy, disabled_classes->data, disabled_classes->len);
+
+	return copy;
+}
+
+/** @private */
+SRD_PRIV gboolean srd_inst_class_enabled(const GArray *disabled_classes,
+		int class_idx)
+{
+	if (!disabled_classes || class_idx < 0
+			|| (unsigned int)class_idx >= disabled_classes->len)
+		return TRUE;
+
+	return !g_array_index(disabled_classes, gboolean, class_idx);
+}
+
 /** @private */
 SRD_PRIV int srd_inst_start(struct srd_decoder_inst *di)
 {
-	PyObject *py_res, *py_samplenum;
+	PyObject *py_res, *py_samplenum, *py_unused_pins;
 	GSList *l;
 	struct srd_decoder_inst *next_di;
-	int ret;
+	uint64_t unused_pins;
+	int i, ret;
 	PyGILState_STATE gstate;
 
 	srd_dbg("Calling start() of instance %s.", di->inst_id);
 
 	gstate = PyGILState_Ensure();
 
+	/* Set self.unused_pins, the packed pin values' unused channels. */
+	unused_pins = 0;
+	for (i = 0; i < di->dec_num_channels && i < SRD_MAX_CONDITION_CHANNELS; i++) {
+		if (di->dec_channelmap[i] == -1)
+			unused_pins |= UINT64_C(1) << i;
+	}
+	py_unused_pins = PyLong_FromUnsignedLongLong(unused_pins);
+	PyObject_SetAttrString(di->py_inst, "unused_pins", py_unused_pins);
+	Py_DECREF(py_unused_pins);
+
 	/* Run self.start(). */
 	if (!(py_res = PyObject_CallMethod(di->py_inst, "start", NULL))) {
 		srd_exception_catch("Protocol decoder instance %s",
@@ -720,65 +1062,6 @@ SRD_PRIV int srd_inst_start(struct srd_decoder_inst *di)
 	return SRD_OK;
 }
 
-/**
- * Check whether the specified sample matches the specified term.
- *
- * In the case of SRD_TERM_SKIP, this function can modify
- * term->num_samples_already_skipped.
- *
- * @param old_sample The value of the previous sample (0/1).
- * @param sample The value of the current sample (0/1).
- * @param term The term that should be checked for a match. Must not be NULL.
- *
- * @retval TRUE The current sample matches the specified term.
- * @retval FALSE The current sample doesn't match the specified term, or an
- *               invalid term was provided.
- *
- * @private
- */
-__attribute__((always_inline))
-static inline gboolean sample_matches(uint8_t old_sample, uint8_t sample, struct srd_term *term)
-{
-	/* Caller ensures term != NULL. */
-
-	switch (term->type) {
-	case SRD_TERM_HIGH:
-		if (sample == 1)
-			return TRUE;
-		break;
-	case SRD_TERM_LOW:
-		if (sample == 0)
-			return TRUE;
-		break;
-	case SRD_TERM_RISING_EDGE:
-		if (old_sample == 0 && sample == 1)
-			return TRUE;
-		break;
-	case SRD_TERM_FALLING_EDGE:
-		if (old_sample == 1 && sample == 0)
-			return TRUE;
-		break;
-	case SRD_TERM_EITHER_EDGE:
-		if ((old_sample == 1 && sample == 0) || (old_sample == 0 && sample == 1))
-			return TRUE;
-		break;
-	case SRD_TERM_NO_EDGE:
-		if ((old_sample == 0 && sample == 0) || (old_sample == 1 && sample == 1))
-			return TRUE;
-		break;
-	case SRD_TERM_SKIP:
-		if (term->num_samples_already_skipped == term->num_samples_to_skip)
-			return TRUE;
-		term->num_samples_already_skipped++;
-		break;
-	default:
-		srd_err("Unknown term type %d.", term->type);
-		break;
-	}
-
-	return FALSE;
-}
-
 /** @private */
 SRD_PRIV void match_array_free(struct srd_decoder_inst *di)
 {
@@ -792,37 +1075,161 @@ SRD_PRIV void match_array_free(struct srd_decoder_inst *di)
 /** @private */
 SRD_PRIV void condition_list_free(struct srd_decoder_inst *di)
 {
-	GSList *l, *ll;
+	if (!di || !di->condition_list)
+		return;
 
-	if (!di)
+	g_array_free(di->condition_list, TRUE);
+	di->condition_list = NULL;
+}
+
+/** @private */
+SRD_PRIV void condition_cache_entry_free(gpointer data)
+{
+	struct srd_condition_cache_entry *entry;
+	PyGILState_STATE gstate;
+
+	entry = data;
+	if (!entry)
 		return;
 
-	for (l = di->condition_list; l; l = l->next) {
-		ll = l->data;
-		if (ll)
-			g_slist_free_full(ll, g_free);
-	}
+	gstate = PyGILState_Ensure();
+	Py_DECREF(entry->py_conds);
+	PyGILState_Release(gstate);
 
-	g_slist_free(di->condition_list);
-	di->condition_list = NULL;
+	g_array_free(entry->condition_list, TRUE);
+	g_free(entry);
+}
+
+/** @private */
+SRD_PRIV void condition_cache_free(struct srd_decoder_inst *di)
+{
+	if (!di || !di->condition_cache)
+		return;
+
+	g_slist_free_full(di->condition_cache, condition_cache_entry_free);
+	di->condition_cache = NULL;
 }
 
 static gboolean have_non_null_conds(const struct srd_decoder_inst *di)
 {
-	GSList *l, *cond;
+	const struct srd_condition *cond;
+	guint i;
 
-	if (!di)
+	if (!di || !di->condition_list)
 		return FALSE;
 
-	for (l = di->condition_list; l; l = l->next) {
-		cond = l->data;
-		if (cond)
+	for (i = 0; i < di->condition_list->len; i++) {
+		cond = &g_array_index(di->condition_list, struct srd_condition, i);
+		if (!cond->is_empty)
 			return TRUE;
 	}
 
 	return FALSE;
 }
 
+static inline int plane_bit(const uint8_t *plane, uint64_t offset)
+{
+	return plane && ((plane[offset / 8] >> (offset % 8)) & 1);
+}
+
+/* Assemble a sample from the bit planes of a channel-major chunk. */
+static void plane_set_sample(const struct srd_plane_set *plane_set,
+		uint64_t offset, uint8_t *sample, uint64_t unitsize)
+{
+	unsigned int ch;
+
+	memset(sample, 0, unitsize);
+	for (ch = 0; ch < plane_set->num_planes; ch++) {
+		if (plane_bit(plane_set->planes[ch], offset))
+			sample[ch / 8] |= 1 << (ch % 8);
+	}
+}
+
+/**
+ * Count the samples in which a channel's bit plane doesn't change.
+ *
+ * Compares the plane with the reference bit's level one machine word at
+ * a time. The position of a change is the number of trailing zeros of the
+ * word's difference.
+ *
+ * @param plane The bit plane, or NULL for a channel without data.
+ * @param offset The reference sample's offset within the chunk.
+ * @param count The maximum number of samples to check.
+ *
+ * @return The number of samples following the reference sample which
+ *         don't differ from it, at most count.
+ */
+static uint64_t plane_count_unchanged(const uint8_t *plane, uint64_t offset,
+		uint64_t count)
+{
+	uint64_t pos, end, word, fill;
+	uint8_t diff, fill_byte;
+	int level;
+
+	if (!plane)
+		return count;
+
+	level = plane_bit(plane, offset);
+	fill = level ? UINT64_MAX : 0;
+	fill_byte = level ? 0xff : 0x00;
+	pos = offset + 1;
+	end = pos + count;
+
+	/* Single bits up to a byte boundary, then words and bytes. */
+	while (pos < end && pos % 8) {
+		if (plane_bit(plane, pos) != level)
+			return pos - offset - 1;
+		pos++;
+	}
+	while (end - pos >= 64) {
+		memcpy(&word, plane + pos / 8, sizeof(word));
+		word = GUINT64_FROM_LE(word) ^ fill;
+		if (word)
+			return pos + __builtin_ctzll(word) - offset - 1;
+		pos += 64;
+	}
+	while (end - pos >= 8) {
+		diff = plane[pos / 8] ^ fill_byte;
+		if (diff)
+			return pos + __builtin_ctz(diff) - offset - 1;
+		pos += 8;
+	}
+	while (pos < end) {
+		if (plane_bit(plane, pos) != level)
+			return pos - offset - 1;
+		pos++;
+	}
+
+	return count;
+}
+
+/**
+ * Get a sample of the instance's current chunk.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ * @param offset The sample's offset within the chunk. Must be within the
+ *               chunk.
+ *
+ * @return Pointer to the sample's data. For channel-major chunks, the
+ *         data is only valid until the next call.
+ *
+ * @private
+ */
+SRD_PRIV const uint8_t *srd_inst_sample_pos(struct srd_decoder_inst *di,
+		uint64_t offset)
+{
+	if (di->planes) {
+		plane_set_sample(di->planes, offset, di->plane_sample, di->data_unitsize);
+		return di->plane_sample;
+	}
+	if (!di->runs)
+		return di->inbuf + offset * di->data_unitsize;
+
+	di->run_cursor = srd_run_list_find(di->runs, offset, di->run_cursor);
+
+	return di->runs->values + di->run_cursor * di->data_unitsize;
+}
+
 static void update_old_pins_array(struct srd_decoder_inst *di,
 		const uint8_t *sample_pos)
 {
@@ -852,7 +1259,7 @@ static void update_old_pins_array_initial_pins(struct srd_decoder_inst *di)
 	if (!di || !di->dec_channelmap)
 		return;
 
-	sample_pos = di->inbuf + ((di->abs_cur_samplenum - di->abs_start_samplenum) * di->data_unitsize);
+	sample_pos = srd_inst_sample_pos(di, di->abs_cur_samplenum - di->abs_start_samplenum);
 
 	oldpins_array_seed(di);
 	for (i = 0; i < di->dec_num_channels; i++) {
@@ -867,71 +1274,530 @@ static void update_old_pins_array_initial_pins(struct srd_decoder_inst *di)
 	}
 }
 
-static gboolean term_matches(const struct srd_decoder_inst *di,
-		struct srd_term *term, const uint8_t *sample_pos)
+/**
+ * Lookup table for the extraction of the decoder's pins from a sample.
+ *
+ * Only holds the channels which the current conditions refer to, and
+ * which are connected to input data (unused optional channels read as
+ * low, and never change).
+ */
+struct pin_lookup {
+	int count;
+	uint64_t mask;
+	uint8_t channel[SRD_MAX_CONDITION_CHANNELS];
+	int byte_offset[SRD_MAX_CONDITION_CHANNELS];
+	uint8_t bit_mask[SRD_MAX_CONDITION_CHANNELS];
+};
+
+static void pin_lookup_setup(const struct srd_decoder_inst *di,
+		uint64_t used_mask, struct pin_lookup *lookup)
 {
-	uint8_t old_sample, sample;
-	int byte_offset, bit_offset, ch;
+	int ch, input_ch;
 
-	/* Caller ensures di, di->dec_channelmap, term, sample_pos != NULL. */
+	/* Caller ensures di, di->dec_channelmap, lookup != NULL. */
 
-	if (term->type == SRD_TERM_SKIP)
-		return sample_matches(0, 0, term);
+	lookup->count = 0;
+	lookup->mask = 0;
+	for (ch = 0; ch < di->dec_num_channels; ch++) {
+		if (ch >= SRD_MAX_CONDITION_CHANNELS)
+			break;
+		if (!(used_mask & (UINT64_C(1) << ch)))
+			continue;
+		input_ch = di->dec_channelmap[ch];
+		if (input_ch == -1)
+			continue; /* Ignore unused optional channels. */
+		lookup->channel[lookup->count] = ch;
+		lookup->byte_offset[lookup->count] = input_ch / 8;
+		lookup->bit_mask[lookup->count] = 1 << (input_ch % 8);
+		lookup->mask |= UINT64_C(1) << ch;
+		lookup->count++;
+	}
+}
 
-	ch = term->channel;
-	byte_offset = di->dec_channelmap[ch] / 8;
-	bit_offset = di->dec_channelmap[ch] % 8;
-	sample = *(sample_pos + byte_offset) & (1 << bit_offset) ? 1 : 0;
-	old_sample = di->old_pins_array->data[ch];
+/* Get the pins which the conditions refer to from a sample, as a bitmask. */
+__attribute__((always_inline))
+static inline uint64_t pin_lookup_sample(const struct pin_lookup *lookup,
+		const uint8_t *sample_pos)
+{
+	uint64_t pins;
+	int i;
 
-	return sample_matches(old_sample, sample, term);
+	pins = 0;
+	for (i = 0; i < lookup->count; i++) {
+		if (sample_pos[lookup->byte_offset[i]] & lookup->bit_mask[i])
+			pins |= UINT64_C(1) << lookup->channel[i];
+	}
+
+	return pins;
 }
 
-static gboolean all_terms_match(const struct srd_decoder_inst *di,
-		const GSList *cond, const uint8_t *sample_pos)
+/* Get the previous sample's pins from the old pins array, as a bitmask. */
+static uint64_t pin_lookup_old_pins(const struct srd_decoder_inst *di,
+		const struct pin_lookup *lookup)
 {
-	const GSList *l;
-	struct srd_term *term;
+	uint64_t pins;
+	int i, ch;
+
+	pins = 0;
+	for (i = 0; i < lookup->count; i++) {
+		ch = lookup->channel[i];
+		if (di->old_pins_array->data[ch] == SRD_INITIAL_PIN_HIGH)
+			pins |= UINT64_C(1) << ch;
+	}
+
+	return pins;
+}
+
+/**
+ * Description of the input bits which need to change before any of the
+ * current conditions can match.
+ *
+ * Holds the non-zero bytes of a sample's raw bitmask. For unit sizes of
+ * 1, 2, 4, or 8 bytes the mask also gets replicated into a machine word,
+ * such that several samples can be compared at once.
+ */
+struct change_scan {
+	int unitsize;
+	int count;
+	int byte_offset[SRD_MAX_CONDITION_CHANNELS];
+	uint8_t bit_mask[SRD_MAX_CONDITION_CHANNELS];
+	gboolean use_words;
+	uint64_t word_mask;
+};
+
+static void change_scan_setup(const struct srd_decoder_inst *di,
+		uint64_t channel_mask, struct change_scan *scan)
+{
+	uint8_t raw_mask[sizeof(uint64_t)];
+	int ch, input_ch, byte_offset, i;
+
+	/* Caller ensures di, di->dec_channelmap, scan != NULL. */
 
-	/* Caller ensures di, cond, sample_pos != NULL. */
+	scan->unitsize = di->data_unitsize;
+	scan->count = 0;
+	for (ch = 0; ch < di->dec_num_channels; ch++) {
+		if (ch >= SRD_MAX_CONDITION_CHANNELS)
+			break;
+		if (!(channel_mask & (UINT64_C(1) << ch)))
+			continue;
+		input_ch = di->dec_channelmap[ch];
+		if (input_ch == -1)
+			continue; /* Unused optional channels never change. */
+		byte_offset = input_ch / 8;
+		for (i = 0; i < scan->count; i++) {
+			if (scan->byte_offset[i] == byte_offset)
+				break;
+		}
+		if (i == scan->count) {
+			scan->byte_offset[i] = byte_offset;
+			scan->bit_mask[i] = 0;
+			scan->count++;
+		}
+		scan->bit_mask[i] |= 1 << (input_ch % 8);
+	}
+
+	/* Replicate the sample's mask into a word when possible. */
+	scan->use_words = FALSE;
+	scan->word_mask = 0;
+	switch (scan->unitsize) {
+	case 1:
+	case 2:
+	case 4:
+	case 8:
+		scan->use_words = TRUE;
+		break;
+	}
+	if (!scan->use_words)
+		return;
+	memset(raw_mask, 0, sizeof(raw_mask));
+	for (i = 0; i < scan->count; i++) {
+		byte_offset = scan->byte_offset[i];
+		if (byte_offset >= scan->unitsize)
+			continue; /* Beyond the sample data, never changes. */
+		for (ch = byte_offset; ch < (int)sizeof(raw_mask); ch += scan->unitsize)
+			raw_mask[ch] = scan->bit_mask[i];
+	}
+	memcpy(&scan->word_mask, raw_mask, sizeof(scan->word_mask));
+}
 
-	for (l = cond; l; l = l->next) {
-		term = l->data;
-		if (term->type == SRD_TERM_ALWAYS_FALSE)
+/* Check whether a sample differs from a reference sample under the mask. */
+__attribute__((always_inline))
+static inline gboolean change_scan_differs(const struct change_scan *scan,
+		const uint8_t *ref_pos, const uint8_t *sample_pos)
+{
+	int i, offset;
+
+	for (i = 0; i < scan->count; i++) {
+		offset = scan->byte_offset[i];
+		if ((ref_pos[offset] ^ sample_pos[offset]) & scan->bit_mask[i])
+			return TRUE;
+	}
+
+	return FALSE;
+}
+
+/**
+ * Count the samples which don't differ from a reference sample.
+ *
+ * Samples get compared in the bits which are covered by the scan's mask.
+ * For the common unit sizes several samples are checked at once, in
+ * groups of machine words. Otherwise the (few) relevant bytes of each
+ * sample get compared individually.
+ *
+ * @param scan The scan mask description. Must not be NULL.
+ * @param ref_pos Pointer to the reference sample. Must not be NULL.
+ * @param count The maximum number of samples to check.
+ *
+ * @return The number of samples following the reference sample which
+ *         don't differ from it, at most count.
+ */
+static uint64_t change_scan_count_unchanged(const struct change_scan *scan,
+		const uint8_t *ref_pos, uint64_t count)
+{
+	const uint8_t *sample_pos;
+	uint64_t num_unchanged, samples_per_word, ref_word, w0, w1, w2, w3;
+	uint8_t ref_bytes[sizeof(uint64_t)];
+	int i;
+
+	sample_pos = ref_pos + scan->unitsize;
+	num_unchanged = 0;
+
+	if (scan->use_words) {
+		samples_per_word = sizeof(uint64_t) / scan->unitsize;
+		for (i = 0; i < (int)sizeof(ref_bytes); i++)
+			ref_bytes[i] = ref_pos[i % scan->unitsize];
+		memcpy(&ref_word, ref_bytes, sizeof(ref_word));
+
+		/* Four words per iteration, then single words. */
+		while (count - num_unchanged >= 4 * samples_per_word) {
+			memcpy(&w0, sample_pos + 0 * sizeof(uint64_t), sizeof(w0));
+			memcpy(&w1, sample_pos + 1 * sizeof(uint64_t), sizeof(w1));
+			memcpy(&w2, sample_pos + 2 * sizeof(uint64_t), sizeof(w2));
+			memcpy(&w3, sample_pos + 3 * sizeof(uint64_t), sizeof(w3));
+			if (((w0 ^ ref_word) | (w1 ^ ref_word) |
+			     (w2 ^ ref_word) | (w3 ^ ref_word)) & scan->word_mask)
+				break;
+			sample_pos += 4 * sizeof(uint64_t);
+			num_unchanged += 4 * samples_per_word;
+		}
+		while (count - num_unchanged >= samples_per_word) {
+			memcpy(&w0, sample_pos, sizeof(w0));
+			if ((w0 ^ ref_word) & scan->word_mask)
+				break;
+			sample_pos += sizeof(uint64_t);
+			num_unchanged += samples_per_word;
+		}
+	}
+
+	/* Locate the exact position of a change in the remaining samples. */
+	while (num_unchanged < count) {
+		if (change_scan_differs(scan, ref_pos, sample_pos))
+			break;
+		sample_pos += scan->unitsize;
+		num_unchanged++;
+	}
+
+	return num_unchanged;
+}
+
+/**
+ * Count the samples which don't differ from a sample, in run-length
+ * encoded input. Steps from run to run, until a run differs in the bits
+ * which are covered by the scan's mask.
+ *
+ * @param di The decoder instance. Must not be NULL, di->runs must not
+ *           be NULL.
+ * @param scan The scan mask description. Must not be NULL.
+ * @param offset The reference sample's offset within the chunk.
+ * @param count The maximum number of samples to check.
+ *
+ * @return The number of samples following the reference sample which
+ *         don't differ from it, at most count.
+ */
+static uint64_t run_scan_count_unchanged(struct srd_decoder_inst *di,
+		const struct change_scan *scan, uint64_t offset, uint64_t count)
+{
+	const struct srd_run_list *runs;
+	const uint8_t *ref_pos;
+	uint64_t r;
+
+	runs = di->runs;
+	r = srd_run_list_find(runs, offset, di->run_cursor);
+	ref_pos = runs->values + r * scan->unitsize;
+	for (r++; r < runs->num_runs; r++) {
+		if (runs->ends[r - 1] - offset - 1 >= count)
+			return count;
+		if (change_scan_differs(scan, ref_pos, runs->values + r * scan->unitsize))
+			break;
+	}
+
+	return MIN(count, runs->ends[r - 1] - offset - 1);
+}
+
+/*
+ * Count the samples which don't differ from a sample in the given decoder
+ * channels, in channel-major input.
+ */
+static uint64_t plane_scan_count_unchanged(const struct srd_decoder_inst *di,
+		uint64_t change_mask, uint64_t offset, uint64_t count)
+{
+	int ch, input_ch;
+
+	for (ch = 0; ch < di->dec_num_channels && ch < SRD_MAX_CONDITION_CHANNELS; ch++) {
+		if (!(change_mask & (UINT64_C(1) << ch)))
+			continue;
+		input_ch = di->dec_channelmap[ch];
+		if (input_ch == -1 || (unsigned int)input_ch >= di->planes->num_planes)
+			continue; /* Channels without data never change. */
+		count = plane_count_unchanged(di->planes->planes[input_ch],
+			offset, count);
+	}
+
+	return count;
+}
+
+/**
+ * Check whether the current sample matches the specified condition.
+ *
+ * In the case of a skip term, this function can modify
+ * cond->num_samples_already_skipped.
+ *
+ * @param cond The condition that should be checked. Must not be NULL.
+ * @param pins The decoder's pins at the current sample.
+ * @param changed The pins which changed since the previous sample.
+ *
+ * @retval TRUE The current sample matches the condition.
+ * @retval FALSE The current sample doesn't match the condition.
+ *
+ * @private
+ */
+__attribute__((always_inline))
+static inline gboolean condition_matches(struct srd_condition *cond,
+		uint64_t pins, uint64_t changed, uint64_t samplenum)
+{
+	uint64_t width;
+
+	if (cond->is_empty || cond->always_false)
+		return FALSE;
+
+	/* Track the pins' changes for width terms. */
+	width = 0;
+	if (cond->track_mask) {
+		width = samplenum - cond->last_change;
+		if (changed & cond->track_mask)
+			cond->last_change = samplenum;
+	}
+
+	if (cond->has_skip) {
+		if (cond->num_samples_already_skipped < cond->num_samples_to_skip) {
+			cond->num_samples_already_skipped++;
+			return FALSE;
+		}
+	}
+
+	if ((pins & cond->level_mask) != cond->level_value)
+		return FALSE;
+	if ((changed & cond->edge_mask) != cond->edge_value)
+		return FALSE;
+	if (cond->any_edge_mask && !(changed & cond->any_edge_mask))
+		return FALSE;
+
+	if (cond->track_mask) {
+		if (width < cond->min_width || width > cond->max_width)
 			return FALSE;
-		if (!term_matches(di, term, sample_pos))
+		if (cond->stable_samples && (changed & cond->track_mask))
+			return FALSE;
+		if (width < cond->stable_samples)
 			return FALSE;
 	}
 
 	return TRUE;
 }
 
-static gboolean at_least_one_condition_matched(
-		const struct srd_decoder_inst *di, unsigned int num_conditions)
+/**
+ * Determine how far away the next sample is which could match.
+ *
+ * Pending skip terms cannot match before their remaining number of
+ * samples has passed, and get resolved arithmetically instead of being
+ * counted sample by sample. Conditions which require an edge, or whose
+ * levels don't match the current sample, can only match after one of
+ * their pins has changed. The caller determines the position of that
+ * change from the session's transition index or by scanning the input.
+ * Stable terms cannot match before their pins were unchanged for the
+ * given number of samples. Changes of pins which width terms refer to
+ * always need to be inspected.
+ *
+ * @param conds The array of conditions. Must not be NULL.
+ * @param num_conditions The number of conditions.
+ * @param pins The decoder's pins at the current sample.
+ * @param samplenum The current (absolute) sample number.
+ * @param change_mask Receives the mask of the decoder's channels which
+ *                    need to change before a condition can match.
+ *                    Must not be NULL.
+ *
+ * @return The distance (in samples) to the next sample which could match
+ *         regardless of pin changes, or UINT64_MAX if there is none.
+ *
+ * @private
+ */
+static uint64_t next_candidate_distance(const struct srd_condition *conds,
+		unsigned int num_conditions, uint64_t pins, uint64_t samplenum,
+		uint64_t *change_mask)
 {
-	unsigned int i;
+	uint64_t distance, num_pending;
+	unsigned int j;
 
-	/* Caller ensures di != NULL. */
+	distance = UINT64_MAX;
+	*change_mask = 0;
+	for (j = 0; j < num_conditions; j++) {
+		if (conds[j].is_empty || conds[j].always_false)
+			continue;
+		num_pending = 0;
+		if (conds[j].has_skip)
+			num_pending = conds[j].num_samples_to_skip - conds[j].num_samples_already_skipped;
+		if (num_pending)
+			distance = MIN(distance, num_pending + 1);
+		else if (conds[j].edge_value || conds[j].any_edge_mask ||
+				(pins & conds[j].level_mask) != conds[j].level_value)
+			*change_mask |= conds[j].level_mask | conds[j].edge_mask | conds[j].any_edge_mask;
+		else if (conds[j].last_change + conds[j].stable_samples > samplenum + 1)
+			distance = MIN(distance, conds[j].last_change + conds[j].stable_samples - samplenum);
+		else
+			distance = 1;
+		*change_mask |= conds[j].track_mask;
+	}
 
-	for (i = 0; i < num_conditions; i++) {
-		if (di->match_array->data[i])
-			return TRUE;
+	return distance;
+}
+
+/**
+ * Look up the next change of some of the decoder's pins in the session's
+ * transition index.
+ *
+ * @param di The decoder instance. Must not be NULL, di->transitions must
+ *           not be NULL.
+ * @param change_mask The mask of the decoder's channels to check.
+ * @param offset The current sample's offset within the chunk.
+ *
+ * @return The distance (in samples) to the next change of one of the pins,
+ *         or UINT64_MAX if none of the pins is connected.
+ *
+ * @private
+ */
+static uint64_t next_transition_distance(const struct srd_decoder_inst *di,
+		uint64_t change_mask, uint64_t offset)
+{
+	uint64_t next, next_change;
+	int ch, input_ch;
+
+	next_change = UINT64_MAX;
+	for (ch = 0; ch < di->dec_num_channels && ch < SRD_MAX_CONDITION_CHANNELS; ch++) {
+		if (!(change_mask & (UINT64_C(1) << ch)))
+			continue;
+		input_ch = di->dec_channelmap[ch];
+		if (input_ch == -1)
+			continue; /* Unused optional channels never change. */
+		next = srd_transition_index_next(di->transitions, input_ch, offset + 1);
+		next_change = MIN(next_change, next);
 	}
+	if (next_change == UINT64_MAX)
+		return UINT64_MAX;
 
-	return FALSE;
+	return next_change - offset;
+}
+
+/* Start to track the changes of the decoder's channels. */
+static void width_tracking_seed(struct srd_decoder_inst *di)
+{
+	int ch;
+
+	if (di->last_change)
+		return;
+
+	di->last_change = g_malloc0(SRD_MAX_CONDITION_CHANNELS * sizeof(uint64_t));
+	for (ch = 0; ch < di->dec_num_channels && ch < SRD_MAX_CONDITION_CHANNELS; ch++) {
+		if (di->dec_channelmap[ch] == -1)
+			continue; /* Unused optional channels never change. */
+		di->last_change[ch] = di->abs_cur_samplenum;
+		di->width_channels |= UINT64_C(1) << ch;
+	}
+}
+
+/**
+ * Get the sample number of the last change of some of a decoder
+ * instance's channels, for width terms.
+ *
+ * The changes of all of the decoder's channels get tracked across
+ * .wait() calls and chunks, from the start of the decoding on.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ * @param channel_mask The mask of the decoder's channels.
+ *
+ * @return The sample number of the latest change of the channels.
+ *
+ * @private
+ */
+SRD_PRIV uint64_t srd_inst_last_change(struct srd_decoder_inst *di,
+		uint64_t channel_mask)
+{
+	uint64_t last_change;
+	int ch;
+
+	width_tracking_seed(di);
+	last_change = 0;
+	for (ch = 0; ch < SRD_MAX_CONDITION_CHANNELS; ch++) {
+		if (channel_mask & (UINT64_C(1) << ch))
+			last_change = MAX(last_change, di->last_change[ch]);
+	}
+
+	return last_change;
+}
+
+/* Remember the changes of the channels which width terms refer to. */
+static void record_width_changes(struct srd_decoder_inst *di,
+		uint64_t changed, uint64_t samplenum)
+{
+	int ch;
+
+	for (ch = 0; changed; ch++, changed >>= 1) {
+		if (changed & 1)
+			di->last_change[ch] = samplenum;
+	}
+}
+
+/* Account for samples which were passed over without checking them. */
+static void advance_skip_counts(struct srd_condition *conds,
+		unsigned int num_conditions, uint64_t num_samples)
+{
+	unsigned int j;
+
+	for (j = 0; j < num_conditions; j++) {
+		if (!conds[j].has_skip)
+			continue;
+		conds[j].num_samples_already_skipped = MIN(conds[j].num_samples_to_skip,
+			conds[j].num_samples_already_skipped + num_samples);
+	}
 }
 
 static gboolean find_match(struct srd_decoder_inst *di)
 {
-	uint64_t i, j, num_samples_to_process;
-	GSList *l, *cond;
+	uint64_t i, num_samples_to_process, num_left, distance, num_unchanged;
+	uint64_t used_mask, active_mask, change_mask, pins, old_pins, changed;
 	const uint8_t *sample_pos;
-	unsigned int num_conditions;
+	struct srd_condition *conds;
+	struct pin_lookup lookup;
+	struct change_scan scan;
+	gboolean matched, found;
+	unsigned int j, num_conditions;
 
 	/* Caller ensures di != NULL. */
 
+	/* Automatic matches don't provide per-condition results. */
+	if (di->match_array)
+		g_array_set_size(di->match_array, 0);
+
 	/* Check whether the condition list is NULL/empty. */
-	if (!di->condition_list) {
+	if (!di->condition_list || !di->condition_list->len) {
 		srd_dbg("NULL/empty condition list, automatic match.");
 		return TRUE;
 	}
@@ -943,37 +1809,123 @@ static gboolean find_match(struct srd_decoder_inst *di)
 	}
 
 	num_samples_to_process = di->abs_end_samplenum - di->abs_cur_samplenum;
-	num_conditions = g_slist_length(di->condition_list);
+	num_conditions = di->condition_list->len;
+	conds = &g_array_index(di->condition_list, struct srd_condition, 0);
 
-	/* di->match_array is NULL here. Create a new GArray. */
-	di->match_array = g_array_sized_new(FALSE, TRUE, sizeof(gboolean), num_conditions);
+	/* The match array gets reused across chunks and .wait() calls. */
+	if (!di->match_array)
+		di->match_array = g_array_sized_new(FALSE, TRUE, sizeof(gboolean), num_conditions);
 	g_array_set_size(di->match_array, num_conditions);
 
+	if (!num_samples_to_process)
+		return FALSE;
+
 	/* Sample 0: Set di->old_pins_array for SRD_INITIAL_PIN_SAME_AS_SAMPLE0 pins. */
 	if (di->abs_cur_samplenum == 0)
 		update_old_pins_array_initial_pins(di);
 
-	for (i = 0; i < num_samples_to_process; i++, (di->abs_cur_samplenum)++) {
+	/*
+	 * Only extract the pins which the conditions refer to. Samples can
+	 * only match edge conditions (or level conditions which currently
+	 * don't match) after at least one of their pins has changed. Runs
+	 * of samples without changes get skipped over, by means of the
+	 * session's transition index if available, by stepping over runs
+	 * or bit planes of such input, or a memory scan.
+	 */
+	used_mask = active_mask = 0;
+	for (j = 0; j < num_conditions; j++) {
+		used_mask |= conds[j].level_mask | conds[j].edge_mask | conds[j].any_edge_mask;
+		if (conds[j].is_empty || conds[j].always_false)
+			continue;
+		active_mask |= conds[j].level_mask | conds[j].edge_mask | conds[j].any_edge_mask;
+	}
+	/* Changes of all channels are inspected, for width terms. */
+	width_tracking_seed(di);
+	used_mask |= di->width_channels;
+	active_mask |= di->width_channels;
+	pin_lookup_setup(di, used_mask, &lookup);
+	change_scan_setup(di, active_mask, &scan);
+	oldpins_array_seed(di);
+	old_pins = pin_lookup_old_pins(di, &lookup);
 
-		sample_pos = di->inbuf + ((di->abs_cur_samplenum - di->abs_start_samplenum) * di->data_unitsize);
+	sample_pos = srd_inst_sample_pos(di, di->abs_cur_samplenum - di->abs_start_samplenum);
+	i = 0;
+	while (TRUE) {
+		pins = pin_lookup_sample(&lookup, sample_pos);
+		changed = pins ^ old_pins;
+		if (changed & di->width_channels)
+			record_width_changes(di, changed & di->width_channels,
+				di->abs_cur_samplenum);
 
 		/* Check whether the current sample matches at least one of the conditions (logical OR). */
 		/* IMPORTANT: We need to check all conditions, even if there was a match already! */
-		for (l = di->condition_list, j = 0; l; l = l->next, j++) {
-			cond = l->data;
-			if (!cond)
-				continue;
-			/* All terms in 'cond' must match (logical AND). */
-			di->match_array->data[j] = all_terms_match(di, cond, sample_pos);
+		found = FALSE;
+		for (j = 0; j < num_conditions; j++) {
+			matched = condition_matches(&conds[j], pins, changed,
+				di->abs_cur_samplenum);
+			g_array_index(di->match_array, gboolean, j) = matched;
+			found |= matched;
 		}
 
-		update_old_pins_array(di, sample_pos);
-
 		/* If at least one condition matched we're done. */
-		if (at_least_one_condition_matched(di, num_conditions))
+		if (found) {
+			update_old_pins_array(di, sample_pos);
 			return TRUE;
+		}
+
+		old_pins = pins;
+
+		/*
+		 * Advance to the next sample which could match. Pending skips
+		 * limit the window which gets scanned for edges.
+		 */
+		num_left = num_samples_to_process - i - 1;
+		distance = next_candidate_distance(conds, num_conditions, pins,
+			di->abs_cur_samplenum, &change_mask);
+		change_mask |= di->width_channels;
+		if (change_mask && distance > 1 && di->transitions) {
+			distance = MIN(distance, next_transition_distance(di,
+				change_mask, di->abs_cur_samplenum - di->abs_start_samplenum));
+		} else if (change_mask && distance > 1 && di->planes) {
+			num_unchanged = plane_scan_count_unchanged(di, change_mask,
+				di->abs_cur_samplenum - di->abs_start_samplenum,
+				MIN(distance - 1, num_left));
+			distance = MIN(distance, num_unchanged + 1);
+		} else if (change_mask && distance > 1 && di->runs) {
+			num_unchanged = run_scan_count_unchanged(di, &scan,
+				di->abs_cur_samplenum - di->abs_start_samplenum,
+				MIN(distance - 1, num_left));
+			distance = MIN(distance, num_unchanged + 1);
+		} else if (change_mask && distance > 1) {
+			num_unchanged = change_scan_count_unchanged(&scan,
+				sample_pos, MIN(distance - 1, num_left));
+			distance = MIN(distance, num_unchanged + 1);
+		}
+		if (distance > num_left) {
+			advance_skip_counts(conds, num_conditions, num_left);
+			break;
+		}
+		advance_skip_counts(conds, num_conditions, distance - 1);
+		i += distance;
+		di->abs_cur_samplenum += distance;
+		if (di->runs || di->planes) {
+			if (distance > 1)
+				old_pins = pin_lookup_sample(&lookup, srd_inst_sample_pos(di,
+					di->abs_cur_samplenum - di->abs_start_samplenum - 1));
+			sample_pos = srd_inst_sample_pos(di,
+				di->abs_cur_samplenum - di->abs_start_samplenum);
+			continue;
+		}
+		sample_pos += distance * di->data_unitsize;
+		if (distance > 1)
+			old_pins = pin_lookup_sample(&lookup, sample_pos - di->data_unitsize);
 	}
 
+	/* All samples were handled, keep the last sample's pins. */
+	di->abs_cur_samplenum = di->abs_end_samplenum;
+	sample_pos = srd_inst_sample_pos(di, di->abs_end_samplenum - 1 - di->abs_start_samplenum);
+	update_old_pins_array(di, sample_pos);
+
 	return FALSE;
 }
 
@@ -1027,6 +1979,127 @@ SRD_PRIV int process_samples_until_condition_match(struct srd_decoder_inst *di,
 	return SRD_OK;
 }
 
+/**
+ * Move a decoder instance's current sample one sample ahead, like a
+ * 'skip' term of one sample would. Skip terms of the conditions which
+ * are set up count the sample as skipped.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ *
+ * @private
+ */
+SRD_PRIV void srd_inst_condition_step(struct srd_decoder_inst *di)
+{
+	if (di->condition_list && di->condition_list->len)
+		advance_skip_counts(&g_array_index(di->condition_list,
+			struct srd_condition, 0), di->condition_list->len, 1);
+	di->abs_cur_samplenum++;
+}
+
+/**
+ * Collect the transitions of one of a decoder instance's channels.
+ *
+ * Inspects the samples after the current sample, up to the end of the
+ * current chunk or the given sample number, whichever comes first.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ * @param channel The decoder's channel index. Must be a valid index.
+ * @param abs_end_samplenum The absolute sample number to stop at.
+ * @param edges Receives the absolute sample numbers (uint64_t) of the
+ *              samples where the channel differs from the previous
+ *              sample. Must not be NULL.
+ *
+ * @return The channel's value at the current sample (0 or 1), 0xff for
+ *         unused optional channels, or -1 if no sample data is available.
+ *
+ * @private
+ */
+SRD_PRIV int srd_inst_channel_edges(const struct srd_decoder_inst *di,
+		int channel, uint64_t abs_end_samplenum, GArray *edges)
+{
+	uint64_t offset, end_offset, abs_samplenum, r;
+	const uint8_t *sample_pos, *plane;
+	int input_ch, byte_offset, value, level;
+	uint8_t bit_mask;
+
+	if ((!di->inbuf && !di->planes) || di->abs_cur_samplenum < di->abs_start_samplenum ||
+			di->abs_cur_samplenum >= di->abs_end_samplenum)
+		return -1;
+
+	input_ch = di->dec_channelmap[channel];
+	if (input_ch == -1)
+		return 0xff;
+
+	offset = di->abs_cur_samplenum - di->abs_start_samplenum;
+	end_offset = MIN(di->abs_end_samplenum, abs_end_samplenum);
+	end_offset = MAX(end_offset, di->abs_cur_samplenum) - di->abs_start_samplenum;
+
+	/* Search channel-major input's bit plane for changes. */
+	if (di->planes) {
+		plane = NULL;
+		if ((unsigned int)input_ch < di->planes->num_planes)
+			plane = di->planes->planes[input_ch];
+		level = plane_bit(plane, offset);
+		while (offset + 1 < end_offset) {
+			offset += plane_count_unchanged(plane, offset,
+				end_offset - offset - 1) + 1;
+			if (offset >= end_offset)
+				break;
+			abs_samplenum = di->abs_start_samplenum + offset;
+			g_array_append_val(edges, abs_samplenum);
+		}
+		return level;
+	}
+
+	byte_offset = input_ch / 8;
+	bit_mask = 1 << (input_ch % 8);
+	r = 0;
+	if (di->runs) {
+		r = srd_run_list_find(di->runs, offset, 0);
+		sample_pos = di->runs->values + r * di->data_unitsize;
+	} else {
+		sample_pos = di->inbuf + offset * di->data_unitsize;
+	}
+	level = sample_pos[byte_offset] & bit_mask ? 1 : 0;
+
+	/* Run-length encoded input holds the transitions already. */
+	if (di->runs) {
+		value = level;
+		for (r++; r < di->runs->num_runs && di->runs->ends[r - 1] < end_offset; r++) {
+			sample_pos = di->runs->values + r * di->data_unitsize;
+			if ((sample_pos[byte_offset] & bit_mask ? 1 : 0) == value)
+				continue;
+			value = !value;
+			abs_samplenum = di->abs_start_samplenum + di->runs->ends[r - 1];
+			g_array_append_val(edges, abs_samplenum);
+		}
+		return level;
+	}
+
+	/* Use the session's transition index when available. */
+	if (di->transitions && (unsigned int)input_ch < di->transitions->num_channels &&
+			di->transitions->offsets[input_ch]) {
+		while ((offset = srd_transition_index_next(di->transitions,
+				input_ch, offset + 1)) < end_offset) {
+			abs_samplenum = di->abs_start_samplenum + offset;
+			g_array_append_val(edges, abs_samplenum);
+		}
+		return level;
+	}
+
+	value = level;
+	for (offset++; offset < end_offset; offset++) {
+		sample_pos += di->data_unitsize;
+		if ((sample_pos[byte_offset] & bit_mask ? 1 : 0) == value)
+			continue;
+		value = !value;
+		abs_samplenum = di->abs_start_samplenum + offset;
+		g_array_append_val(edges, abs_samplenum);
+	}
+
+	return level;
+}
+
 /**
  * Worker thread (per PD-stack).
  *
@@ -1133,7 +2206,253 @@ static gpointer di_thread(gpointer data)
 }
 
 /**
- * Decode a chunk of samples.
+ * Create a copy of a decoder instance and the instances stacked on top
+ * of it, in another session.
+ *
+ * The copies get the same instance IDs, options, channel map and initial
+ * pin states as the originals. The frontend callbacks of the other
+ * session receive their output.
+ *
+ * @param sess The session to create the copies in. Must not be NULL.
+ * @param di The decoder instance to copy. Must not be NULL.
+ * @param inst_map Hash table which receives the copies as keys, and the
+ *                 respective original instances as values. Can be NULL.
+ *
+ * @return The copy of the decoder instance, or NULL upon error.
+ *
+ * @private
+ */
+SRD_PRIV struct srd_decoder_inst *srd_inst_clone(struct srd_session *sess,
+		struct srd_decoder_inst *di, GHashTable *inst_map)
+{
+	struct srd_decoder_inst *di_copy, *next_copy;
+	GHashTable *options;
+	GVariant *value;
+	PyObject *py_options, *py_key, *py_value;
+	Py_ssize_t pos;
+	char *key;
+	GSList *l;
+	PyGILState_STATE gstate;
+
+	/* Collect the instance's current option values. */
+	options = g_hash_table_new_full(g_str_hash, g_str_equal, g_free,
+			(GDestroyNotify)g_variant_unref);
+	gstate = PyGILState_Ensure();
+	py_options = PyObject_GetAttrString(di->py_inst, "options");
+	if (!py_options)
+		PyErr_Clear();
+	if (py_options && PyDict_Check(py_options)) {
+		pos = 0;
+		while (PyDict_Next(py_options, &pos, &py_key, &py_value)) {
+			if (py_str_as_str(py_key, &key) != SRD_OK)
+				continue;
+			if (!(value = py_obj_to_variant(py_value))) {
+				g_free(key);
+				continue;
+			}
+			g_hash_table_insert(options, key, g_variant_ref_sink(value));
+		}
+	}
+	Py_XDECREF(py_options);
+	PyGILState_Release(gstate);
+
+	di_copy = srd_inst_new(sess, di->decoder->id, options);
+	g_hash_table_destroy(options);
+	if (!di_copy)
+		return NULL;
+
+	g_free(di_copy->inst_id);
+	di_copy->inst_id = g_strdup(di->inst_id);
+	if (di->dec_num_channels) {
+		memcpy(di_copy->dec_channelmap, di->dec_channelmap,
+			sizeof(int) * di->dec_num_channels);
+	}
+	if (di->old_pins_array) {
+		memcpy(di_copy->old_pins_array->data, di->old_pins_array->data,
+			di->old_pins_array->len);
+	}
+	di_copy->decimation = di->decimation;
+	di_copy->disabled_outputs = di->disabled_outputs;
+	di_copy->disabled_ann_classes = class_mask_copy(di->disabled_ann_classes);
+	di_copy->disabled_bin_classes = class_mask_copy(di->disabled_bin_classes);
+	if (inst_map)
+		g_hash_table_insert(inst_map, di_copy, di);
+
+	for (l = di->next_di; l; l = l->next) {
+		if (!(next_copy = srd_inst_clone(sess, l->data, inst_map)))
+			return NULL;
+		srd_inst_stack(sess, di_copy, next_copy);
+	}
+
+	return di_copy;
+}
+
+/**
+ * Have a decoder instance start decoding at a later position.
+ *
+ * Must be called before the instance receives any sample data.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ * @param abs_samplenum The absolute sample number of the first sample
+ *                      which the instance will receive.
+ * @param prev_sample Pointer to the sample before that position, which
+ *                    provides the instance's initial pin states. Can be
+ *                    NULL when abs_samplenum is 0.
+ *
+ * @private
+ */
+SRD_PRIV void srd_inst_seek(struct srd_decoder_inst *di,
+		uint64_t abs_samplenum, const uint8_t *prev_sample)
+{
+	/* Decimated input starts with a partial block. */
+	di->abs_cur_samplenum = abs_samplenum / di->decimation;
+	di->decim_count = abs_samplenum % di->decimation;
+	if (abs_samplenum && prev_sample)
+		update_old_pins_array(di, prev_sample);
+}
+
+/* Reduce the current block of input samples to one decimated sample. */
+static void inst_decimate_block(struct srd_decoder_inst *di, uint64_t unitsize,
+		uint8_t *out)
+{
+	uint8_t *acc_and, *acc_or, *prev;
+	uint64_t i;
+
+	acc_and = di->decim_state;
+	acc_or = acc_and + unitsize;
+	prev = acc_or + unitsize;
+
+	/*
+	 * Channels keep the level which they had throughout the block.
+	 * Channels which changed become the opposite of their previous
+	 * decimated level, which keeps pulses shorter than a block.
+	 */
+	for (i = 0; i < unitsize; i++)
+		out[i] = acc_and[i] | (~prev[i] & (acc_and[i] ^ acc_or[i]));
+	memcpy(prev, out, unitsize);
+	di->decim_count = 0;
+}
+
+/* Add a run of identical input samples to the decimation. */
+static inline void inst_decimate_add(struct srd_decoder_inst *di,
+		const uint8_t *sample, uint64_t length, uint64_t unitsize,
+		uint64_t *num_out)
+{
+	uint8_t *acc_and, *acc_or;
+	uint64_t n, j;
+
+	acc_and = di->decim_state;
+	acc_or = acc_and + unitsize;
+	while (length) {
+		if (!di->decim_count) {
+			memcpy(acc_and, sample, unitsize);
+			memcpy(acc_or, sample, unitsize);
+		} else {
+			for (j = 0; j < unitsize; j++) {
+				acc_and[j] &= sample[j];
+				acc_or[j] |= sample[j];
+			}
+		}
+		n = MIN(length, di->decimation - di->decim_count);
+		di->decim_count += n;
+		length -= n;
+		if (di->decim_count < di->decimation)
+			break;
+		inst_decimate_block(di, unitsize,
+			di->decim_buf + (*num_out)++ * unitsize);
+	}
+}
+
+/*
+ * Decimate a chunk of input samples into di->decim_buf. Returns the number
+ * of decimated samples, a trailing partial block is kept for the next chunk.
+ */
+static uint64_t inst_decimate(struct srd_decoder_inst *di,
+		const uint8_t *inbuf, uint64_t num_samples, uint64_t unitsize,
+		const struct srd_run_list *runs, const struct srd_plane_set *planes)
+{
+	uint64_t num_out, size, i;
+
+	/* Leave room for the last, incomplete block at EOF. */
+	size = MAX((di->decim_count + num_samples) / di->decimation, 1) * unitsize;
+	if (size > di->decim_buf_size) {
+		di->decim_buf = g_realloc(di->decim_buf, size);
+		di->decim_buf_size = size;
+	}
+
+	if (runs) {
+		inbuf = runs->values;
+	} else if (planes) {
+		plane_set_sample(planes, 0, di->plane_sample, unitsize);
+		inbuf = di->plane_sample;
+	}
+
+	/* Assume the first sample's levels before the input. */
+	if (!di->decim_state) {
+		di->decim_state = g_malloc(3 * unitsize);
+		for (i = 0; i < 3; i++)
+			memcpy(di->decim_state + i * unitsize, inbuf, unitsize);
+	}
+
+	num_out = 0;
+	if (runs) {
+		for (i = 0; i < runs->num_runs; i++) {
+			inst_decimate_add(di, runs->values + i * unitsize,
+				runs->ends[i] - (i ? runs->ends[i - 1] : 0),
+				unitsize, &num_out);
+		}
+	} else if (planes) {
+		for (i = 0; i < num_samples; i++) {
+			plane_set_sample(planes, i, di->plane_sample, unitsize);
+			inst_decimate_add(di, di->plane_sample, 1, unitsize, &num_out);
+		}
+	} else {
+		for (i = 0; i < num_samples; i++)
+			inst_decimate_add(di, inbuf + i * unitsize, 1, unitsize, &num_out);
+	}
+
+	return num_out;
+}
+
+/* Hand a chunk of samples to the instance's worker thread. */
+static void inst_decode_push(struct srd_decoder_inst *di,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint8_t *inbuf, uint64_t inbuflen,
+		const struct srd_transition_index *transitions,
+		const struct srd_run_list *runs, const struct srd_plane_set *planes)
+{
+	/* If this is the first call, start the worker thread. */
+	if (!di->thread_handle) {
+		srd_dbg("No worker thread for this decoder stack "
+			"exists yet, creating one: %s.", di->inst_id);
+		di->thread_handle = g_thread_new(di->inst_id,
+						 di_thread, di);
+	}
+
+	/* Push the new sample chunk to the worker thread. */
+	g_mutex_lock(&di->data_mutex);
+	di->abs_start_samplenum = abs_start_samplenum;
+	di->abs_end_samplenum = abs_end_samplenum;
+	di->inbuf = inbuf;
+	di->inbuflen = inbuflen;
+	di->transitions = transitions;
+	di->runs = runs;
+	di->run_cursor = 0;
+	di->planes = planes;
+	di->got_new_samples = TRUE;
+	di->handled_all_samples = FALSE;
+
+	/* Signal the thread that we have new data. */
+	g_cond_signal(&di->got_new_samples_cond);
+	g_mutex_unlock(&di->data_mutex);
+}
+
+/**
+ * Pass a chunk of samples to a decoder instance.
+ *
+ * This function returns as soon as the instance's worker thread got the
+ * chunk, which allows several decoder stacks to process the same chunk
+ * concurrently. Call srd_inst_decode_finish() to wait for completion.
  *
  * The calls to this function must provide the samples that shall be
  * used by the protocol decoder
@@ -1146,28 +2465,28 @@ static gpointer di_thread(gpointer data)
  * sample numbers within the chunk specified by 'inbuf' and 'inbuflen'.
  *
  * Correct example (4096 samples total, 4 chunks @ 1024 samples each):
- *   srd_inst_decode(di, 0,    1024, inbuf, 1024, 1);
- *   srd_inst_decode(di, 1024, 2048, inbuf, 1024, 1);
- *   srd_inst_decode(di, 2048, 3072, inbuf, 1024, 1);
- *   srd_inst_decode(di, 3072, 4096, inbuf, 1024, 1);
+ *   srd_inst_decode(di, 0,    1024, inbuf, 1024, 1, NULL);
+ *   srd_inst_decode(di, 1024, 2048, inbuf, 1024, 1, NULL);
+ *   srd_inst_decode(di, 2048, 3072, inbuf, 1024, 1, NULL);
+ *   srd_inst_decode(di, 3072, 4096, inbuf, 1024, 1, NULL);
  *
  * The chunk size ('inbuflen') can be arbitrary and can differ between calls.
  *
  * Correct example (4096 samples total, 7 chunks @ various samples each):
- *   srd_inst_decode(di, 0,    1024, inbuf, 1024, 1);
- *   srd_inst_decode(di, 1024, 1124, inbuf,  100, 1);
- *   srd_inst_decode(di, 1124, 1424, inbuf,  300, 1);
- *   srd_inst_decode(di, 1424, 1643, inbuf,  219, 1);
- *   srd_inst_decode(di, 1643, 2048, inbuf,  405, 1);
- *   srd_inst_decode(di, 2048, 3072, inbuf, 1024, 1);
- *   srd_inst_decode(di, 3072, 4096, inbuf, 1024, 1);
+ *   srd_inst_decode(di, 0,    1024, inbuf, 1024, 1, NULL);
+ *   srd_inst_decode(di, 1024, 1124, inbuf,  100, 1, NULL);
+ *   srd_inst_decode(di, 1124, 1424, inbuf,  300, 1, NULL);
+ *   srd_inst_decode(di, 1424, 1643, inbuf,  219, 1, NULL);
+ *   srd_inst_decode(di, 1643, 2048, inbuf,  405, 1, NULL);
+ *   srd_inst_decode(di, 2048, 3072, inbuf, 1024, 1, NULL);
+ *   srd_inst_decode(di, 3072, 4096, inbuf, 1024, 1, NULL);
  *
  * INCORRECT example (4096 samples total, 4 chunks @ 1024 samples each, but
  * the start- and end-samplenumbers are not absolute):
- *   srd_inst_decode(di, 0,    1024, inbuf, 1024, 1);
- *   srd_inst_decode(di, 0,    1024, inbuf, 1024, 1);
- *   srd_inst_decode(di, 0,    1024, inbuf, 1024, 1);
- *   srd_inst_decode(di, 0,    1024, inbuf, 1024, 1);
+ *   srd_inst_decode(di, 0,    1024, inbuf, 1024, 1, NULL);
+ *   srd_inst_decode(di, 0,    1024, inbuf, 1024, 1, NULL);
+ *   srd_inst_decode(di, 0,    1024, inbuf, 1024, 1, NULL);
+ *   srd_inst_decode(di, 0,    1024, inbuf, 1024, 1, NULL);
  *
  * @param di The decoder instance to call. Must not be NULL.
  * @param abs_start_samplenum The absolute starting sample number for the
@@ -1177,21 +2496,33 @@ static gpointer di_thread(gpointer data)
  * @param inbuf The buffer to decode. Must not be NULL.
  * @param inbuflen Length of the buffer. Must be > 0.
  * @param unitsize The number of bytes per sample. Must be > 0.
+ * @param transitions The session's transition index for this chunk,
+ * 		or NULL.
+ * @param runs The chunk's runs if it's run-length encoded, or NULL.
+ * 		inbuf then points to the runs' values, and inbuflen is the
+ * 		length of the decoded samples.
+ * @param planes The chunk's bit planes if it's channel-major, or NULL.
+ * 		inbuf is then NULL, and inbuflen is the length of the
+ * 		samples as if they were interleaved.
  *
  * @return SRD_OK upon success, a (negative) error code otherwise.
  *
  * @private
  */
-SRD_PRIV int srd_inst_decode(struct srd_decoder_inst *di,
+SRD_PRIV int srd_inst_decode_start(struct srd_decoder_inst *di,
 		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
-		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize)
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize,
+		const struct srd_transition_index *transitions,
+		const struct srd_run_list *runs, const struct srd_plane_set *planes)
 {
+	uint64_t num_samples;
+
 	/* Return an error upon unusable input. */
 	if (!di) {
 		srd_dbg("empty decoder instance");
 		return SRD_ERR_ARG;
 	}
-	if (!inbuf) {
+	if (!inbuf && !planes) {
 		srd_dbg("NULL buffer pointer");
 		return SRD_ERR_ARG;
 	}
@@ -1204,7 +2535,7 @@ SRD_PRIV int srd_inst_decode(struct srd_decoder_inst *di,
 		return SRD_ERR_ARG;
 	}
 
-	if (abs_start_samplenum != di->abs_cur_samplenum ||
+	if (abs_start_samplenum != di->abs_cur_samplenum * di->decimation + di->decim_count ||
 	    abs_end_samplenum < abs_start_samplenum) {
 		srd_dbg("Incorrect sample numbers: start=%" PRIu64 ", cur=%"
 			PRIu64 ", end=%" PRIu64 ".", abs_start_samplenum,
@@ -1212,6 +2543,26 @@ SRD_PRIV int srd_inst_decode(struct srd_decoder_inst *di,
 		return SRD_ERR_ARG;
 	}
 
+	/* Samples of channel-major input get assembled on demand. */
+	if (planes)
+		di->plane_sample = g_realloc(di->plane_sample, unitsize);
+
+	if (di->decimation > 1) {
+		if (di->decim_state && unitsize != (uint64_t)di->data_unitsize) {
+			srd_dbg("Unit size changed within decimated input.");
+			return SRD_ERR_ARG;
+		}
+		num_samples = inst_decimate(di, inbuf, inbuflen / unitsize,
+			unitsize, runs, planes);
+		abs_start_samplenum = di->abs_cur_samplenum;
+		abs_end_samplenum = abs_start_samplenum + num_samples;
+		inbuf = di->decim_buf;
+		inbuflen = num_samples * unitsize;
+		transitions = NULL;
+		runs = NULL;
+		planes = NULL;
+	}
+
 	di->data_unitsize = unitsize;
 
 	srd_dbg("Decoding: abs start sample %" PRIu64 ", abs end sample %"
@@ -1220,31 +2571,42 @@ SRD_PRIV int srd_inst_decode(struct srd_decoder_inst *di,
 		abs_end_samplenum - abs_start_samplenum, inbuflen, di->data_unitsize,
 		di->inst_id);
 
-	/* If this is the first call, start the worker thread. */
-	if (!di->thread_handle) {
-		srd_dbg("No worker thread for this decoder stack "
-			"exists yet, creating one: %s.", di->inst_id);
-		di->thread_handle = g_thread_new(di->inst_id,
-						 di_thread, di);
+	/* A decimated chunk can be too short to complete a block. */
+	if (!inbuflen) {
+		g_mutex_lock(&di->data_mutex);
+		di->handled_all_samples = TRUE;
+		g_mutex_unlock(&di->data_mutex);
+		return SRD_OK;
 	}
 
-	/* Push the new sample chunk to the worker thread. */
-	g_mutex_lock(&di->data_mutex);
-	di->abs_start_samplenum = abs_start_samplenum;
-	di->abs_end_samplenum = abs_end_samplenum;
-	di->inbuf = inbuf;
-	di->inbuflen = inbuflen;
-	di->got_new_samples = TRUE;
-	di->handled_all_samples = FALSE;
+	inst_decode_push(di, abs_start_samplenum, abs_end_samplenum,
+		inbuf, inbuflen, transitions, runs, planes);
 
-	/* Signal the thread that we have new data. */
-	g_cond_signal(&di->got_new_samples_cond);
-	g_mutex_unlock(&di->data_mutex);
+	return SRD_OK;
+}
+
+/**
+ * Wait until a decoder instance has handled its chunk of samples.
+ *
+ * @param di The decoder instance which received the chunk by means of
+ *           srd_inst_decode_start(). Must not be NULL.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @private
+ */
+SRD_PRIV int srd_inst_decode_finish(struct srd_decoder_inst *di)
+{
+	if (!di)
+		return SRD_ERR_ARG;
 
 	/* When all samples in this chunk were handled, return. */
 	g_mutex_lock(&di->data_mutex);
 	while (!di->handled_all_samples && !di->want_wait_terminate)
 		g_cond_wait(&di->handled_all_samples_cond, &di->data_mutex);
+	di->transitions = NULL;
+	di->runs = NULL;
+	di->planes = NULL;
 	g_mutex_unlock(&di->data_mutex);
 
 	/* Flush all PDs in the stack that can be flushed */
@@ -1256,6 +2618,394 @@ SRD_PRIV int srd_inst_decode(struct srd_decoder_inst *di,
 	return SRD_OK;
 }
 
+/**
+ * Decode a chunk of samples.
+ *
+ * This is srd_inst_decode_start() followed by srd_inst_decode_finish(),
+ * see there for details.
+ *
+ * @private
+ */
+SRD_PRIV int srd_inst_decode(struct srd_decoder_inst *di,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize,
+		const struct srd_transition_index *transitions)
+{
+	int ret;
+
+	ret = srd_inst_decode_start(di, abs_start_samplenum,
+		abs_end_samplenum, inbuf, inbuflen, unitsize, transitions,
+		NULL, NULL);
+	if (ret != SRD_OK)
+		return ret;
+
+	return srd_inst_decode_finish(di);
+}
+
+
+/**
+ * Pass an instance's batched annotations on to the frontend.
+ *
+ * The caller must not hold the Python interpreter lock.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ *
+ * @private
+ */
+SRD_PRIV void srd_inst_ann_batch_deliver(struct srd_decoder_inst *di)
+{
+	struct srd_ann_batch *batch;
+	struct srd_session *sess;
+	unsigned int i;
+
+	batch = di->ann_batch;
+	if (!batch || !batch->count)
+		return;
+
+	sess = di->sess;
+
+	/* The arrays don't move any more, fill in the pointers. */
+	for (i = 0; i < batch->count; i++) {
+		batch->pdata[i].data = &batch->pda[i];
+		if (batch->text_index[i] != ANN_BATCH_INTERNED)
+			batch->pda[i].ann_text = (char **)&batch->text->pdata[batch->text_index[i]];
+		else if (batch->pda[i].ann_format >= 0 && !sess->ann_text_lazy)
+			batch->pda[i].ann_text = srd_inst_ann_format_text(di,
+				batch->pda[i].ann_format, batch->pda[i].ann_values);
+	}
+
+	if (sess->ann_batch_cb) {
+		g_mutex_lock(&sess->callback_mutex);
+		sess->ann_batch_cb(batch->pdata, batch->count,
+			sess->ann_batch_cb_data);
+		g_mutex_unlock(&sess->callback_mutex);
+	}
+
+	batch->count = 0;
+	g_ptr_array_set_size(batch->text, 0);
+	g_string_chunk_clear(batch->arena);
+	srd_inst_ann_format_release(di);
+}
+
+/**
+ * Pass an instance's batched Python output on to the stacked decoders
+ * which take it in batches, see srd_inst_stack().
+ *
+ * The caller must hold the Python interpreter lock.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ *
+ * @private
+ */
+SRD_PRIV void srd_inst_python_batch_deliver(struct srd_decoder_inst *di)
+{
+	struct srd_decoder_inst *next_di;
+	PyObject *py_pending, *py_res;
+	GSList *l;
+
+	if (!(py_pending = di->py_pending))
+		return;
+	/* Stacked decoders may keep a reference to the list. */
+	di->py_pending = NULL;
+
+	for (l = di->next_di; l; l = l->next) {
+		next_di = l->data;
+		if (!next_di->decode_batched)
+			continue;
+		srd_spew("Instance %s passing %zd outputs to instance %s.",
+			di->inst_id, PyList_Size(py_pending), next_di->inst_id);
+		py_res = PyObject_CallFunctionObjArgs(next_di->py_decode,
+			py_pending, NULL);
+		if (!py_res) {
+			srd_exception_catch("Calling %s decode_batch() failed",
+				next_di->inst_id);
+		}
+		Py_XDECREF(py_res);
+	}
+
+	Py_DECREF(py_pending);
+}
+
+static void inst_ann_batch_free(struct srd_decoder_inst *di)
+{
+	struct srd_ann_batch *batch;
+
+	if (!(batch = di->ann_batch))
+		return;
+
+	g_free(batch->pdata);
+	g_free(batch->pda);
+	g_free(batch->text_index);
+	g_free(batch->values);
+	g_ptr_array_free(batch->text, TRUE);
+	g_string_chunk_free(batch->arena);
+	g_free(batch);
+	di->ann_batch = NULL;
+}
+
+/* The caller must hold the Python interpreter lock. */
+static void inst_ann_texts_free(struct srd_decoder_inst *di)
+{
+	struct srd_ann_text_table *table;
+
+	if (!(table = di->ann_texts))
+		return;
+
+	g_hash_table_destroy(table->lists);
+	g_hash_table_destroy(table->strings);
+	g_string_chunk_free(table->arena);
+	g_free(table);
+	di->ann_texts = NULL;
+}
+
+/*
+ * Apply an annotation format's template to values, appending the result
+ * to 'text'. Without 'text', just check the template. Returns the number
+ * of values which the template takes, or -1 if it's invalid.
+ *
+ * Templates take printf() style conversions of integers: %d, %i, %u,
+ * %x, %X, %o and %c, with optional flags and a width of up to 99. %%
+ * is a literal percent sign.
+ */
+static int ann_format_apply(const char *tmpl, const int64_t *values,
+		GString *text)
+{
+	const char *p;
+	char spec[16];
+	size_t len;
+	int width, num_values;
+
+	num_values = 0;
+	for (p = tmpl; *p; p++) {
+		if (*p != '%') {
+			if (text)
+				g_string_append_c(text, *p);
+			continue;
+		}
+		if (*++p == '%') {
+			if (text)
+				g_string_append_c(text, '%');
+			continue;
+		}
+
+		len = 0;
+		spec[len++] = '%';
+		while (*p && strchr("-+ #0", *p) && len < 6)
+			spec[len++] = *p++;
+		for (width = 0; g_ascii_isdigit(*p) && width < 2; width++)
+			spec[len++] = *p++;
+		if (!*p || !strchr("diuxXoc", *p))
+			return -1;
+		if (num_values == ANN_FORMAT_MAX_VALUES)
+			return -1;
+		spec[len] = '\0';
+
+		if (text) {
+			switch (*p) {
+			case 'd':
+			case 'i':
+				g_strlcat(spec, PRId64, sizeof(spec));
+				g_string_append_printf(text, spec, values[num_values]);
+				break;
+			case 'c':
+				g_strlcat(spec, "c", sizeof(spec));
+				g_string_append_printf(text, spec, (int)values[num_values]);
+				break;
+			default:
+				if (*p == 'u')
+					g_strlcat(spec, PRIu64, sizeof(spec));
+				else if (*p == 'x')
+					g_strlcat(spec, PRIx64, sizeof(spec));
+				else if (*p == 'X')
+					g_strlcat(spec, PRIX64, sizeof(spec));
+				else
+					g_strlcat(spec, PRIo64, sizeof(spec));
+				g_string_append_printf(text, spec,
+					(uint64_t)values[num_values]);
+				break;
+			}
+		}
+		num_values++;
+	}
+
+	return num_values;
+}
+
+static guint ann_values_hash(gconstpointer key)
+{
+	const struct srd_ann_values *v;
+	guint hash;
+	int i;
+
+	v = key;
+	hash = 0;
+	for (i = 0; i < ANN_FORMAT_MAX_VALUES; i++)
+		hash = hash * 31 + g_int64_hash(&v->values[i]);
+
+	return hash;
+}
+
+static gboolean ann_values_equal(gconstpointer a, gconstpointer b)
+{
+	return memcmp(a, b, sizeof(struct srd_ann_values)) == 0;
+}
+
+static void ann_format_free(struct srd_ann_format *fmt)
+{
+	g_strfreev(fmt->templates);
+	g_hash_table_destroy(fmt->texts);
+	g_free(fmt);
+}
+
+static void inst_ann_formats_free(struct srd_decoder_inst *di)
+{
+	struct srd_ann_format_table *table;
+
+	if (!(table = di->ann_formats))
+		return;
+
+	g_ptr_array_free(table->formats, TRUE);
+	g_ptr_array_free(table->uncached, TRUE);
+	g_free(table);
+	di->ann_formats = NULL;
+}
+
+/**
+ * Add a text format for annotations to a decoder instance.
+ *
+ * Registering the same templates again returns the existing format.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ * @param templates The NULL terminated list of templates, one per text
+ *                  variant. Ownership passes to the instance.
+ *
+ * @return The format's index, or SRD_ERR_ARG for invalid templates.
+ *
+ * @private
+ */
+SRD_PRIV int srd_inst_ann_format_add(struct srd_decoder_inst *di,
+		char **templates)
+{
+	struct srd_ann_format_table *table;
+	struct srd_ann_format *fmt;
+	unsigned int i, j, num_values;
+	int ret;
+
+	num_values = 0;
+	for (i = 0; templates[i]; i++) {
+		if ((ret = ann_format_apply(templates[i], NULL, NULL)) < 0) {
+			srd_err("Protocol decoder %s registered invalid annotation "
+				"format '%s'.", di->decoder->name, templates[i]);
+			g_strfreev(templates);
+			return SRD_ERR_ARG;
+		}
+		num_values = MAX(num_values, (unsigned int)ret);
+	}
+	if (i == 0) {
+		srd_err("Protocol decoder %s registered an annotation format "
+			"without templates.", di->decoder->name);
+		g_strfreev(templates);
+		return SRD_ERR_ARG;
+	}
+
+	if (!(table = di->ann_formats)) {
+		table = g_malloc(sizeof(*table));
+		table->formats = g_ptr_array_new_with_free_func(
+			(GDestroyNotify)ann_format_free);
+		table->uncached = g_ptr_array_new_with_free_func(
+			(GDestroyNotify)g_strfreev);
+		di->ann_formats = table;
+	}
+
+	for (i = 0; i < table->formats->len; i++) {
+		fmt = g_ptr_array_index(table->formats, i);
+		for (j = 0; templates[j] && fmt->templates[j]; j++) {
+			if (strcmp(fmt->templates[j], templates[j]) != 0)
+				break;
+		}
+		if (!templates[j] && !fmt->templates[j]) {
+			g_strfreev(templates);
+			return i;
+		}
+	}
+
+	fmt = g_malloc(sizeof(*fmt));
+	fmt->templates = templates;
+	fmt->num_values = num_values;
+	fmt->texts = g_hash_table_new_full(ann_values_hash, ann_values_equal,
+		g_free, (GDestroyNotify)g_strfreev);
+	g_ptr_array_add(table->formats, fmt);
+
+	srd_dbg("Instance %s registered annotation format %u ('%s').",
+		di->inst_id, table->formats->len - 1, templates[0]);
+
+	return table->formats->len - 1;
+}
+
+/**
+ * Render the texts of a formatted annotation.
+ *
+ * Texts of recurring values are cached. Others are only valid until
+ * srd_inst_ann_format_release() gets called.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ * @param format The index of a format of the instance.
+ * @param values The format's number of values.
+ *
+ * @return The NULL terminated list of texts, owned by the instance.
+ *
+ * @private
+ */
+SRD_PRIV char **srd_inst_ann_format_text(struct srd_decoder_inst *di,
+		int format, const int64_t *values)
+{
+	struct srd_ann_format_table *table;
+	struct srd_ann_format *fmt;
+	struct srd_ann_values key, *cached;
+	GString *text;
+	char **texts;
+	unsigned int num_texts, i;
+
+	table = di->ann_formats;
+	fmt = g_ptr_array_index(table->formats, format);
+
+	memset(&key, 0, sizeof(key));
+	memcpy(key.values, values, sizeof(*values) * fmt->num_values);
+	if ((texts = g_hash_table_lookup(fmt->texts, &key)))
+		return texts;
+
+	num_texts = g_strv_length(fmt->templates);
+	texts = g_malloc(sizeof(*texts) * (num_texts + 1));
+	for (i = 0; i < num_texts; i++) {
+		text = g_string_sized_new(16);
+		ann_format_apply(fmt->templates[i], key.values, text);
+		texts[i] = g_string_free(text, FALSE);
+	}
+	texts[num_texts] = NULL;
+
+	if (g_hash_table_size(fmt->texts) < ANN_FORMAT_CACHE_SIZE) {
+		cached = g_malloc(sizeof(*cached));
+		*cached = key;
+		g_hash_table_insert(fmt->texts, cached, texts);
+	} else {
+		g_ptr_array_add(table->uncached, texts);
+	}
+
+	return texts;
+}
+
+/**
+ * Free the texts of formatted annotations which didn't get cached.
+ *
+ * @param di The decoder instance. Must not be NULL.
+ *
+ * @private
+ */
+SRD_PRIV void srd_inst_ann_format_release(struct srd_decoder_inst *di)
+{
+	if (di->ann_formats && di->ann_formats->uncached->len)
+		g_ptr_array_set_size(di->ann_formats->uncached, 0);
+}
 
 /**
  * Flush all data that is pending, bottom decoder first up to the top of the stack.
@@ -1282,8 +3032,11 @@ SRD_PRIV int srd_inst_flush(struct srd_decoder_inst *di)
 		py_ret = PyObject_CallMethod(di->py_inst, "flush", NULL);
 		Py_XDECREF(py_ret);
 	}
+	srd_inst_python_batch_deliver(di);
 	PyGILState_Release(gstate);
 
+	srd_inst_ann_batch_deliver(di);
+
 	/* Pass the "flush" request to all stacked decoders. */
 	for (l = di->next_di; l; l = l->next) {
 		ret = srd_inst_flush(l->data);
@@ -1322,10 +3075,23 @@ SRD_PRIV int srd_inst_send_eof(struct srd_decoder_inst *di)
 		return SRD_OK;
 	}
 
+	/* Decode the last, incomplete block of decimated input. */
+	if (di->decim_count && di->decim_state) {
+		inst_decimate_block(di, di->data_unitsize, di->decim_buf);
+		inst_decode_push(di, di->abs_cur_samplenum,
+			di->abs_cur_samplenum + 1, di->decim_buf,
+			di->data_unitsize, NULL, NULL, NULL);
+		if ((ret = srd_inst_decode_finish(di)) != SRD_OK)
+			return ret;
+	}
+
 	/* Signal the thread about the EOF condition. */
 	g_mutex_lock(&di->data_mutex);
 	di->inbuf = NULL;
 	di->inbuflen = 0;
+	di->transitions = NULL;
+	di->runs = NULL;
+	di->planes = NULL;
 	di->got_new_samples = TRUE;
 	di->handled_all_samples = FALSE;
 	di->want_wait_terminate = TRUE;
@@ -1389,6 +3155,7 @@ SRD_PRIV int srd_inst_terminate_reset(struct srd_decoder_inst *di)
 	 */
 	srd_dbg("Terminating instance %s", di->inst_id);
 	srd_inst_join_decode_thread(di);
+	srd_inst_ann_batch_deliver(di);
 	srd_inst_reset_state(di);
 
 	/*
@@ -1399,6 +3166,9 @@ SRD_PRIV int srd_inst_terminate_reset(struct srd_decoder_inst *di)
 	 * as it's not referenced any longer.
 	 */
 	gstate = PyGILState_Ensure();
+	/* Batched output which wasn't passed on yet gets dropped. */
+	Py_XDECREF(di->py_pending);
+	di->py_pending = NULL;
 	if (PyObject_HasAttrString(di->py_inst, "reset")) {
 		srd_dbg("Calling reset() of instance %s", di->inst_id);
 		py_ret = PyObject_CallMethod(di->py_inst, "reset", NULL);
@@ -1430,12 +3200,25 @@ SRD_PRIV void srd_inst_free(struct srd_decoder_inst *di)
 	srd_inst_reset_state(di);
 
 	gstate = PyGILState_Ensure();
+	((srd_Decoder *)di->py_inst)->di = NULL;
 	Py_DECREF(di->py_inst);
+	Py_XDECREF(di->py_decode);
+	Py_XDECREF(di->py_pending);
+	inst_ann_texts_free(di);
 	PyGILState_Release(gstate);
 
 	g_free(di->inst_id);
 	g_free(di->dec_channelmap);
 	g_free(di->channel_samples);
+	g_free(di->decim_buf);
+	g_free(di->plane_sample);
+	g_free(di->last_change);
+	inst_ann_batch_free(di);
+	inst_ann_formats_free(di);
+	if (di->disabled_ann_classes)
+		g_array_free(di->disabled_ann_classes, TRUE);
+	if (di->disabled_bin_classes)
+		g_array_free(di->disabled_bin_classes, TRUE);
 	g_slist_free(di->next_di);
 	for (l = di->pd_output; l; l = l->next) {
 		pdo = l->data;
@@ -21,10 +21,16 @@
 #ifndef LIBSIGROKDECODE_LIBSIGROKDECODE_INTERNAL_H
 #define LIBSIGROKDECODE_LIBSIGROKDECODE_INTERNAL_H
 
-/* Use the stable ABI subset as per PEP 384. */
+/*
+ * Use the stable ABI subset as per PEP 384. Free-threaded Python builds
+ * (PEP 703) don't support the limited API, they get the full API.
+ */
+#include <pyconfig.h> /* First, so we avoid a _POSIX_C_SOURCE warning. */
+#ifndef Py_GIL_DISABLED
 #define Py_LIMITED_API 0x03020000
+#endif
 
-#include <Python.h> /* First, so we avoid a _POSIX_C_SOURCE warning. */
+#include <Python.h>
 #include "libsigrokdecode.h"
 
 /*
@@ -47,17 +53,184 @@ enum {
 	SRD_TERM_EITHER_EDGE,
 	SRD_TERM_NO_EDGE,
 	SRD_TERM_SKIP,
+	SRD_TERM_PATTERN,
+	SRD_TERM_CHANGED,
+	SRD_TERM_MIN_WIDTH,
+	SRD_TERM_MAX_WIDTH,
+	SRD_TERM_STABLE,
 };
 
-struct srd_term {
-	int type;
-	int channel;
+/*
+ * Conditions get compiled into masks over the decoder's channels, bit N
+ * of the masks corresponds to the decoder's channel N. This limits the
+ * number of channels which conditions can refer to.
+ */
+#define SRD_MAX_CONDITION_CHANNELS 64
+
+/*
+ * A condition (one dict of terms in a .wait() call) in its compiled form.
+ * Level and edge terms turn into mask/value pairs, such that a sample
+ * matches the condition when
+ *   (pins & level_mask) == level_value
+ * and
+ *   ((pins ^ old_pins) & edge_mask) == edge_value
+ * hold. Rising and falling edges are expressed as a change of the pin in
+ * combination with the pin's new level. Pattern terms are level terms
+ * on several pins. Changed terms additionally require
+ *   ((pins ^ old_pins) & any_edge_mask) != 0
+ * when any_edge_mask is not zero. Width terms limit the number of samples
+ * since the previous change of the condition's pins (track_mask), or since
+ * the start of the decoding. The instance keeps track of these changes
+ * across .wait() calls and chunks.
+ */
+struct srd_condition {
+	/* The condition has no terms (empty dict). */
+	gboolean is_empty;
+	/* One of the terms never matches (invalid channel or skip count). */
+	gboolean always_false;
+	uint64_t level_mask;
+	uint64_t level_value;
+	uint64_t edge_mask;
+	uint64_t edge_value;
+	uint64_t any_edge_mask;
+	/* Width terms were specified when track_mask is not zero. */
+	uint64_t track_mask;
+	uint64_t last_change;
+	uint64_t min_width;
+	uint64_t max_width;
+	uint64_t stable_samples;
+	/* A 'skip' term was specified. */
+	gboolean has_skip;
 	uint64_t num_samples_to_skip;
 	uint64_t num_samples_already_skipped;
 };
 
+/*
+ * A .wait() argument which was seen before, and its compiled form. Saves
+ * decoders which pass the same conditions over and over again from having
+ * them parsed and compiled in each call.
+ */
+struct srd_condition_cache_entry {
+	/* Private copy of the .wait() argument (a dict or a list of dicts). */
+	PyObject *py_conds;
+	/* The compiled conditions (struct srd_condition). */
+	GArray *condition_list;
+};
+
+/*
+ * Index of the input channels' transitions within a chunk of samples.
+ * Gets built once per srd_session_send() call, and is shared by all
+ * decoder stacks of the session.
+ */
+struct srd_transition_index {
+	/* The number of samples in the chunk. */
+	uint64_t num_samples;
+	/* The number of input channels (unitsize * 8). */
+	unsigned int num_channels;
+	/*
+	 * Per input channel: sorted offsets (uint64_t, relative to the
+	 * chunk's start) of the samples which differ from their previous
+	 * sample. NULL for channels which no decoder uses.
+	 */
+	GArray **offsets;
+};
+
+/*
+ * A chunk of samples as runs of identical values, see srd_session_send_rle().
+ * Decoders step from run to run instead of from sample to sample.
+ */
+struct srd_run_list {
+	/* The runs' sample values (unitsize bytes each). */
+	const uint8_t *values;
+	/* The offset (relative to the chunk's start) after each run. */
+	uint64_t *ends;
+	uint64_t num_runs;
+};
+
+/*
+ * A chunk of samples as one bit plane per input channel, see
+ * srd_session_send_planar().
+ */
+struct srd_plane_set {
+	/*
+	 * Per input channel: the samples' bits, LSB first. NULL for
+	 * channels without data, which read as low.
+	 */
+	const uint8_t *const *planes;
+	unsigned int num_planes;
+};
+
+/*
+ * Annotations of a decoder instance which wait for batched delivery.
+ * The annotations' texts are kept in an arena, and their pointers only
+ * get filled in upon delivery.
+ */
+struct srd_ann_batch {
+	struct srd_proto_data *pdata;
+	struct srd_proto_data_annotation *pda;
+	/*
+	 * Per annotation: index of its first text in 'text', or
+	 * ANN_BATCH_INTERNED when its texts are interned or formatted.
+	 */
+	guint *text_index;
+	/* Per annotation: ANN_FORMAT_MAX_VALUES values of formatted ones. */
+	int64_t *values;
+	unsigned int count;
+	unsigned int size;
+	/* The annotations' texts, each list terminated by NULL. */
+	GPtrArray *text;
+	GStringChunk *arena;
+};
+
+#define ANN_BATCH_INTERNED G_MAXUINT
+
+/*
+ * Interned annotation texts of a decoder instance. Annotations with the
+ * same texts share one NULL terminated list of them.
+ */
+struct srd_ann_text_table {
+	/* The texts in UTF-8, keyed by (references to) the Python strings. */
+	GHashTable *strings;
+	/* The lists of texts, keyed by themselves. */
+	GHashTable *lists;
+	GStringChunk *arena;
+};
+
+/* The maximum number of values which a formatted annotation can take. */
+#define ANN_FORMAT_MAX_VALUES 4
+
+/* The values of a formatted annotation, unused values are zero. */
+struct srd_ann_values {
+	int64_t values[ANN_FORMAT_MAX_VALUES];
+};
+
+/*
+ * A decoder's text templates for formatted annotations, see the Python
+ * register_ann_format() method. Texts get rendered when they are needed,
+ * and are cached per distinct set of values.
+ */
+struct srd_ann_format {
+	/* The printf() style templates, NULL terminated. */
+	char **templates;
+	unsigned int num_values;
+	/* The rendered lists of texts, keyed by struct srd_ann_values. */
+	GHashTable *texts;
+};
+
+/* The formats of a decoder instance, and texts which didn't get cached. */
+struct srd_ann_format_table {
+	GPtrArray *formats;
+	GPtrArray *uncached;
+};
+
 /* Custom Python types: */
 
+typedef struct {
+	PyObject_HEAD
+	/* The decoder instance which this object belongs to. */
+	struct srd_decoder_inst *di;
+} srd_Decoder;
+
 typedef struct {
 	PyObject_HEAD
 	struct srd_decoder_inst *di;
@@ -76,6 +249,87 @@ struct srd_session {
 
 	/* List of frontend callbacks to receive decoder output. */
 	GSList *callbacks;
+
+	/*
+	 * Serializes the invocation of frontend callbacks, since decoder
+	 * stacks run concurrently in their respective worker threads.
+	 */
+	GMutex callback_mutex;
+
+	/* Chunks for asynchronous decoding (struct srd_session_chunk). */
+	GQueue *chunk_queue;
+	GMutex queue_mutex;
+	GCond queue_cond;
+	/* The thread which feeds queued chunks to the decoder stacks. */
+	GThread *queue_thread;
+	/* The maximum number of pending chunks. */
+	unsigned int queue_depth;
+	/* Block (or fail) when adding chunks to a full queue. */
+	gboolean queue_block;
+	/* The number of pending chunks, including the one being decoded. */
+	unsigned int queue_pending;
+	/* Requests termination of the queue thread. */
+	gboolean queue_stop;
+	/* The first error of asynchronous decoding. */
+	int queue_error;
+
+	/* The samplerate which was set by srd_session_metadata_set(). */
+	GVariant *samplerate;
+
+	/* Parameters of srd_session_send_sharded(). */
+	uint64_t shard_segment_size;
+	uint64_t shard_overlap;
+	unsigned int shard_threads;
+	/* Reports the segments' boundaries, see srd_session_stitch_callback_set(). */
+	srd_session_stitch_callback stitch_cb;
+	void *stitch_cb_data;
+
+	/* Input filters (struct srd_input_filter), see srd_session_filter_set(). */
+	GSList *filters;
+	/*
+	 * Raw samples which the filters hold back: the history which their
+	 * windows look back into, followed by the pending samples which were
+	 * not passed on to the decoders yet.
+	 */
+	uint8_t *filter_buf;
+	uint64_t filter_buf_size;
+	uint64_t filter_history;
+	uint64_t filter_pending;
+	/* Absolute sample number of the first pending sample. */
+	uint64_t filter_samplenum;
+	/* Unit size of the filtered stream, 0 when no stream was started. */
+	uint64_t filter_unitsize;
+	/* Filtered samples, which get passed on to the decoders. */
+	uint8_t *filter_out;
+	uint64_t filter_out_size;
+
+	/* Batched delivery of annotations, see srd_pd_annotation_batch_callback_set(). */
+	srd_pd_annotation_batch_callback ann_batch_cb;
+	void *ann_batch_cb_data;
+	unsigned int ann_batch_size;
+	/* Texts of formatted annotations are only rendered upon request. */
+	gboolean ann_text_lazy;
+};
+
+/* A filter for one input channel. */
+struct srd_input_filter {
+	unsigned int channel;
+	int filter_type;
+	uint64_t width;
+	/* Input and output level of the last filtered sample. */
+	int last_in;
+	int last_out;
+};
+
+/* A chunk of samples which is queued for asynchronous decoding. */
+struct srd_session_chunk {
+	uint64_t abs_start_samplenum;
+	uint64_t abs_end_samplenum;
+	const uint8_t *inbuf;
+	uint64_t inbuflen;
+	uint64_t unitsize;
+	srd_session_chunk_release_callback release_cb;
+	void *cb_data;
 };
 
 /* srd.c */
@@ -84,15 +338,55 @@ SRD_PRIV int srd_decoder_searchpath_add(const char *path);
 /* session.c */
 SRD_PRIV struct srd_pd_callback *srd_pd_output_callback_find(struct srd_session *sess,
 		int output_type);
+SRD_PRIV struct srd_transition_index *srd_transition_index_new(
+		const struct srd_session *sess, const uint8_t *inbuf,
+		uint64_t num_samples, uint64_t unitsize);
+SRD_PRIV uint64_t srd_transition_index_next(
+		const struct srd_transition_index *transitions,
+		unsigned int channel, uint64_t offset);
+SRD_PRIV void srd_transition_index_free(struct srd_transition_index *transitions);
+SRD_PRIV int srd_inst_send_meta(struct srd_decoder_inst *di, int key,
+		GVariant *data);
+SRD_PRIV uint64_t srd_run_list_find(const struct srd_run_list *runs,
+		uint64_t offset, uint64_t hint);
 
 /* instance.c */
 SRD_PRIV int srd_inst_start(struct srd_decoder_inst *di);
 SRD_PRIV void match_array_free(struct srd_decoder_inst *di);
 SRD_PRIV void condition_list_free(struct srd_decoder_inst *di);
+SRD_PRIV void condition_cache_entry_free(gpointer data);
+SRD_PRIV void condition_cache_free(struct srd_decoder_inst *di);
+SRD_PRIV struct srd_decoder_inst *srd_inst_clone(struct srd_session *sess,
+		struct srd_decoder_inst *di, GHashTable *inst_map);
+SRD_PRIV void srd_inst_seek(struct srd_decoder_inst *di,
+		uint64_t abs_samplenum, const uint8_t *prev_sample);
+SRD_PRIV int srd_inst_decode_start(struct srd_decoder_inst *di,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize,
+		const struct srd_transition_index *transitions,
+		const struct srd_run_list *runs, const struct srd_plane_set *planes);
+SRD_PRIV int srd_inst_decode_finish(struct srd_decoder_inst *di);
 SRD_PRIV int srd_inst_decode(struct srd_decoder_inst *di,
 		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
-		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize);
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize,
+		const struct srd_transition_index *transitions);
+SRD_PRIV void srd_inst_ann_batch_deliver(struct srd_decoder_inst *di);
+SRD_PRIV void srd_inst_python_batch_deliver(struct srd_decoder_inst *di);
+SRD_PRIV int srd_inst_ann_format_add(struct srd_decoder_inst *di,
+		char **templates);
+SRD_PRIV char **srd_inst_ann_format_text(struct srd_decoder_inst *di,
+		int format, const int64_t *values);
+SRD_PRIV void srd_inst_ann_format_release(struct srd_decoder_inst *di);
+SRD_PRIV gboolean srd_inst_class_enabled(const GArray *disabled_classes,
+		int class_idx);
+SRD_PRIV const uint8_t *srd_inst_sample_pos(struct srd_decoder_inst *di,
+		uint64_t offset);
 SRD_PRIV int process_samples_until_condition_match(struct srd_decoder_inst *di, gboolean *found_match);
+SRD_PRIV void srd_inst_condition_step(struct srd_decoder_inst *di);
+SRD_PRIV uint64_t srd_inst_last_change(struct srd_decoder_inst *di,
+		uint64_t channel_mask);
+SRD_PRIV int srd_inst_channel_edges(const struct srd_decoder_inst *di,
+		int channel, uint64_t abs_end_samplenum, GArray *edges);
 SRD_PRIV int srd_inst_flush(struct srd_decoder_inst *di);
 SRD_PRIV int srd_inst_send_eof(struct srd_decoder_inst *di);
 SRD_PRIV int srd_inst_terminate_reset(struct srd_decoder_inst *di);
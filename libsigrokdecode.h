@@ -29,6 +29,12 @@ extern "C" {
 #endif
 
 struct srd_session;
+struct srd_transition_index;
+struct srd_run_list;
+struct srd_plane_set;
+struct srd_ann_batch;
+struct srd_ann_text_table;
+struct srd_ann_format_table;
 
 /**
  * @file
@@ -72,6 +78,7 @@ enum srd_error_code {
 	SRD_ERR_PYTHON       = -5, /**< Python C API error */
 	SRD_ERR_DECODERS_DIR = -6, /**< Protocol decoder path invalid */
 	SRD_ERR_TERM_REQ     = -7, /**< Termination requested */
+	SRD_ERR_QUEUE_FULL   = -8, /**< Session's chunk queue is full */
 
 	/*
 	 * Note: When adding entries here, don't forget to also update the
@@ -214,6 +221,16 @@ enum srd_initial_pin {
 	SRD_INITIAL_PIN_SAME_AS_SAMPLE0,
 };
 
+/** Input filter types, see srd_session_filter_set(). */
+enum srd_filter_type {
+	/** No filter. */
+	SRD_FILTER_NONE,
+	/** Suppress pulses which are shorter than the filter's width. */
+	SRD_FILTER_MIN_WIDTH,
+	/** Majority vote over a window of the filter's width. */
+	SRD_FILTER_MAJORITY,
+};
+
 /**
  * Structure which contains information about one protocol decoder channel.
  * For example, I2C has two channels, SDA and SCL.
@@ -259,8 +276,11 @@ struct srd_decoder_inst {
 	uint8_t *channel_samples;
 	GSList *next_di;
 
-	/** List of conditions a PD wants to wait for. */
-	GSList *condition_list;
+	/** Array of (compiled) conditions a PD wants to wait for. */
+	GArray *condition_list;
+
+	/** Recently used .wait() arguments and their compiled conditions. */
+	GSList *condition_cache;
 
 	/** Array of booleans denoting which conditions matched. */
 	GArray *match_array;
@@ -280,9 +300,70 @@ struct srd_decoder_inst {
 	/** Absolute current samplenumber. */
 	uint64_t abs_cur_samplenum;
 
+	/** Transition index of the current chunk (shared within the session), or NULL. */
+	const struct srd_transition_index *transitions;
+
+	/** Runs of the current chunk, if it's run-length encoded, or NULL. */
+	const struct srd_run_list *runs;
+
+	/** Index of the run which was looked up last. */
+	uint64_t run_cursor;
+
+	/** Bit planes of the current chunk, if it's channel-major, or NULL. */
+	const struct srd_plane_set *planes;
+
+	/** A sample which was assembled from the bit planes. */
+	uint8_t *plane_sample;
+
+	/** Annotations which wait for batched delivery, or NULL. */
+	struct srd_ann_batch *ann_batch;
+
+	/** Interned annotation texts, or NULL. */
+	struct srd_ann_text_table *ann_texts;
+
+	/** Text formats of annotations, or NULL. */
+	struct srd_ann_format_table *ann_formats;
+
+	/** The method which takes input from the instance below, or NULL. */
+	void *py_decode;
+
+	/** Whether py_decode takes lists of (ss, es, data) tuples. */
+	gboolean decode_batched;
+
+	/** Python output which waits for batched delivery, or NULL. */
+	void *py_pending;
+
+	/** Output types which were disabled, one bit (1 << type) each. */
+	unsigned int disabled_outputs;
+
+	/** Per annotation class: disabled or not. NULL while all are enabled. */
+	GArray *disabled_ann_classes;
+
+	/** Per binary class: disabled or not. NULL while all are enabled. */
+	GArray *disabled_bin_classes;
+
+	/** Decimation factor of the decoder stack, 1 when not decimating. */
+	uint64_t decimation;
+
+	/** Decimated samples, which the bottom instance decodes instead of the input. */
+	uint8_t *decim_buf;
+	uint64_t decim_buf_size;
+
+	/** AND and OR of the current block's samples, and the previous decimated sample. */
+	uint8_t *decim_state;
+
+	/** The number of input samples in the current block. */
+	uint64_t decim_count;
+
 	/** Array of "old" (previous sample) pin values. */
 	GArray *old_pins_array;
 
+	/** Channels whose changes are tracked for width terms, one bit each. */
+	uint64_t width_channels;
+
+	/** Per channel: the sample number of its last change, or NULL. */
+	uint64_t *last_change;
+
 	/** Handle for this PD stack's worker thread. */
 	GThread *thread_handle;
 
@@ -325,7 +406,18 @@ struct srd_proto_data {
 };
 struct srd_proto_data_annotation {
 	int ann_class; /* Index into "struct srd_decoder"->annotations. */
+	/*
+	 * Owned by libsigrokdecode. Recurring texts of an instance are
+	 * interned, they keep their address until the instance is freed.
+	 * NULL for formatted annotations when the session renders their
+	 * texts lazily, see srd_annotation_text_get().
+	 */
 	char **ann_text;
+	/* The decoder instance's text format, or -1 for plain texts. */
+	int ann_format;
+	/* The values which the text format gets applied to. */
+	unsigned int num_ann_values;
+	const int64_t *ann_values;
 };
 struct srd_proto_data_binary {
 	int bin_class; /* Index into "struct srd_decoder"->binary. */
@@ -347,6 +439,15 @@ struct srd_pd_callback {
 	void *cb_data;
 };
 
+typedef void (*srd_session_chunk_release_callback)(const uint8_t *inbuf,
+					void *cb_data);
+
+typedef void (*srd_pd_annotation_batch_callback)(struct srd_proto_data *pdata,
+					unsigned int num_pdata, void *cb_data);
+
+typedef void (*srd_session_stitch_callback)(uint64_t samplenum,
+					uint64_t decode_start, void *cb_data);
+
 /* srd.c */
 SRD_API int srd_init(const char *path);
 SRD_API int srd_exit(void);
@@ -360,11 +461,42 @@ SRD_API int srd_session_metadata_set(struct srd_session *sess, int key,
 SRD_API int srd_session_send(struct srd_session *sess,
 		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
 		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize);
+SRD_API int srd_session_send_rle(struct srd_session *sess,
+		uint64_t abs_start_samplenum, const uint8_t *values,
+		const uint64_t *run_lengths, uint64_t num_runs, uint64_t unitsize);
+SRD_API int srd_session_send_planar(struct srd_session *sess,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint8_t *const *planes, unsigned int num_planes);
+SRD_API int srd_session_send_file(struct srd_session *sess,
+		const char *filename, uint64_t offset, uint64_t unitsize);
+SRD_API int srd_session_send_fd(struct srd_session *sess, int fd,
+		uint64_t offset, uint64_t unitsize);
+SRD_API int srd_session_queue_depth_set(struct srd_session *sess,
+		unsigned int depth, gboolean block_when_full);
+SRD_API int srd_session_send_async(struct srd_session *sess,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize,
+		srd_session_chunk_release_callback release_cb, void *cb_data);
+SRD_API int srd_session_send_wait(struct srd_session *sess);
+SRD_API int srd_session_shard_options_set(struct srd_session *sess,
+		uint64_t segment_size, uint64_t overlap, unsigned int num_threads);
+SRD_API int srd_session_stitch_callback_set(struct srd_session *sess,
+		srd_session_stitch_callback cb, void *cb_data);
+SRD_API int srd_session_filter_set(struct srd_session *sess,
+		unsigned int channel, int filter_type, uint64_t width);
+SRD_API int srd_session_send_sharded(struct srd_session *sess,
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize);
 SRD_API int srd_session_send_eof(struct srd_session *sess);
 SRD_API int srd_session_terminate_reset(struct srd_session *sess);
 SRD_API int srd_session_destroy(struct srd_session *sess);
 SRD_API int srd_pd_output_callback_add(struct srd_session *sess,
 		int output_type, srd_pd_output_callback cb, void *cb_data);
+SRD_API int srd_pd_annotation_batch_callback_set(struct srd_session *sess,
+		srd_pd_annotation_batch_callback cb, void *cb_data,
+		unsigned int batch_size);
+SRD_API int srd_session_lazy_ann_text_set(struct srd_session *sess,
+		gboolean lazy);
+SRD_API char **srd_annotation_text_get(struct srd_proto_data *pdata);
 
 /* decoder.c */
 SRD_API const GSList *srd_decoder_list(void);
@@ -388,6 +520,16 @@ SRD_API struct srd_decoder_inst *srd_inst_find_by_id(struct srd_session *sess,
 		const char *inst_id);
 SRD_API int srd_inst_initial_pins_set_all(struct srd_decoder_inst *di,
 		GArray *initial_pins);
+SRD_API int srd_inst_decimation_set(struct srd_decoder_inst *di,
+		uint64_t factor);
+SRD_API int srd_inst_output_type_enable(struct srd_decoder_inst *di,
+		int output_type, gboolean enable);
+SRD_API int srd_inst_ann_class_enable(struct srd_decoder_inst *di,
+		int ann_class, gboolean enable);
+SRD_API int srd_inst_ann_row_enable(struct srd_decoder_inst *di,
+		int ann_row, gboolean enable);
+SRD_API int srd_inst_binary_class_enable(struct srd_decoder_inst *di,
+		int bin_class, gboolean enable);
 
 /* log.c */
 typedef int (*srd_log_callback)(void *cb_data, int loglevel,
@@ -50,6 +50,16 @@ PyMODINIT_FUNC PyInit_sigrokdecode(void)
 	if (!mod)
 		goto err_out;
 
+#ifdef Py_GIL_DISABLED
+	/*
+	 * Decoder stacks don't depend on the GIL for their C side state,
+	 * which only their respective worker thread accesses. Keep the GIL
+	 * disabled such that the stacks run concurrently.
+	 */
+	if (PyUnstable_Module_SetGIL(mod, Py_MOD_GIL_NOT_USED) < 0)
+		goto err_out;
+#endif
+
 	Decoder_type = srd_Decoder_type_new();
 	if (!Decoder_type)
 		goto err_out;
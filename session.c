@@ -23,6 +23,11 @@
 #include "libsigrokdecode.h"
 #include <inttypes.h>
 #include <glib.h>
+#include <string.h>
+#ifdef HAVE_POSIX_MADVISE
+#include <sys/mman.h>
+#include <unistd.h>
+#endif
 
 /**
  * @file
@@ -45,6 +50,28 @@ SRD_PRIV int max_session_id = -1;
 
 /** @endcond */
 
+/* Default number of pending chunks for srd_session_send_async(). */
+#define DEFAULT_QUEUE_DEPTH 4
+
+/* Default segment size and overlap (in samples) for srd_session_send_sharded(). */
+#define DEFAULT_SHARD_SEGMENT_SIZE (64 * 1024 * 1024)
+#define DEFAULT_SHARD_OVERLAP (1024 * 1024)
+
+/* Number of samples which get filtered at once, for srd_session_send_sharded(). */
+#define FILTER_CAPTURE_CHUNK (1024 * 1024)
+
+/*
+ * Chunk size for decoding mapped capture files. All decoder stacks read
+ * the same chunk, which should stay in the shared cache until the last
+ * of them is done with it. Chunks have a minimum number of samples though,
+ * so the worker threads' hand-off doesn't dominate for wide samples.
+ */
+#define FILE_CHUNK_SIZE (2 * 1024 * 1024)
+#define FILE_CHUNK_MIN_SAMPLES (64 * 1024)
+
+/* The default number of annotations per batch. */
+#define DEFAULT_ANN_BATCH_SIZE 4096
+
 /**
  * Create a decoding session.
  *
@@ -66,6 +93,31 @@ SRD_API int srd_session_new(struct srd_session **sess)
 	*sess = g_malloc(sizeof(struct srd_session));
 	(*sess)->session_id = ++max_session_id;
 	(*sess)->di_list = (*sess)->callbacks = NULL;
+	g_mutex_init(&(*sess)->callback_mutex);
+	(*sess)->chunk_queue = g_queue_new();
+	g_mutex_init(&(*sess)->queue_mutex);
+	g_cond_init(&(*sess)->queue_cond);
+	(*sess)->queue_thread = NULL;
+	(*sess)->queue_depth = DEFAULT_QUEUE_DEPTH;
+	(*sess)->queue_block = TRUE;
+	(*sess)->queue_pending = 0;
+	(*sess)->queue_stop = FALSE;
+	(*sess)->queue_error = SRD_OK;
+	(*sess)->samplerate = NULL;
+	(*sess)->shard_segment_size = DEFAULT_SHARD_SEGMENT_SIZE;
+	(*sess)->shard_overlap = DEFAULT_SHARD_OVERLAP;
+	(*sess)->shard_threads = g_get_num_processors();
+	(*sess)->stitch_cb = NULL;
+	(*sess)->stitch_cb_data = NULL;
+	(*sess)->filters = NULL;
+	(*sess)->filter_buf = (*sess)->filter_out = NULL;
+	(*sess)->filter_buf_size = (*sess)->filter_out_size = 0;
+	(*sess)->filter_history = (*sess)->filter_pending = 0;
+	(*sess)->filter_samplenum = (*sess)->filter_unitsize = 0;
+	(*sess)->ann_batch_cb = NULL;
+	(*sess)->ann_batch_cb_data = NULL;
+	(*sess)->ann_batch_size = DEFAULT_ANN_BATCH_SIZE;
+	(*sess)->ann_text_lazy = FALSE;
 
 	/* Keep a list of all sessions, so we can clean up as needed. */
 	sessions = g_slist_append(sessions, *sess);
@@ -109,7 +161,8 @@ SRD_API int srd_session_start(struct srd_session *sess)
 	return ret;
 }
 
-static int srd_inst_send_meta(struct srd_decoder_inst *di, int key,
+/** @private */
+SRD_PRIV int srd_inst_send_meta(struct srd_decoder_inst *di, int key,
 		GVariant *data)
 {
 	PyObject *py_ret;
@@ -125,9 +178,10 @@ static int srd_inst_send_meta(struct srd_decoder_inst *di, int key,
 	gstate = PyGILState_Ensure();
 
 	if (PyObject_HasAttrString(di->py_inst, "metadata")) {
+		/* Decimating stacks see a lower samplerate. */
 		py_ret = PyObject_CallMethod(di->py_inst, "metadata", "lK",
 				(long)SRD_CONF_SAMPLERATE,
-				(unsigned long long)g_variant_get_uint64(data));
+				(unsigned long long)(g_variant_get_uint64(data) / di->decimation));
 		Py_XDECREF(py_ret);
 	}
 
@@ -196,11 +250,734 @@ SRD_API int srd_session_metadata_set(struct srd_session *sess, int key,
 			break;
 	}
 
+	/* Keep the value for copies of the session's decoder stacks. */
+	if (sess->samplerate)
+		g_variant_unref(sess->samplerate);
+	sess->samplerate = g_variant_ref(data);
+
 	g_variant_unref(data);
 
 	return ret;
 }
 
+/* Record the changes of the indexed channels from one sample to the next. */
+static void transition_index_add_sample(struct srd_transition_index *transitions,
+		const uint8_t *byte_mask, const uint64_t *byte_offsets,
+		uint64_t num_byte_offsets, const uint8_t *sample_pos,
+		uint64_t unitsize, uint64_t offset)
+{
+	uint64_t i;
+	uint8_t changed;
+	unsigned int channel;
+	int bit;
+
+	for (i = 0; i < num_byte_offsets; i++) {
+		changed = sample_pos[byte_offsets[i] - unitsize] ^ sample_pos[byte_offsets[i]];
+		changed &= byte_mask[byte_offsets[i]];
+		while (changed) {
+			bit = g_bit_nth_lsf(changed, -1);
+			changed &= ~(1 << bit);
+			channel = byte_offsets[i] * 8 + bit;
+			g_array_append_val(transitions->offsets[channel], offset);
+		}
+	}
+}
+
+/**
+ * Build the index of input channel transitions for a chunk of samples.
+ *
+ * Only the input channels which are assigned to the session's decoder
+ * stacks get indexed. The index is shared by all stacks, such that the
+ * chunk's samples get inspected only once, instead of once per stack.
+ *
+ * @param sess The session. Must not be NULL.
+ * @param inbuf Pointer to sample data. Must not be NULL.
+ * @param num_samples The number of samples in the chunk.
+ * @param unitsize The number of bytes per sample. Must be > 0.
+ *
+ * @return The newly allocated index.
+ *
+ * @private
+ */
+SRD_PRIV struct srd_transition_index *srd_transition_index_new(
+		const struct srd_session *sess, const uint8_t *inbuf,
+		uint64_t num_samples, uint64_t unitsize)
+{
+	struct srd_transition_index *transitions;
+	struct srd_decoder_inst *di;
+	uint8_t *byte_mask, raw_mask[sizeof(uint64_t)];
+	uint64_t *byte_offsets, num_byte_offsets, i, k, j;
+	uint64_t samples_per_word, word_mask, prev_word, word;
+	unsigned int channel;
+	GSList *l;
+	int ch;
+
+	transitions = g_malloc0(sizeof(*transitions));
+	transitions->num_samples = num_samples;
+	transitions->num_channels = unitsize * 8;
+	transitions->offsets = g_malloc0(sizeof(GArray *) * transitions->num_channels);
+
+	/* Determine the input channels which the decoders use. */
+	byte_mask = g_malloc0(unitsize);
+	for (l = sess->di_list; l; l = l->next) {
+		di = l->data;
+		for (ch = 0; ch < di->dec_num_channels; ch++) {
+			if (!di->dec_channelmap || di->dec_channelmap[ch] < 0)
+				continue;
+			channel = di->dec_channelmap[ch];
+			if (channel >= transitions->num_channels)
+				continue;
+			if (!transitions->offsets[channel])
+				transitions->offsets[channel] = g_array_new(FALSE, FALSE, sizeof(uint64_t));
+			byte_mask[channel / 8] |= 1 << (channel % 8);
+		}
+	}
+	byte_offsets = g_malloc(sizeof(uint64_t) * unitsize);
+	num_byte_offsets = 0;
+	for (i = 0; i < unitsize; i++) {
+		if (byte_mask[i])
+			byte_offsets[num_byte_offsets++] = i;
+	}
+
+	/*
+	 * Record the samples where the channels change. For the common
+	 * unit sizes, compare a machine word of samples against the word
+	 * one sample earlier, to skip over unchanged samples quickly.
+	 */
+	k = 1;
+	if (unitsize <= sizeof(uint64_t) && sizeof(uint64_t) % unitsize == 0) {
+		samples_per_word = sizeof(uint64_t) / unitsize;
+		for (i = 0; i < sizeof(raw_mask); i++)
+			raw_mask[i] = byte_mask[i % unitsize];
+		memcpy(&word_mask, raw_mask, sizeof(word_mask));
+		while (k + samples_per_word <= num_samples) {
+			memcpy(&prev_word, inbuf + (k - 1) * unitsize, sizeof(prev_word));
+			memcpy(&word, inbuf + k * unitsize, sizeof(word));
+			if ((prev_word ^ word) & word_mask) {
+				for (j = k; j < k + samples_per_word; j++) {
+					transition_index_add_sample(transitions, byte_mask,
+						byte_offsets, num_byte_offsets,
+						inbuf + j * unitsize, unitsize, j);
+				}
+			}
+			k += samples_per_word;
+		}
+	}
+	for (; k < num_samples; k++) {
+		transition_index_add_sample(transitions, byte_mask, byte_offsets,
+			num_byte_offsets, inbuf + k * unitsize, unitsize, k);
+	}
+
+	g_free(byte_offsets);
+	g_free(byte_mask);
+
+	return transitions;
+}
+
+/**
+ * Look up the next transition of an input channel.
+ *
+ * @param transitions The transition index. Must not be NULL.
+ * @param channel The input channel.
+ * @param offset The sample offset within the chunk to start searching at.
+ *
+ * @return The offset of the first sample at or after the given offset
+ *         where the channel changes, or the chunk's number of samples if
+ *         the channel doesn't change anymore. Channels which are not in
+ *         the index are assumed to change immediately.
+ *
+ * @private
+ */
+SRD_PRIV uint64_t srd_transition_index_next(
+		const struct srd_transition_index *transitions,
+		unsigned int channel, uint64_t offset)
+{
+	const GArray *offsets;
+	guint lo, hi, mid;
+
+	if (channel >= transitions->num_channels)
+		return offset;
+	offsets = transitions->offsets[channel];
+	if (!offsets)
+		return offset;
+
+	/* Binary search for the first transition at or after the offset. */
+	lo = 0;
+	hi = offsets->len;
+	while (lo < hi) {
+		mid = lo + (hi - lo) / 2;
+		if (g_array_index(offsets, uint64_t, mid) < offset)
+			lo = mid + 1;
+		else
+			hi = mid;
+	}
+	if (lo == offsets->len)
+		return transitions->num_samples;
+
+	return g_array_index(offsets, uint64_t, lo);
+}
+
+/** @private */
+SRD_PRIV void srd_transition_index_free(struct srd_transition_index *transitions)
+{
+	unsigned int i;
+
+	if (!transitions)
+		return;
+
+	for (i = 0; i < transitions->num_channels; i++) {
+		if (transitions->offsets[i])
+			g_array_free(transitions->offsets[i], TRUE);
+	}
+	g_free(transitions->offsets);
+	g_free(transitions);
+}
+
+/**
+ * Find the run which holds a sample.
+ *
+ * @param runs The runs of a chunk. Must not be NULL.
+ * @param offset The sample's offset within the chunk. Must be within the
+ *               chunk.
+ * @param hint The index of a run at or before the sample's run, e.g. the
+ *             result of a previous lookup. Runs get searched from there
+ *             when they are close, otherwise by bisection.
+ *
+ * @return The index of the sample's run.
+ *
+ * @private
+ */
+SRD_PRIV uint64_t srd_run_list_find(const struct srd_run_list *runs,
+		uint64_t offset, uint64_t hint)
+{
+	uint64_t lo, hi, mid;
+
+	/* Most lookups are for the same or the next run. */
+	if (hint < runs->num_runs && (!hint || runs->ends[hint - 1] <= offset)) {
+		if (offset < runs->ends[hint])
+			return hint;
+		if (hint + 1 < runs->num_runs && offset < runs->ends[hint + 1])
+			return hint + 1;
+		lo = hint + 1;
+	} else {
+		lo = 0;
+	}
+
+	hi = runs->num_runs - 1;
+	while (lo < hi) {
+		mid = lo + (hi - lo) / 2;
+		if (runs->ends[mid] <= offset)
+			lo = mid + 1;
+		else
+			hi = mid;
+	}
+
+	return lo;
+}
+
+/* Feed a chunk of samples to all decoder stacks of a session. */
+static int session_dispatch_chunk(struct srd_session *sess,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize,
+		const struct srd_run_list *runs, const struct srd_plane_set *planes)
+{
+	struct srd_transition_index *transitions;
+	GSList *d, *l;
+	int ret, ret_finish;
+
+	/*
+	 * With several decoder stacks on the same input, find the input
+	 * channels' transitions once for all of them. Run-length encoded
+	 * and channel-major input needs no index.
+	 */
+	transitions = NULL;
+	if (sess->di_list && sess->di_list->next && inbuf && unitsize && !runs)
+		transitions = srd_transition_index_new(sess, inbuf,
+			inbuflen / unitsize, unitsize);
+
+	/*
+	 * Hand the chunk to all decoder stacks first, then wait for all
+	 * of them. This lets the stacks' worker threads run concurrently.
+	 */
+	ret = SRD_OK;
+	for (d = sess->di_list; d; d = d->next) {
+		if ((ret = srd_inst_decode_start(d->data, abs_start_samplenum,
+				abs_end_samplenum, inbuf, inbuflen, unitsize,
+				transitions, runs, planes)) != SRD_OK)
+			break;
+	}
+	for (l = sess->di_list; l != d; l = l->next) {
+		if ((ret_finish = srd_inst_decode_finish(l->data)) != SRD_OK && ret == SRD_OK)
+			ret = ret_finish;
+	}
+
+	srd_transition_index_free(transitions);
+
+	return ret;
+}
+
+/* The number of samples which the session's filters look back and ahead. */
+static void filter_window(const struct srd_session *sess,
+		uint64_t *history, uint64_t *lookahead)
+{
+	const struct srd_input_filter *f;
+	GSList *l;
+
+	*history = *lookahead = 0;
+	for (l = sess->filters; l; l = l->next) {
+		f = l->data;
+		switch (f->filter_type) {
+		case SRD_FILTER_MIN_WIDTH:
+			*lookahead = MAX(*lookahead, f->width - 1);
+			break;
+		case SRD_FILTER_MAJORITY:
+			*history = MAX(*history, f->width / 2);
+			*lookahead = MAX(*lookahead, f->width / 2);
+			break;
+		}
+	}
+}
+
+static inline int filter_level(const uint8_t *in, uint64_t idx,
+		uint64_t unitsize, uint8_t mask)
+{
+	return (in[idx * unitsize] & mask) ? 1 : 0;
+}
+
+/*
+ * Filter one channel of the samples buf[first] to buf[first + count - 1].
+ * The filter's history and lookahead around these samples must be present
+ * in buf. Output levels which differ from the input get flipped in out,
+ * which holds a copy of the input samples.
+ */
+static void filter_apply(struct srd_input_filter *f, const uint8_t *buf,
+		uint64_t first, uint64_t count, uint64_t unitsize, uint8_t *out)
+{
+	const uint8_t *in;
+	uint64_t byte, i, k, half, ones;
+	uint8_t mask;
+	int level;
+
+	byte = f->channel / 8;
+	mask = 1 << (f->channel % 8);
+	if (byte >= unitsize)
+		return;
+	in = buf + byte;
+	out += byte;
+
+	switch (f->filter_type) {
+	case SRD_FILTER_MIN_WIDTH:
+		for (i = first; i < first + count; i++) {
+			level = filter_level(in, i, unitsize, mask);
+			if (level != f->last_in) {
+				/* A pulse starts, it's a glitch if it's too short. */
+				for (k = 1; k < f->width; k++) {
+					if (filter_level(in, i + k, unitsize, mask) != level)
+						break;
+				}
+				f->last_in = level;
+				if (k == f->width)
+					f->last_out = level;
+			}
+			if (level != f->last_out)
+				out[(i - first) * unitsize] ^= mask;
+		}
+		break;
+	case SRD_FILTER_MAJORITY:
+		half = f->width / 2;
+		ones = 0;
+		for (k = first - half; k <= first + half; k++)
+			ones += filter_level(in, k, unitsize, mask);
+		for (i = first; i < first + count; i++) {
+			if (i > first) {
+				ones += filter_level(in, i + half, unitsize, mask);
+				ones -= filter_level(in, i - half - 1, unitsize, mask);
+			}
+			level = ones > half;
+			if (level != filter_level(in, i, unitsize, mask))
+				out[(i - first) * unitsize] ^= mask;
+		}
+		break;
+	}
+}
+
+static void filter_buf_reserve(uint8_t **buf, uint64_t *size, uint64_t needed)
+{
+	if (*size >= needed)
+		return;
+	*size = MAX(needed, *size * 2);
+	*buf = g_realloc(*buf, *size);
+}
+
+/* Forget about the filtered stream, e.g. after the end of the input. */
+static void session_filter_reset(struct srd_session *sess)
+{
+	sess->filter_history = sess->filter_pending = 0;
+	sess->filter_samplenum = sess->filter_unitsize = 0;
+}
+
+/*
+ * Run a chunk of samples through the session's input filters. Samples
+ * are held back until the filters' lookahead is available. Passing eof
+ * (without samples) flushes the held back samples, assuming that the
+ * last sample's levels continue.
+ *
+ * Upon return, sess->filter_out holds *num_samples filtered samples,
+ * starting at the absolute sample number *samplenum.
+ */
+static int session_filter_run(struct srd_session *sess,
+		uint64_t abs_start_samplenum, const uint8_t *inbuf,
+		uint64_t num_samples, uint64_t unitsize, gboolean eof,
+		uint64_t *samplenum, uint64_t *out_samples)
+{
+	struct srd_input_filter *f;
+	uint64_t history, lookahead, total, count, i;
+	GSList *l;
+
+	*out_samples = 0;
+	filter_window(sess, &history, &lookahead);
+
+	if (eof) {
+		if (!sess->filter_unitsize || !sess->filter_pending)
+			return SRD_OK;
+		unitsize = sess->filter_unitsize;
+		total = history + sess->filter_pending + lookahead;
+		filter_buf_reserve(&sess->filter_buf, &sess->filter_buf_size,
+			total * unitsize);
+		for (i = total - lookahead; i < total; i++) {
+			memcpy(sess->filter_buf + i * unitsize,
+				sess->filter_buf + (total - lookahead - 1) * unitsize,
+				unitsize);
+		}
+	} else {
+		if (!num_samples)
+			return SRD_OK;
+		if (!sess->filter_unitsize) {
+			/* Assume the first sample's levels before the stream. */
+			filter_buf_reserve(&sess->filter_buf, &sess->filter_buf_size,
+				history * unitsize);
+			for (i = 0; i < history; i++)
+				memcpy(sess->filter_buf + i * unitsize, inbuf, unitsize);
+			for (l = sess->filters; l; l = l->next) {
+				f = l->data;
+				f->last_in = f->last_out = (f->channel / 8 < unitsize) ?
+					filter_level(inbuf + f->channel / 8, 0,
+						unitsize, 1 << (f->channel % 8)) : 0;
+			}
+			sess->filter_unitsize = unitsize;
+			sess->filter_history = history;
+			sess->filter_pending = 0;
+			sess->filter_samplenum = abs_start_samplenum;
+		} else if (unitsize != sess->filter_unitsize) {
+			srd_err("Unit size changed from %" PRIu64 " to %" PRIu64
+				" within the filtered stream.",
+				sess->filter_unitsize, unitsize);
+			return SRD_ERR_ARG;
+		}
+		total = history + sess->filter_pending + num_samples;
+		filter_buf_reserve(&sess->filter_buf, &sess->filter_buf_size,
+			total * unitsize);
+		memcpy(sess->filter_buf + (history + sess->filter_pending) * unitsize,
+			inbuf, num_samples * unitsize);
+	}
+
+	/* Wait for more samples, until the lookahead is available. */
+	if (total - history <= lookahead) {
+		sess->filter_pending = total - history;
+		return SRD_OK;
+	}
+	count = total - history - lookahead;
+
+	filter_buf_reserve(&sess->filter_out, &sess->filter_out_size,
+		count * unitsize);
+	memcpy(sess->filter_out, sess->filter_buf + history * unitsize,
+		count * unitsize);
+	for (l = sess->filters; l; l = l->next)
+		filter_apply(l->data, sess->filter_buf, history, count, unitsize,
+			sess->filter_out);
+
+	*samplenum = sess->filter_samplenum;
+	*out_samples = count;
+
+	/* Keep the history and the lookahead for the next chunk. */
+	memmove(sess->filter_buf, sess->filter_buf + count * unitsize,
+		(history + lookahead) * unitsize);
+	sess->filter_pending = lookahead;
+	sess->filter_samplenum += count;
+
+	return SRD_OK;
+}
+
+/*
+ * Feed a chunk of samples to all decoder stacks of a session, after
+ * running it through the session's input filters.
+ */
+static int session_decode_chunk(struct srd_session *sess,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize)
+{
+	uint64_t samplenum, num_samples;
+	int ret;
+
+	if (!sess->filters || !inbuf || !unitsize) {
+		return session_dispatch_chunk(sess, abs_start_samplenum,
+			abs_end_samplenum, inbuf, inbuflen, unitsize, NULL, NULL);
+	}
+
+	ret = session_filter_run(sess, abs_start_samplenum, inbuf,
+		inbuflen / unitsize, unitsize, FALSE, &samplenum, &num_samples);
+	if (ret != SRD_OK || !num_samples)
+		return ret;
+
+	return session_dispatch_chunk(sess, samplenum, samplenum + num_samples,
+		sess->filter_out, num_samples * unitsize, unitsize, NULL, NULL);
+}
+
+/* Filter a complete capture into a newly allocated buffer. */
+static int session_filter_capture(struct srd_session *sess,
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize,
+		uint8_t **filtered)
+{
+	uint64_t num_samples, pos, len, samplenum, count;
+	int ret;
+
+	num_samples = inbuflen / unitsize;
+	*filtered = g_malloc(num_samples * unitsize);
+	session_filter_reset(sess);
+	ret = SRD_OK;
+	for (pos = 0; pos <= num_samples && ret == SRD_OK; pos += len) {
+		len = MIN(FILTER_CAPTURE_CHUNK, num_samples - pos);
+		ret = session_filter_run(sess, pos, inbuf + pos * unitsize, len,
+			unitsize, len == 0, &samplenum, &count);
+		if (ret == SRD_OK && count) {
+			memcpy(*filtered + samplenum * unitsize, sess->filter_out,
+				count * unitsize);
+		}
+		if (!len)
+			break;
+	}
+	session_filter_reset(sess);
+	if (ret != SRD_OK) {
+		g_free(*filtered);
+		*filtered = NULL;
+	}
+
+	return ret;
+}
+
+/* Feed queued chunks to the decoder stacks, in the order of their arrival. */
+static gpointer session_queue_thread(gpointer data)
+{
+	struct srd_session *sess;
+	struct srd_session_chunk *chunk;
+	int ret;
+
+	sess = data;
+
+	g_mutex_lock(&sess->queue_mutex);
+	while (TRUE) {
+		while (g_queue_is_empty(sess->chunk_queue) && !sess->queue_stop)
+			g_cond_wait(&sess->queue_cond, &sess->queue_mutex);
+		if (g_queue_is_empty(sess->chunk_queue))
+			break;
+		chunk = g_queue_pop_head(sess->chunk_queue);
+
+		/* Don't feed more data to stacks after an error. */
+		ret = sess->queue_error;
+		g_mutex_unlock(&sess->queue_mutex);
+
+		if (ret == SRD_OK) {
+			ret = session_decode_chunk(sess, chunk->abs_start_samplenum,
+				chunk->abs_end_samplenum, chunk->inbuf,
+				chunk->inbuflen, chunk->unitsize);
+		}
+		if (chunk->release_cb)
+			chunk->release_cb(chunk->inbuf, chunk->cb_data);
+		g_free(chunk);
+
+		g_mutex_lock(&sess->queue_mutex);
+		if (ret != SRD_OK && sess->queue_error == SRD_OK)
+			sess->queue_error = ret;
+		sess->queue_pending--;
+		g_cond_broadcast(&sess->queue_cond);
+	}
+	g_mutex_unlock(&sess->queue_mutex);
+
+	return NULL;
+}
+
+/* Wait until all queued chunks were decoded. */
+static void session_queue_wait_idle(struct srd_session *sess)
+{
+	g_mutex_lock(&sess->queue_mutex);
+	while (sess->queue_pending)
+		g_cond_wait(&sess->queue_cond, &sess->queue_mutex);
+	g_mutex_unlock(&sess->queue_mutex);
+}
+
+/* Drop queued chunks which were not handed to the decoders yet. */
+static void session_queue_discard(struct srd_session *sess)
+{
+	struct srd_session_chunk *chunk;
+
+	g_mutex_lock(&sess->queue_mutex);
+	while ((chunk = g_queue_pop_head(sess->chunk_queue))) {
+		if (chunk->release_cb)
+			chunk->release_cb(chunk->inbuf, chunk->cb_data);
+		g_free(chunk);
+		sess->queue_pending--;
+	}
+	g_cond_broadcast(&sess->queue_cond);
+	g_mutex_unlock(&sess->queue_mutex);
+}
+
+/**
+ * Set the size of a session's queue for asynchronous decoding.
+ *
+ * @param sess The session. Must not be NULL.
+ * @param depth The maximum number of chunks which are queued (including
+ *              the chunk which is being decoded). Must be > 0.
+ * @param block_when_full When TRUE, srd_session_send_async() waits for
+ *                        the decoders to make room in a full queue.
+ *                        When FALSE, it returns SRD_ERR_QUEUE_FULL.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_queue_depth_set(struct srd_session *sess,
+		unsigned int depth, gboolean block_when_full)
+{
+	if (!sess || depth == 0)
+		return SRD_ERR_ARG;
+
+	g_mutex_lock(&sess->queue_mutex);
+	sess->queue_depth = depth;
+	sess->queue_block = block_when_full;
+	g_cond_broadcast(&sess->queue_cond);
+	g_mutex_unlock(&sess->queue_mutex);
+
+	return SRD_OK;
+}
+
+/**
+ * Queue a chunk of logic sample data for decoding, without waiting for
+ * the decoders to process it.
+ *
+ * The same rules as for srd_session_send() apply to the sample numbers
+ * of consecutive chunks. The chunks get decoded in a separate thread, in
+ * the order in which they were queued. The caller must not modify or
+ * free the sample data until release_cb got called for it.
+ *
+ * When the queue is full, this function either waits for the decoders
+ * to catch up, or fails with SRD_ERR_QUEUE_FULL, see
+ * srd_session_queue_depth_set().
+ *
+ * Errors which occur while decoding a queued chunk are returned by
+ * srd_session_send_wait(), srd_session_send() or srd_session_send_eof(),
+ * which pick them up. Until then, srd_session_send_async() returns the
+ * error and doesn't accept more data. Queued chunks are not decoded after
+ * an error, but still get released. srd_session_terminate_reset() drops
+ * the error.
+ *
+ * @param sess The session to use. Must not be NULL.
+ * @param abs_start_samplenum The absolute starting sample number for the
+ *              buffer's sample set, relative to the start of capture.
+ * @param abs_end_samplenum The absolute ending sample number for the
+ *              buffer's sample set, relative to the start of capture.
+ * @param inbuf Pointer to sample data. Must not be NULL.
+ * @param inbuflen Length in bytes of the buffer. Must be > 0.
+ * @param unitsize The number of bytes per sample. Must be > 0.
+ * @param release_cb Function which gets called when the decoders are done
+ *                   with the sample data. Can be NULL. Not called when
+ *                   this function returns an error.
+ * @param cb_data Private data for the release callback.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_send_async(struct srd_session *sess,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize,
+		srd_session_chunk_release_callback release_cb, void *cb_data)
+{
+	struct srd_session_chunk *chunk;
+	int ret;
+
+	if (!sess || !inbuf || !inbuflen || !unitsize)
+		return SRD_ERR_ARG;
+
+	g_mutex_lock(&sess->queue_mutex);
+
+	/*
+	 * Report previous errors, and don't accept more data until they
+	 * were picked up by srd_session_send_wait().
+	 */
+	if ((ret = sess->queue_error) != SRD_OK) {
+		g_mutex_unlock(&sess->queue_mutex);
+		return ret;
+	}
+
+	while (sess->queue_pending >= sess->queue_depth) {
+		if (!sess->queue_block) {
+			g_mutex_unlock(&sess->queue_mutex);
+			return SRD_ERR_QUEUE_FULL;
+		}
+		g_cond_wait(&sess->queue_cond, &sess->queue_mutex);
+	}
+
+	if (!sess->queue_thread) {
+		sess->queue_stop = FALSE;
+		sess->queue_thread = g_thread_new("srd-session",
+			session_queue_thread, sess);
+	}
+
+	chunk = g_malloc(sizeof(*chunk));
+	chunk->abs_start_samplenum = abs_start_samplenum;
+	chunk->abs_end_samplenum = abs_end_samplenum;
+	chunk->inbuf = inbuf;
+	chunk->inbuflen = inbuflen;
+	chunk->unitsize = unitsize;
+	chunk->release_cb = release_cb;
+	chunk->cb_data = cb_data;
+	g_queue_push_tail(sess->chunk_queue, chunk);
+	sess->queue_pending++;
+	g_cond_broadcast(&sess->queue_cond);
+
+	g_mutex_unlock(&sess->queue_mutex);
+
+	return SRD_OK;
+}
+
+/**
+ * Wait until all chunks which were queued by srd_session_send_async()
+ * have been decoded.
+ *
+ * @param sess The session. Must not be NULL.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise. This
+ *         includes errors which occurred while decoding queued chunks.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_send_wait(struct srd_session *sess)
+{
+	int ret;
+
+	if (!sess)
+		return SRD_ERR_ARG;
+
+	g_mutex_lock(&sess->queue_mutex);
+	while (sess->queue_pending)
+		g_cond_wait(&sess->queue_cond, &sess->queue_mutex);
+	ret = sess->queue_error;
+	sess->queue_error = SRD_OK;
+	g_mutex_unlock(&sess->queue_mutex);
+
+	return ret;
+}
+
 /**
  * Send a chunk of logic sample data to a running decoder session.
  *
@@ -246,6 +1023,10 @@ SRD_API int srd_session_metadata_set(struct srd_session *sess, int key,
  *   srd_session_send(s, 0,    1023, inbuf, 1024, 1);
  *   srd_session_send(s, 0,    1023, inbuf, 1024, 1);
  *
+ * The session's decoder stacks process the chunk concurrently, in their
+ * respective worker threads. Frontend callbacks are never invoked
+ * concurrently though.
+ *
  * @param sess The session to use. Must not be NULL.
  * @param abs_start_samplenum The absolute starting sample number for the
  *              buffer's sample set, relative to the start of capture.
@@ -263,38 +1044,825 @@ SRD_API int srd_session_send(struct srd_session *sess,
 		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
 		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize)
 {
-	GSList *d;
 	int ret;
 
 	if (!sess)
 		return SRD_ERR_ARG;
 
-	for (d = sess->di_list; d; d = d->next) {
-		if ((ret = srd_inst_decode(d->data, abs_start_samplenum,
-				abs_end_samplenum, inbuf, inbuflen, unitsize)) != SRD_OK)
-			return ret;
-	}
+	/* Chunks which were queued before go first. */
+	if ((ret = srd_session_send_wait(sess)) != SRD_OK)
+		return ret;
 
-	return SRD_OK;
+	return session_decode_chunk(sess, abs_start_samplenum,
+		abs_end_samplenum, inbuf, inbuflen, unitsize);
 }
 
 /**
- * Communicate the end of the stream of sample data to the session.
+ * Send a chunk of run-length encoded logic sample data to a running
+ * decoder session.
  *
- * @param[in] sess The session. Must not be NULL.
+ * The chunk consists of runs of identical samples. Decoders step from run
+ * to run when they wait for conditions, such that the decoding time of
+ * sparse captures depends on the number of runs rather than the number of
+ * samples. The same rules as for srd_session_send() apply to the sample
+ * numbers of consecutive chunks, and both functions can be mixed.
  *
- * @return SRD_OK upon success. A (negative) error code otherwise.
+ * Input filters (see srd_session_filter_set()) don't apply to run-length
+ * encoded data, sessions with filters reject it.
  *
- * @since 0.6.0
+ * @param sess The session to use. Must not be NULL.
+ * @param abs_start_samplenum The absolute sample number of the chunk's
+ *              first sample, relative to the start of capture.
+ * @param values The runs' sample values, unitsize bytes each. Must not
+ *              be NULL.
+ * @param run_lengths The number of samples of each run. Must not be NULL,
+ *              each length must be > 0.
+ * @param num_runs The number of runs. Must be > 0.
+ * @param unitsize The number of bytes per sample. Must be > 0.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_send_rle(struct srd_session *sess,
+		uint64_t abs_start_samplenum, const uint8_t *values,
+		const uint64_t *run_lengths, uint64_t num_runs, uint64_t unitsize)
+{
+	struct srd_run_list runs;
+	uint64_t num_samples, i;
+	int ret;
+
+	if (!sess || !values || !run_lengths || !num_runs || !unitsize)
+		return SRD_ERR_ARG;
+
+	if (sess->filters) {
+		srd_err("Input filters don't apply to run-length encoded samples.");
+		return SRD_ERR_ARG;
+	}
+
+	runs.values = values;
+	runs.num_runs = num_runs;
+	runs.ends = g_malloc(sizeof(uint64_t) * num_runs);
+	num_samples = 0;
+	for (i = 0; i < num_runs; i++) {
+		if (!run_lengths[i]) {
+			g_free(runs.ends);
+			return SRD_ERR_ARG;
+		}
+		num_samples += run_lengths[i];
+		runs.ends[i] = num_samples;
+	}
+
+	/* Chunks which were queued before go first. */
+	if ((ret = srd_session_send_wait(sess)) == SRD_OK) {
+		ret = session_dispatch_chunk(sess, abs_start_samplenum,
+			abs_start_samplenum + num_samples, values,
+			num_samples * unitsize, unitsize, &runs, NULL);
+	}
+	g_free(runs.ends);
+
+	return ret;
+}
+
+/**
+ * Send a chunk of channel-major logic sample data to a running decoder
+ * session.
+ *
+ * Instead of interleaved samples, the chunk consists of one bit plane per
+ * input channel. Bit N of a plane (bit N % 8 of byte N / 8) holds the
+ * channel's value in the chunk's sample N. Decoders read the planes in
+ * place, and search for the next change of the channels they wait for
+ * one machine word at a time. The channel map refers to the planes' indices,
+ * like it refers to bit numbers in interleaved samples. The same rules as
+ * for srd_session_send() apply to the sample numbers of consecutive
+ * chunks, and both functions can be mixed as long as the number of
+ * channels (the unit size) is the same.
+ *
+ * Input filters (see srd_session_filter_set()) don't apply to
+ * channel-major data, sessions with filters reject it.
+ *
+ * @param sess The session to use. Must not be NULL.
+ * @param abs_start_samplenum The absolute starting sample number for the
+ *              chunk, relative to the start of capture.
+ * @param abs_end_samplenum The absolute ending sample number for the
+ *              chunk, relative to the start of capture. Must be greater
+ *              than abs_start_samplenum.
+ * @param planes The bit planes of the input channels, each at least
+ *              (abs_end_samplenum - abs_start_samplenum + 7) / 8 bytes
+ *              long. Must not be NULL. Channels without data can have a
+ *              NULL plane, they read as low.
+ * @param num_planes The number of input channels. Must be > 0.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_send_planar(struct srd_session *sess,
+		uint64_t abs_start_samplenum, uint64_t abs_end_samplenum,
+		const uint8_t *const *planes, unsigned int num_planes)
+{
+	struct srd_plane_set plane_set;
+	uint64_t unitsize;
+	int ret;
+
+	if (!sess || !planes || !num_planes)
+		return SRD_ERR_ARG;
+	if (abs_end_samplenum <= abs_start_samplenum)
+		return SRD_ERR_ARG;
+
+	if (sess->filters) {
+		srd_err("Input filters don't apply to channel-major samples.");
+		return SRD_ERR_ARG;
+	}
+
+	plane_set.planes = planes;
+	plane_set.num_planes = num_planes;
+	unitsize = (num_planes + 7) / 8;
+
+	/* Chunks which were queued before go first. */
+	if ((ret = srd_session_send_wait(sess)) != SRD_OK)
+		return ret;
+
+	return session_dispatch_chunk(sess, abs_start_samplenum,
+		abs_end_samplenum, NULL,
+		(abs_end_samplenum - abs_start_samplenum) * unitsize,
+		unitsize, NULL, &plane_set);
+}
+
+#ifdef HAVE_POSIX_MADVISE
+/* Give the kernel a hint about the use of a range of a mapped file. */
+static void file_advise(const char *contents, uint64_t start, uint64_t end,
+		int advice)
+{
+	uint64_t page;
+
+	page = sysconf(_SC_PAGESIZE);
+	start -= start % page;
+	if (advice == POSIX_MADV_DONTNEED)
+		end -= end % page;
+	if (end > start)
+		posix_madvise((void *)(contents + start), end - start, advice);
+}
+#endif
+
+/* Feed the samples of a mapped capture file to a session, in chunks. */
+static int session_send_mapped(struct srd_session *sess, GMappedFile *file,
+		uint64_t offset, uint64_t unitsize)
+{
+	const char *contents;
+	uint64_t length, num_samples, chunk_samples, samplenum, count;
+	uint64_t start, end;
+	int ret;
+
+	contents = g_mapped_file_get_contents(file);
+	length = g_mapped_file_get_length(file);
+	if (!contents || offset >= length) {
+		srd_err("No sample data after offset %" PRIu64 ".", offset);
+		return SRD_ERR_ARG;
+	}
+
+	num_samples = (length - offset) / unitsize;
+	if ((length - offset) % unitsize)
+		srd_warn("Ignoring incomplete sample at the end of the file.");
+	if (!num_samples)
+		return SRD_OK;
+
+	chunk_samples = MAX(FILE_CHUNK_SIZE / unitsize, FILE_CHUNK_MIN_SAMPLES);
+	srd_dbg("Decoding %" PRIu64 " samples from file, %" PRIu64
+		" samples per chunk.", num_samples, chunk_samples);
+
+#ifdef HAVE_POSIX_MADVISE
+	file_advise(contents, offset, length, POSIX_MADV_SEQUENTIAL);
+#endif
+
+	/* Chunks which were queued before go first. */
+	if ((ret = srd_session_send_wait(sess)) != SRD_OK)
+		return ret;
+
+	for (samplenum = 0; samplenum < num_samples; samplenum += count) {
+		count = MIN(chunk_samples, num_samples - samplenum);
+		start = offset + samplenum * unitsize;
+		end = start + count * unitsize;
+#ifdef HAVE_POSIX_MADVISE
+		/* Read the next chunk ahead while this one gets decoded. */
+		if (end < length)
+			file_advise(contents, end,
+				MIN(end + count * unitsize, length), POSIX_MADV_WILLNEED);
+#endif
+		ret = session_decode_chunk(sess, samplenum, samplenum + count,
+			(const uint8_t *)contents + start, count * unitsize,
+			unitsize);
+		if (ret != SRD_OK)
+			return ret;
+#ifdef HAVE_POSIX_MADVISE
+		/* Decoders and filters don't keep pointers into the chunk. */
+		file_advise(contents, start, end, POSIX_MADV_DONTNEED);
+#endif
+	}
+
+	return SRD_OK;
+}
+
+/**
+ * Decode a capture file of logic sample data.
+ *
+ * The file gets mapped into memory, and the session's decoder stacks read
+ * the samples from the mapping without copying them. The samples are fed
+ * to the decoders in chunks, like srd_session_send() does. Their size is
+ * chosen automatically.
+ *
+ * The file's first sample is sample number 0, the session's decoders must
+ * not have received any sample data before. An incomplete sample at the
+ * end of the file is ignored. This function doesn't communicate the end
+ * of the stream, see srd_session_send_eof().
+ *
+ * @param sess The session to use. Must not be NULL.
+ * @param filename The name of the capture file. Must not be NULL.
+ * @param offset The file offset of the first sample, in bytes. This skips
+ *               a header, for example.
+ * @param unitsize The number of bytes per sample. Must be > 0.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_send_file(struct srd_session *sess,
+		const char *filename, uint64_t offset, uint64_t unitsize)
+{
+	GMappedFile *file;
+	GError *error;
+	int ret;
+
+	if (!sess || !filename || !unitsize)
+		return SRD_ERR_ARG;
+
+	error = NULL;
+	if (!(file = g_mapped_file_new(filename, FALSE, &error))) {
+		srd_err("Failed to map '%s': %s", filename, error->message);
+		g_error_free(error);
+		return SRD_ERR;
+	}
+
+	ret = session_send_mapped(sess, file, offset, unitsize);
+	g_mapped_file_unref(file);
+
+	return ret;
+}
+
+/**
+ * Decode a capture file of logic sample data, given an open file.
+ *
+ * This works like srd_session_send_file(). The file descriptor must be
+ * open for reading, the caller keeps ownership of it.
+ *
+ * @param sess The session to use. Must not be NULL.
+ * @param fd The file descriptor of the capture file.
+ * @param offset The file offset of the first sample, in bytes.
+ * @param unitsize The number of bytes per sample. Must be > 0.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_send_fd(struct srd_session *sess, int fd,
+		uint64_t offset, uint64_t unitsize)
+{
+	GMappedFile *file;
+	GError *error;
+	int ret;
+
+	if (!sess || fd < 0 || !unitsize)
+		return SRD_ERR_ARG;
+
+	error = NULL;
+	if (!(file = g_mapped_file_new_from_fd(fd, FALSE, &error))) {
+		srd_err("Failed to map file: %s", error->message);
+		g_error_free(error);
+		return SRD_ERR;
+	}
+
+	ret = session_send_mapped(sess, file, offset, unitsize);
+	g_mapped_file_unref(file);
+
+	return ret;
+}
+
+/* Output of a decoder stack copy, held back until it's passed on in order. */
+struct shard_output {
+	uint64_t start_sample;
+	uint64_t end_sample;
+	/* Output of the original decoder instance. */
+	struct srd_pd_output *pdo;
+	void *data;
+};
+
+/* A time segment of the capture, decoded by copies of the decoder stacks. */
+struct shard_segment {
+	struct srd_session *sess;
+	/* Maps decoder instance copies to the original instances. */
+	GHashTable *inst_map;
+	const uint8_t *inbuf;
+	uint64_t unitsize;
+	/* Samples which get decoded, including the overlap. */
+	uint64_t decode_start;
+	uint64_t decode_end;
+	/* Samples which the segment provides output for. */
+	uint64_t own_start;
+	uint64_t own_end;
+	gboolean is_last;
+	GThread *thread;
+	GSList *outputs;
+	int ret;
+};
+
+static void shard_output_free(struct shard_output *out)
+{
+	struct srd_proto_data_annotation *pda;
+	struct srd_proto_data_binary *pdb;
+
+	switch (out->pdo->output_type) {
+	case SRD_OUTPUT_ANN:
+		pda = out->data;
+		g_strfreev(pda->ann_text);
+		if (pda->num_ann_values)
+			g_free((void *)pda->ann_values);
+		g_free(pda);
+		break;
+	case SRD_OUTPUT_BINARY:
+		pdb = out->data;
+		g_free((void *)pdb->data);
+		g_free(pdb);
+		break;
+	case SRD_OUTPUT_META:
+		g_variant_unref(out->data);
+		break;
+	}
+	g_free(out);
+}
+
+/* Frontend callback of a segment's session, holds back the output. */
+static void shard_output_cb(struct srd_proto_data *pdata, void *cb_data)
+{
+	struct shard_segment *seg;
+	struct shard_output *out;
+	struct srd_decoder_inst *di;
+	struct srd_pd_output *pdo;
+	struct srd_proto_data_annotation *pda;
+	struct srd_proto_data_binary *pdb;
+	int64_t *values;
+	GSList *l;
+
+	seg = cb_data;
+
+	/* Output which starts in the overlap belongs to the neighbours. */
+	if (pdata->start_sample < seg->own_start)
+		return;
+	if (pdata->start_sample >= seg->own_end && !seg->is_last)
+		return;
+
+	/* Find the original instance's output with the same ID. */
+	if (!(di = g_hash_table_lookup(seg->inst_map, pdata->pdo->di)))
+		return;
+	pdo = NULL;
+	for (l = di->pd_output; l; l = l->next) {
+		pdo = l->data;
+		if (pdo->pdo_id == pdata->pdo->pdo_id)
+			break;
+		pdo = NULL;
+	}
+	if (!pdo)
+		return;
+
+	out = g_malloc0(sizeof(*out));
+	out->start_sample = pdata->start_sample;
+	out->end_sample = pdata->end_sample;
+	out->pdo = pdo;
+	switch (pdo->output_type) {
+	case SRD_OUTPUT_ANN:
+		pda = g_malloc(sizeof(*pda));
+		*pda = *(struct srd_proto_data_annotation *)pdata->data;
+		pda->ann_text = g_strdupv(pda->ann_text);
+		if (pda->num_ann_values) {
+			values = g_malloc(sizeof(*values) * pda->num_ann_values);
+			memcpy(values, pda->ann_values,
+				sizeof(*values) * pda->num_ann_values);
+			pda->ann_values = values;
+		}
+		out->data = pda;
+		break;
+	case SRD_OUTPUT_BINARY:
+		pdb = g_malloc(sizeof(*pdb));
+		*pdb = *(struct srd_proto_data_binary *)pdata->data;
+		pdb->data = g_malloc(pdb->size);
+		memcpy((void *)pdb->data, ((struct srd_proto_data_binary *)pdata->data)->data, pdb->size);
+		out->data = pdb;
+		break;
+	case SRD_OUTPUT_META:
+		out->data = g_variant_ref(pdata->data);
+		break;
+	}
+	seg->outputs = g_slist_prepend(seg->outputs, out);
+}
+
+/* Set up a session with copies of the decoder stacks, for one segment. */
+static int shard_segment_setup(struct srd_session *sess, struct shard_segment *seg)
+{
+	struct srd_decoder_inst *di_copy;
+	const uint8_t *prev_sample;
+	GSList *l;
+	int ret;
+
+	if ((ret = srd_session_new(&seg->sess)) != SRD_OK)
+		return ret;
+	seg->inst_map = g_hash_table_new(g_direct_hash, g_direct_equal);
+
+	prev_sample = NULL;
+	if (seg->decode_start)
+		prev_sample = seg->inbuf + (seg->decode_start - 1) * seg->unitsize;
+	for (l = sess->di_list; l; l = l->next) {
+		if (!(di_copy = srd_inst_clone(seg->sess, l->data, seg->inst_map)))
+			return SRD_ERR;
+		srd_inst_seek(di_copy, seg->decode_start, prev_sample);
+	}
+
+	srd_pd_output_callback_add(seg->sess, SRD_OUTPUT_ANN, shard_output_cb, seg);
+	srd_pd_output_callback_add(seg->sess, SRD_OUTPUT_BINARY, shard_output_cb, seg);
+	srd_pd_output_callback_add(seg->sess, SRD_OUTPUT_META, shard_output_cb, seg);
+
+	if ((ret = srd_session_start(seg->sess)) != SRD_OK)
+		return ret;
+	if (sess->samplerate) {
+		ret = srd_session_metadata_set(seg->sess, SRD_CONF_SAMPLERATE,
+			g_variant_ref(sess->samplerate));
+	}
+
+	return ret;
+}
+
+static gpointer shard_segment_thread(gpointer data)
+{
+	struct shard_segment *seg;
+
+	seg = data;
+
+	seg->ret = srd_session_send(seg->sess, seg->decode_start, seg->decode_end,
+		seg->inbuf + seg->decode_start * seg->unitsize,
+		(seg->decode_end - seg->decode_start) * seg->unitsize, seg->unitsize);
+	if (seg->ret == SRD_OK && seg->is_last)
+		seg->ret = srd_session_send_eof(seg->sess);
+
+	return NULL;
+}
+
+/* Pass a batch of a segment's annotations on to the frontend. */
+static void shard_batch_emit(struct srd_session *sess, GArray *batch)
+{
+	if (!batch->len)
+		return;
+	g_mutex_lock(&sess->callback_mutex);
+	sess->ann_batch_cb((struct srd_proto_data *)batch->data, batch->len,
+		sess->ann_batch_cb_data);
+	g_mutex_unlock(&sess->callback_mutex);
+	g_array_set_size(batch, 0);
+}
+
+/* Pass a segment's output on to the frontend, in the original order. */
+static void shard_segment_emit(struct srd_session *sess, struct shard_segment *seg)
+{
+	struct shard_output *out;
+	struct srd_pd_callback *cb;
+	struct srd_proto_data pdata;
+	GArray *batch;
+	GSList *l;
+
+	batch = NULL;
+	if (sess->ann_batch_cb)
+		batch = g_array_sized_new(FALSE, FALSE, sizeof(pdata), sess->ann_batch_size);
+
+	seg->outputs = g_slist_reverse(seg->outputs);
+	for (l = seg->outputs; l; l = l->next) {
+		out = l->data;
+		pdata.start_sample = out->start_sample;
+		pdata.end_sample = out->end_sample;
+		pdata.pdo = out->pdo;
+		pdata.data = out->data;
+		if (batch && out->pdo->output_type == SRD_OUTPUT_ANN) {
+			g_array_append_val(batch, pdata);
+			if (batch->len >= sess->ann_batch_size)
+				shard_batch_emit(sess, batch);
+			continue;
+		}
+		if (!(cb = srd_pd_output_callback_find(sess, out->pdo->output_type)))
+			continue;
+		g_mutex_lock(&sess->callback_mutex);
+		cb->cb(&pdata, cb->cb_data);
+		g_mutex_unlock(&sess->callback_mutex);
+	}
+	if (batch) {
+		shard_batch_emit(sess, batch);
+		g_array_free(batch, TRUE);
+	}
+	g_slist_free_full(seg->outputs, (GDestroyNotify)shard_output_free);
+	seg->outputs = NULL;
+}
+
+static void shard_segment_free(struct shard_segment *seg)
+{
+	if (seg->outputs)
+		g_slist_free_full(seg->outputs, (GDestroyNotify)shard_output_free);
+	if (seg->sess)
+		srd_session_destroy(seg->sess);
+	if (seg->inst_map)
+		g_hash_table_destroy(seg->inst_map);
+}
+
+/**
+ * Set the parameters of sharded decoding.
+ *
+ * @param sess The session. Must not be NULL.
+ * @param segment_size The number of samples per segment. Must be > 0.
+ * @param overlap The number of samples which get decoded before and after
+ *                a segment, such that the decoders re-synchronize to the
+ *                signal. Should cover at least one "idle" period of the
+ *                protocol, e.g. a UART frame or an I2C transfer.
+ * @param num_threads The number of segments which get decoded in parallel.
+ *                    Must be > 0.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_shard_options_set(struct srd_session *sess,
+		uint64_t segment_size, uint64_t overlap, unsigned int num_threads)
+{
+	if (!sess || !segment_size || !num_threads)
+		return SRD_ERR_ARG;
+
+	sess->shard_segment_size = segment_size;
+	sess->shard_overlap = overlap;
+	sess->shard_threads = num_threads;
+
+	return SRD_OK;
+}
+
+/**
+ * Set up a callback which reports where srd_session_send_sharded() stitches
+ * the output of neighbouring segments together.
+ *
+ * The callback is invoked for each segment but the first, before the
+ * segment's output is passed on. It receives the sample number where the
+ * segment starts, and the sample number where the segment's decoders
+ * started to decode, within the overlap with the previous segment. Output
+ * around these positions may differ from a decoding in one piece, when
+ * the overlap is too short for the decoders to re-synchronize.
+ *
+ * The callback isn't invoked concurrently with other callbacks.
+ *
+ * @param sess The session to use. Must not be NULL.
+ * @param cb The function to call. NULL disables the reports.
+ * @param cb_data Private data for the callback function. Can be NULL.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_stitch_callback_set(struct srd_session *sess,
+		srd_session_stitch_callback cb, void *cb_data)
+{
+	if (!sess)
+		return SRD_ERR_ARG;
+
+	sess->stitch_cb = cb;
+	sess->stitch_cb_data = cb_data;
+
+	return SRD_OK;
+}
+
+/**
+ * Set up a filter for one input channel of a session.
+ *
+ * The filter is applied to the sample data before it's passed on to the
+ * decoder stacks, such that all decoders which use the channel see the
+ * filtered signal. Filters hold back samples until enough of the following
+ * samples have been received, the end of the data is communicated by
+ * srd_session_send_eof(). Widths are specified in samples, frontends
+ * convert times by means of the samplerate.
+ *
+ * SRD_FILTER_MIN_WIDTH suppresses pulses shorter than 'width' samples,
+ * the channel keeps its previous level instead. SRD_FILTER_MAJORITY sets
+ * each sample to the level which the majority of the 'width' samples
+ * around it have. SRD_FILTER_NONE removes the channel's filter.
+ *
+ * Filters can only be changed before sample data is sent to the session,
+ * or after srd_session_send_eof() or srd_session_terminate_reset().
+ *
+ * @param sess The session. Must not be NULL.
+ * @param channel The input channel, i.e. the bit number in a sample.
+ * @param filter_type The filter type (enum srd_filter_type).
+ * @param width The filter's width in samples. Must be > 0, and odd for
+ *              SRD_FILTER_MAJORITY.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_filter_set(struct srd_session *sess,
+		unsigned int channel, int filter_type, uint64_t width)
+{
+	struct srd_input_filter *f;
+	GSList *l;
+
+	if (!sess)
+		return SRD_ERR_ARG;
+
+	switch (filter_type) {
+	case SRD_FILTER_NONE:
+		break;
+	case SRD_FILTER_MIN_WIDTH:
+		if (!width)
+			return SRD_ERR_ARG;
+		break;
+	case SRD_FILTER_MAJORITY:
+		if (!(width % 2))
+			return SRD_ERR_ARG;
+		break;
+	default:
+		return SRD_ERR_ARG;
+	}
+
+	if (sess->filter_unitsize) {
+		srd_err("Cannot change input filters while decoding.");
+		return SRD_ERR;
+	}
+
+	for (l = sess->filters; l; l = l->next) {
+		f = l->data;
+		if (f->channel == channel) {
+			sess->filters = g_slist_delete_link(sess->filters, l);
+			g_free(f);
+			break;
+		}
+	}
+	if (filter_type == SRD_FILTER_NONE)
+		return SRD_OK;
+
+	f = g_malloc0(sizeof(*f));
+	f->channel = channel;
+	f->filter_type = filter_type;
+	f->width = width;
+	sess->filters = g_slist_append(sess->filters, f);
+
+	srd_dbg("Set up %s filter of width %" PRIu64 " for channel %u.",
+		filter_type == SRD_FILTER_MIN_WIDTH ? "min. width" : "majority",
+		width, channel);
+
+	return SRD_OK;
+}
+
+/**
+ * Decode a complete capture, by splitting it into time segments which get
+ * decoded in parallel.
+ *
+ * Each segment is decoded by a copy of the session's decoder stacks,
+ * including some overlap with the neighbouring segments, so that the
+ * decoders can re-synchronize to the signal. Output (annotations, binary
+ * and meta data) which starts within a segment is passed on to the
+ * session's callbacks in the order of the segments, output which starts
+ * in the overlap is discarded. Other output types are not available in
+ * this mode. See srd_session_stitch_callback_set() for where the segments
+ * get stitched together.
+ *
+ * The capture must start at sample number 0, and the session's decoders
+ * must not have received any sample data before. srd_session_start() and
+ * srd_session_metadata_set() must have been called already. The session's
+ * decoder instances themselves don't receive sample data. Input filters
+ * are applied to a copy of the capture, before it gets split.
+ *
+ * @param sess The session to use. Must not be NULL.
+ * @param inbuf Pointer to the capture's sample data. Must not be NULL.
+ * @param inbuflen Length in bytes of the sample data. Must be > 0.
+ * @param unitsize The number of bytes per sample. Must be > 0.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_send_sharded(struct srd_session *sess,
+		const uint8_t *inbuf, uint64_t inbuflen, uint64_t unitsize)
+{
+	struct shard_segment *segs;
+	uint8_t *filtered;
+	uint64_t num_samples, num_segments, first, count, i;
+	int ret;
+
+	if (!sess || !inbuf || !inbuflen || !unitsize)
+		return SRD_ERR_ARG;
+
+	if ((ret = srd_session_send_wait(sess)) != SRD_OK)
+		return ret;
+
+	filtered = NULL;
+	if (sess->filters) {
+		ret = session_filter_capture(sess, inbuf, inbuflen, unitsize,
+			&filtered);
+		if (ret != SRD_OK)
+			return ret;
+		inbuf = filtered;
+	}
+
+	num_samples = inbuflen / unitsize;
+	num_segments = (num_samples + sess->shard_segment_size - 1) / sess->shard_segment_size;
+	srd_dbg("Decoding %" PRIu64 " samples in %" PRIu64 " segments.",
+		num_samples, num_segments);
+
+	/*
+	 * Process batches of segments in parallel. Sessions get created
+	 * and destroyed while no decoder threads are running.
+	 */
+	segs = g_malloc0(sizeof(*segs) * sess->shard_threads);
+	for (first = 0; first < num_segments && ret == SRD_OK; first += count) {
+		count = MIN(sess->shard_threads, num_segments - first);
+		memset(segs, 0, sizeof(*segs) * count);
+		for (i = 0; i < count; i++) {
+			segs[i].inbuf = inbuf;
+			segs[i].unitsize = unitsize;
+			segs[i].own_start = (first + i) * sess->shard_segment_size;
+			segs[i].own_end = MIN(segs[i].own_start + sess->shard_segment_size, num_samples);
+			segs[i].is_last = segs[i].own_end == num_samples;
+			segs[i].decode_start = segs[i].own_start - MIN(segs[i].own_start, sess->shard_overlap);
+			segs[i].decode_end = MIN(segs[i].own_end + sess->shard_overlap, num_samples);
+			if ((ret = shard_segment_setup(sess, &segs[i])) != SRD_OK)
+				break;
+		}
+		for (i = 0; i < count && ret == SRD_OK; i++)
+			segs[i].thread = g_thread_new("srd-shard", shard_segment_thread, &segs[i]);
+		for (i = 0; i < count; i++) {
+			if (!segs[i].thread)
+				continue;
+			g_thread_join(segs[i].thread);
+			if (segs[i].ret != SRD_OK && ret == SRD_OK)
+				ret = segs[i].ret;
+			if (ret != SRD_OK)
+				continue;
+			if (segs[i].own_start) {
+				srd_info("Stitched segment at sample %" PRIu64
+					" (decoded from sample %" PRIu64 ").",
+					segs[i].own_start, segs[i].decode_start);
+			}
+			if (segs[i].own_start && sess->stitch_cb) {
+				g_mutex_lock(&sess->callback_mutex);
+				sess->stitch_cb(segs[i].own_start, segs[i].decode_start,
+					sess->stitch_cb_data);
+				g_mutex_unlock(&sess->callback_mutex);
+			}
+			shard_segment_emit(sess, &segs[i]);
+		}
+		for (i = 0; i < count; i++)
+			shard_segment_free(&segs[i]);
+	}
+	g_free(segs);
+	g_free(filtered);
+
+	return ret;
+}
+
+/**
+ * Communicate the end of the stream of sample data to the session.
+ *
+ * @param[in] sess The session. Must not be NULL.
+ *
+ * @return SRD_OK upon success. A (negative) error code otherwise.
+ *
+ * @since 0.6.0
  */
 SRD_API int srd_session_send_eof(struct srd_session *sess)
 {
 	GSList *d;
+	uint64_t samplenum, num_samples;
 	int ret;
 
 	if (!sess)
 		return SRD_ERR_ARG;
 
+	/* Report errors of queued chunks before the stacks see EOF. */
+	if ((ret = srd_session_send_wait(sess)) != SRD_OK)
+		return ret;
+
+	/* Pass on the samples which the input filters held back. */
+	if (sess->filter_unitsize) {
+		ret = session_filter_run(sess, 0, NULL, 0, 0, TRUE,
+			&samplenum, &num_samples);
+		if (ret == SRD_OK && num_samples) {
+			ret = session_dispatch_chunk(sess, samplenum,
+				samplenum + num_samples, sess->filter_out,
+				num_samples * sess->filter_unitsize,
+				sess->filter_unitsize, NULL, NULL);
+		}
+		session_filter_reset(sess);
+		if (ret != SRD_OK)
+			return ret;
+	}
+
 	for (d = sess->di_list; d; d = d->next) {
 		ret = srd_inst_send_eof(d->data);
 		if (ret != SRD_OK)
@@ -334,6 +1902,16 @@ SRD_API int srd_session_terminate_reset(struct srd_session *sess)
 	if (!sess)
 		return SRD_ERR_ARG;
 
+	/* Drop pending chunks, and let the current chunk complete. */
+	session_queue_discard(sess);
+	session_queue_wait_idle(sess);
+	session_filter_reset(sess);
+
+	/* Errors of the previous run don't concern the next one. */
+	g_mutex_lock(&sess->queue_mutex);
+	sess->queue_error = SRD_OK;
+	g_mutex_unlock(&sess->queue_mutex);
+
 	for (d = sess->di_list; d; d = d->next) {
 		ret = srd_inst_terminate_reset(d->data);
 		if (ret != SRD_OK)
@@ -362,11 +1940,28 @@ SRD_API int srd_session_destroy(struct srd_session *sess)
 		return SRD_ERR_ARG;
 
 	session_id = sess->session_id;
+	session_queue_discard(sess);
+	if (sess->queue_thread) {
+		g_mutex_lock(&sess->queue_mutex);
+		sess->queue_stop = TRUE;
+		g_cond_broadcast(&sess->queue_cond);
+		g_mutex_unlock(&sess->queue_mutex);
+		g_thread_join(sess->queue_thread);
+	}
 	if (sess->di_list)
 		srd_inst_free_all(sess);
 	if (sess->callbacks)
 		g_slist_free_full(sess->callbacks, g_free);
 	sessions = g_slist_remove(sessions, sess);
+	g_mutex_clear(&sess->callback_mutex);
+	g_queue_free(sess->chunk_queue);
+	if (sess->samplerate)
+		g_variant_unref(sess->samplerate);
+	g_slist_free_full(sess->filters, g_free);
+	g_free(sess->filter_buf);
+	g_free(sess->filter_out);
+	g_mutex_clear(&sess->queue_mutex);
+	g_cond_clear(&sess->queue_cond);
 	g_free(sess);
 
 	srd_dbg("Destroyed session %d.", session_id);
@@ -410,6 +2005,109 @@ SRD_API int srd_pd_output_callback_add(struct srd_session *sess,
 	return SRD_OK;
 }
 
+/**
+ * Set up batched delivery of annotations.
+ *
+ * Annotations are collected per decoder instance and passed to the batch
+ * callback as an array, rather than to the SRD_OUTPUT_ANN callback one
+ * at a time. A batch gets delivered when it's full, and at the end of
+ * each chunk of sample data. The annotations and their texts are only
+ * valid during the callback.
+ *
+ * The batch callback isn't invoked concurrently with other callbacks.
+ * Its annotations are in the order of their instance's output, but
+ * annotations of different instances may be delivered in any order.
+ *
+ * This should be set up before sample data is sent to the session.
+ *
+ * @param sess The session to use. Must not be NULL.
+ * @param cb The function to call. NULL delivers annotations one at a
+ *           time again.
+ * @param cb_data Private data for the callback function. Can be NULL.
+ * @param batch_size The maximum number of annotations per batch, 0 for
+ *                   the default.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_pd_annotation_batch_callback_set(struct srd_session *sess,
+		srd_pd_annotation_batch_callback cb, void *cb_data,
+		unsigned int batch_size)
+{
+	if (!sess)
+		return SRD_ERR_ARG;
+
+	srd_dbg("%s batched delivery of annotations.",
+		cb ? "Enabling" : "Disabling");
+
+	sess->ann_batch_cb = cb;
+	sess->ann_batch_cb_data = cb_data;
+	sess->ann_batch_size = batch_size ? batch_size : DEFAULT_ANN_BATCH_SIZE;
+
+	return SRD_OK;
+}
+
+/**
+ * Only render the texts of formatted annotations upon request.
+ *
+ * Decoders can submit annotations as a text format and its values. By
+ * default their texts get rendered before they are passed to callbacks.
+ * In lazy mode, the annotations' ann_text is NULL instead, and frontends
+ * which need the texts call srd_annotation_text_get(). Frontends which
+ * only store the values skip rendering altogether.
+ *
+ * @param sess The session to use. Must not be NULL.
+ * @param lazy TRUE to render texts upon request, FALSE to always render.
+ *
+ * @return SRD_OK upon success, a (negative) error code otherwise.
+ *
+ * @since 0.6.0
+ */
+SRD_API int srd_session_lazy_ann_text_set(struct srd_session *sess,
+		gboolean lazy)
+{
+	if (!sess)
+		return SRD_ERR_ARG;
+
+	srd_dbg("%s lazy rendering of annotation texts.",
+		lazy ? "Enabling" : "Disabling");
+
+	sess->ann_text_lazy = lazy;
+
+	return SRD_OK;
+}
+
+/**
+ * Get the texts of an annotation, rendering them if needed.
+ *
+ * This must only be called from within the SRD_OUTPUT_ANN callback or
+ * the batch callback which received the annotation. Texts of recurring
+ * values are cached, but like all annotation texts they are only valid
+ * during the callback.
+ *
+ * @param pdata The annotation. Must not be NULL.
+ *
+ * @return The NULL terminated list of texts, owned by libsigrokdecode.
+ *         NULL upon errors.
+ *
+ * @since 0.6.0
+ */
+SRD_API char **srd_annotation_text_get(struct srd_proto_data *pdata)
+{
+	struct srd_proto_data_annotation *pda;
+
+	if (!pdata || !pdata->pdo || pdata->pdo->output_type != SRD_OUTPUT_ANN)
+		return NULL;
+
+	pda = pdata->data;
+	if (!pda->ann_text && pda->ann_format >= 0)
+		pda->ann_text = srd_inst_ann_format_text(pdata->pdo->di,
+			pda->ann_format, pda->ann_values);
+
+	return pda->ann_text;
+}
+
 /** @private */
 SRD_PRIV struct srd_pd_callback *srd_pd_output_callback_find(
 		struct srd_session *sess, int output_type)
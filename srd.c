@@ -238,6 +238,10 @@ SRD_API int srd_init(const char *path)
 	/* Initialize the Python interpreter. */
 	Py_InitializeEx(0);
 
+#ifdef Py_GIL_DISABLED
+	srd_dbg("Free-threaded Python, decoder stacks run concurrently.");
+#endif
+
 	/* Locations relative to the XDG system data directories. */
 	sys_datadirs = g_get_system_data_dirs();
 	for (i = g_strv_length((char **)sys_datadirs); i > 0; i--) {
@@ -19,7 +19,10 @@
 
 #include <config.h>
 #include <libsigrokdecode.h> /* First, to avoid compiler warning. */
+#include <inttypes.h>
+#include <stdio.h>
 #include <stdlib.h>
+#include <string.h>
 #include <check.h>
 #include "lib.h"
 
@@ -140,6 +143,164 @@ START_TEST(test_inst_option_set_bogus)
 }
 END_TEST
 
+/*
+ * Check whether srd_inst_decimation_set() works, and fails for invalid
+ * factors and stacked instances.
+ */
+START_TEST(test_inst_decimation_set)
+{
+	int ret;
+	struct srd_session *sess;
+	struct srd_decoder_inst *inst, *inst_top;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load_all();
+	srd_session_new(&sess);
+	inst = srd_inst_new(sess, "uart", NULL);
+	inst_top = srd_inst_new(sess, "uart", NULL);
+	srd_inst_stack(sess, inst, inst_top);
+
+	ret = srd_inst_decimation_set(inst, 100);
+	fail_unless(ret == SRD_OK, "srd_inst_decimation_set() failed: %d.", ret);
+	ret = srd_inst_decimation_set(inst, 1);
+	fail_unless(ret == SRD_OK, "srd_inst_decimation_set() failed: %d.", ret);
+	ret = srd_inst_decimation_set(NULL, 100);
+	fail_unless(ret != SRD_OK, "srd_inst_decimation_set() with NULL "
+			"instance worked.");
+	ret = srd_inst_decimation_set(inst, 0);
+	fail_unless(ret != SRD_OK, "srd_inst_decimation_set() with factor 0 "
+			"worked.");
+	ret = srd_inst_decimation_set(inst_top, 100);
+	fail_unless(ret != SRD_OK, "srd_inst_decimation_set() for a stacked "
+			"instance worked.");
+
+	srd_exit();
+}
+END_TEST
+
+/* Decode a uart capture, optionally decimated after the samplerate is set. */
+static GPtrArray *uart_decode(const uint8_t *buf, uint64_t num_samples,
+		uint64_t samplerate, uint64_t factor)
+{
+	int ret;
+	GPtrArray *anns;
+	struct srd_session *sess;
+	struct srd_decoder_inst *inst;
+
+	anns = g_ptr_array_new_with_free_func(g_free);
+	srd_session_new(&sess);
+	inst = srdtest_uart_inst_new(sess, samplerate);
+	ret = srd_inst_decimation_set(inst, factor);
+	fail_unless(ret == SRD_OK, "srd_inst_decimation_set() failed: %d.", ret);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, srdtest_ann_collect, anns);
+	srd_session_start(sess);
+	ret = srd_session_send(sess, 0, num_samples, buf, num_samples, 1);
+	fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.", ret);
+	srd_session_send_eof(sess);
+	srd_session_destroy(sess);
+
+	return anns;
+}
+
+/*
+ * Check whether a decimated uart stack decodes the same bytes as an
+ * undecimated one, at sample numbers in the input's timebase. The
+ * decimation is set after the samplerate, which the decoder has to
+ * see divided nevertheless.
+ */
+START_TEST(test_inst_decimation_decode)
+{
+	unsigned int i, num_data;
+	int cls, cls_dec;
+	char text[64], text_dec[64];
+	uint8_t *buf;
+	uint64_t num_samples, ss, es, ss_dec, es_dec;
+	GPtrArray *plain, *decimated;
+
+	/* 115200 baud at 2MHz, 20 frames. */
+	num_samples = 20 * 13 * 2000000 / 115200;
+	buf = g_malloc(num_samples);
+	srdtest_uart_frames_gen(buf, num_samples, 2000000);
+	srd_init(DECODERS_TESTDIR);
+	plain = uart_decode(buf, num_samples, 2000000, 1);
+	decimated = uart_decode(buf, num_samples, 2000000, 2);
+	srd_exit();
+
+	fail_unless(plain->len > 0, "No annotations without decimation.");
+	fail_unless(plain->len == decimated->len, "Got %u annotations "
+		"instead of %u.", decimated->len, plain->len);
+	num_data = 0;
+	for (i = 0; i < plain->len; i++) {
+		sscanf(g_ptr_array_index(plain, i), "%" SCNu64 "-%" SCNu64
+			" %d %63s", &ss, &es, &cls, text);
+		sscanf(g_ptr_array_index(decimated, i), "%" SCNu64 "-%" SCNu64
+			" %d %63s", &ss_dec, &es_dec, &cls_dec, text_dec);
+		fail_unless(cls == cls_dec && !strcmp(text, text_dec),
+			"Annotation %u differs: '%s' vs. '%s'.", i,
+			(char *)g_ptr_array_index(plain, i),
+			(char *)g_ptr_array_index(decimated, i));
+		/* One decimated sample spans two input samples. */
+		fail_unless(ss_dec + 2 >= ss && ss_dec <= ss + 2 &&
+			es_dec + 2 >= es && es_dec <= es + 2,
+			"Annotation %u not in the input's timebase: '%s' vs. '%s'.",
+			i, (char *)g_ptr_array_index(plain, i),
+			(char *)g_ptr_array_index(decimated, i));
+		/* The first frame lacks a start edge, bytes 1..19 remain. */
+		if (cls == 0)
+			fail_unless(strtoul(text, NULL, 16) == ++num_data,
+				"Decoded byte %s instead of %02X.", text, num_data);
+	}
+	fail_unless(num_data == 19, "Decoded %u bytes instead of 19.", num_data);
+
+	g_ptr_array_free(plain, TRUE);
+	g_ptr_array_free(decimated, TRUE);
+	g_free(buf);
+}
+END_TEST
+
+/*
+ * Check whether output types and classes can be enabled and disabled,
+ * and whether invalid ones are rejected.
+ */
+START_TEST(test_inst_output_enable)
+{
+	int ret;
+	struct srd_session *sess;
+	struct srd_decoder_inst *inst;
+
+	srd_init(DECODERS_TESTDIR);
+	srd_decoder_load_all();
+	srd_session_new(&sess);
+	inst = srd_inst_new(sess, "uart", NULL);
+
+	ret = srd_inst_output_type_enable(inst, SRD_OUTPUT_BINARY, FALSE);
+	fail_unless(ret == SRD_OK, "srd_inst_output_type_enable() failed: %d.", ret);
+	ret = srd_inst_output_type_enable(inst, SRD_OUTPUT_BINARY, TRUE);
+	fail_unless(ret == SRD_OK, "srd_inst_output_type_enable() failed: %d.", ret);
+	ret = srd_inst_output_type_enable(inst, SRD_OUTPUT_PYTHON, FALSE);
+	fail_unless(ret != SRD_OK, "Disabling SRD_OUTPUT_PYTHON worked.");
+	ret = srd_inst_output_type_enable(inst, -1, FALSE);
+	fail_unless(ret != SRD_OK, "Disabling output type -1 worked.");
+	ret = srd_inst_output_type_enable(NULL, SRD_OUTPUT_ANN, FALSE);
+	fail_unless(ret != SRD_OK, "srd_inst_output_type_enable(NULL) worked.");
+
+	ret = srd_inst_ann_class_enable(inst, 0, FALSE);
+	fail_unless(ret == SRD_OK, "srd_inst_ann_class_enable() failed: %d.", ret);
+	ret = srd_inst_ann_class_enable(inst, 1000, FALSE);
+	fail_unless(ret != SRD_OK, "Disabling annotation class 1000 worked.");
+	ret = srd_inst_ann_row_enable(inst, 0, FALSE);
+	fail_unless(ret == SRD_OK, "srd_inst_ann_row_enable() failed: %d.", ret);
+	ret = srd_inst_ann_row_enable(inst, -1, FALSE);
+	fail_unless(ret != SRD_OK, "Disabling annotation row -1 worked.");
+	ret = srd_inst_binary_class_enable(inst, 0, FALSE);
+	fail_unless(ret == SRD_OK, "srd_inst_binary_class_enable() failed: %d.", ret);
+	ret = srd_inst_binary_class_enable(inst, 1000, FALSE);
+	fail_unless(ret != SRD_OK, "Disabling binary class 1000 worked.");
+
+	srd_exit();
+}
+END_TEST
+
 Suite *suite_inst(void)
 {
 	Suite *s;
@@ -159,5 +320,16 @@ Suite *suite_inst(void)
 	tcase_add_test(tc, test_inst_option_set_bogus);
 	suite_add_tcase(s, tc);
 
+	tc = tcase_create("decimation");
+	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
+	tcase_add_test(tc, test_inst_decimation_set);
+	tcase_add_test(tc, test_inst_decimation_decode);
+	suite_add_tcase(s, tc);
+
+	tc = tcase_create("output_enable");
+	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
+	tcase_add_test(tc, test_inst_output_enable);
+	suite_add_tcase(s, tc);
+
 	return s;
 }
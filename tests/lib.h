@@ -22,6 +22,12 @@
 
 void srdtest_setup(void);
 void srdtest_teardown(void);
+struct srd_decoder_inst *srdtest_uart_inst_new(struct srd_session *sess,
+		uint64_t samplerate);
+void srdtest_uart_frames_gen(uint8_t *buf, uint64_t num_samples,
+		uint64_t samplerate);
+void srdtest_ann_collect(struct srd_proto_data *pdata, void *cb_data);
+gboolean srdtest_ann_lists_equal(GPtrArray *a, GPtrArray *b);
 
 Suite *suite_core(void);
 Suite *suite_decoder(void);
@@ -19,7 +19,9 @@
 
 #include <config.h>
 #include <libsigrokdecode.h> /* First, to avoid compiler warning. */
+#include <inttypes.h>
 #include <stdlib.h>
+#include <string.h>
 #include <check.h>
 #include "lib.h"
 
@@ -33,6 +35,79 @@ void srdtest_teardown(void)
 {
 }
 
+/* Create a uart instance, with the default options and a samplerate. */
+struct srd_decoder_inst *srdtest_uart_inst_new(struct srd_session *sess,
+		uint64_t samplerate)
+{
+	struct srd_decoder_inst *di;
+	GHashTable *options;
+
+	srd_decoder_load("uart");
+	options = g_hash_table_new_full(g_str_hash, g_str_equal, g_free,
+			(GDestroyNotify)g_variant_unref);
+	di = srd_inst_new(sess, "uart", options);
+	g_hash_table_destroy(options);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+		g_variant_new_uint64(samplerate));
+
+	return di;
+}
+
+/* Generate UART frames of the byte values 0..255 on channel 0, at 115200 baud. */
+void srdtest_uart_frames_gen(uint8_t *buf, uint64_t num_samples,
+		uint64_t samplerate)
+{
+	uint64_t i, frame_len, pos;
+	double bit_width;
+	unsigned int byte;
+
+	/* Both channels idle high. */
+	memset(buf, 0x03, num_samples);
+	bit_width = (double)samplerate / 115200;
+	/* Start bit, 8 data bits, stop bit, and some idle time. */
+	frame_len = 13 * bit_width;
+	for (i = 0; i + frame_len <= num_samples; i += frame_len) {
+		byte = (i / frame_len) & 0xff;
+		for (pos = 0; pos < 9 * bit_width; pos++) {
+			if (pos < bit_width || !(byte & (1 << (int)(pos / bit_width - 1))))
+				buf[i + pos] &= ~0x01;
+		}
+	}
+}
+
+/* Output callback which collects annotations as strings in a GPtrArray. */
+void srdtest_ann_collect(struct srd_proto_data *pdata, void *cb_data)
+{
+	struct srd_proto_data_annotation *pda;
+
+	pda = pdata->data;
+	g_ptr_array_add(cb_data, g_strdup_printf("%" PRIu64 "-%" PRIu64 " %d %s",
+		pdata->start_sample, pdata->end_sample, pda->ann_class,
+		pda->ann_text[0]));
+}
+
+static gint ann_compare(gconstpointer a, gconstpointer b)
+{
+	return strcmp(*(const char **)a, *(const char **)b);
+}
+
+/* Check whether two lists of annotations match, regardless of their order. */
+gboolean srdtest_ann_lists_equal(GPtrArray *a, GPtrArray *b)
+{
+	unsigned int i;
+
+	if (a->len != b->len)
+		return FALSE;
+	g_ptr_array_sort(a, ann_compare);
+	g_ptr_array_sort(b, ann_compare);
+	for (i = 0; i < a->len; i++) {
+		if (strcmp(g_ptr_array_index(a, i), g_ptr_array_index(b, i)) != 0)
+			return FALSE;
+	}
+
+	return TRUE;
+}
+
 int main(void)
 {
 	int ret;
@@ -20,8 +20,12 @@
 #include <config.h>
 #include <libsigrokdecode-internal.h> /* First, to avoid compiler warning. */
 #include <libsigrokdecode.h>
+#include <inttypes.h>
 #include <stdint.h>
 #include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+#include <glib/gstdio.h>
 #include <check.h>
 #include "lib.h"
 
@@ -230,6 +234,62 @@ START_TEST(test_session_metadata_set_bogus)
 }
 END_TEST
 
+static void ann_batch_cb(struct srd_proto_data *pdata, unsigned int num_pdata,
+		void *cb_data)
+{
+	(void)pdata;
+	(void)num_pdata;
+	(void)cb_data;
+}
+
+/*
+ * Check whether srd_pd_annotation_batch_callback_set() works, and fails
+ * without a session.
+ */
+START_TEST(test_pd_annotation_batch_callback_set)
+{
+	int ret;
+	struct srd_session *sess;
+
+	srd_init(NULL);
+	srd_session_new(&sess);
+	ret = srd_pd_annotation_batch_callback_set(sess, ann_batch_cb, NULL, 0);
+	fail_unless(ret == SRD_OK, "srd_pd_annotation_batch_callback_set() failed: %d.", ret);
+	ret = srd_pd_annotation_batch_callback_set(sess, ann_batch_cb, NULL, 1);
+	fail_unless(ret == SRD_OK, "srd_pd_annotation_batch_callback_set() failed: %d.", ret);
+	ret = srd_pd_annotation_batch_callback_set(sess, NULL, NULL, 0);
+	fail_unless(ret == SRD_OK, "srd_pd_annotation_batch_callback_set(cb NULL) failed: %d.", ret);
+	ret = srd_pd_annotation_batch_callback_set(NULL, ann_batch_cb, NULL, 0);
+	fail_unless(ret != SRD_OK, "srd_pd_annotation_batch_callback_set(NULL) worked.");
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether srd_session_lazy_ann_text_set() works, and fails without
+ * a session.
+ */
+START_TEST(test_session_lazy_ann_text_set)
+{
+	int ret;
+	struct srd_session *sess;
+
+	srd_init(NULL);
+	srd_session_new(&sess);
+	ret = srd_session_lazy_ann_text_set(sess, TRUE);
+	fail_unless(ret == SRD_OK, "srd_session_lazy_ann_text_set() failed: %d.", ret);
+	ret = srd_session_lazy_ann_text_set(sess, FALSE);
+	fail_unless(ret == SRD_OK, "srd_session_lazy_ann_text_set() failed: %d.", ret);
+	ret = srd_session_lazy_ann_text_set(NULL, TRUE);
+	fail_unless(ret != SRD_OK, "srd_session_lazy_ann_text_set(NULL) worked.");
+	fail_unless(srd_annotation_text_get(NULL) == NULL,
+		"srd_annotation_text_get(NULL) worked.");
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
 /*
  * Check whether srd_session_terminate_reset() succeeds on newly created
  * sessions, as well as after calling start() and meta(). No data is fed
@@ -260,6 +320,581 @@ START_TEST(test_session_reset_nodata)
 }
 END_TEST
 
+/*
+ * Check whether srd_session_queue_depth_set() works.
+ * If it returns != SRD_OK (or segfaults) this test will fail.
+ */
+START_TEST(test_session_queue_depth_set)
+{
+	int ret;
+	struct srd_session *sess;
+
+	srd_init(NULL);
+	srd_session_new(&sess);
+	ret = srd_session_queue_depth_set(sess, 1, TRUE);
+	fail_unless(ret == SRD_OK, "srd_session_queue_depth_set() failed: %d.", ret);
+	ret = srd_session_queue_depth_set(sess, 1000, FALSE);
+	fail_unless(ret == SRD_OK, "srd_session_queue_depth_set() failed: %d.", ret);
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether srd_session_queue_depth_set() fails with invalid input.
+ * If it returns SRD_OK (or segfaults) this test will fail.
+ */
+START_TEST(test_session_queue_depth_set_bogus)
+{
+	int ret;
+	struct srd_session *sess;
+
+	srd_init(NULL);
+	srd_session_new(&sess);
+	ret = srd_session_queue_depth_set(NULL, 1, TRUE);
+	fail_unless(ret != SRD_OK, "srd_session_queue_depth_set(NULL) worked.");
+	ret = srd_session_queue_depth_set(sess, 0, TRUE);
+	fail_unless(ret != SRD_OK, "srd_session_queue_depth_set(0) worked.");
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+static void chunk_release(const uint8_t *inbuf, void *cb_data)
+{
+	(void)inbuf;
+
+	(*(int *)cb_data)++;
+}
+
+/*
+ * Check whether chunks which are sent by srd_session_send_async() get
+ * released by the time srd_session_send_wait() returns. Errors of queued
+ * chunks must be reported by srd_session_send_eof(), and must not leak
+ * into the next run after srd_session_terminate_reset().
+ */
+START_TEST(test_session_send_async)
+{
+	int ret, num_released;
+	uint64_t i;
+	uint8_t buf[64];
+	struct srd_session *sess;
+
+	memset(buf, 0, sizeof(buf));
+	srd_init(DECODERS_TESTDIR);
+	srd_session_new(&sess);
+	srd_session_queue_depth_set(sess, 2, TRUE);
+	srd_session_start(sess);
+	num_released = 0;
+	for (i = 0; i < 10; i++) {
+		ret = srd_session_send_async(sess, i * sizeof(buf),
+			(i + 1) * sizeof(buf), buf, sizeof(buf), 1,
+			chunk_release, &num_released);
+		fail_unless(ret == SRD_OK, "srd_session_send_async() failed: %d.", ret);
+	}
+	ret = srd_session_send_wait(sess);
+	fail_unless(ret == SRD_OK, "srd_session_send_wait() failed: %d.", ret);
+	fail_unless(num_released == 10, "Only %d chunks released.", num_released);
+	srd_session_destroy(sess);
+
+	srd_session_new(&sess);
+	srdtest_uart_inst_new(sess, 1000000);
+	srd_session_start(sess);
+	ret = srd_session_send_async(sess, 0, sizeof(buf), buf, sizeof(buf), 1,
+		NULL, NULL);
+	fail_unless(ret == SRD_OK, "srd_session_send_async() failed: %d.", ret);
+	/* The sample numbers of this chunk don't follow the first one's. */
+	ret = srd_session_send_async(sess, 2 * sizeof(buf), 3 * sizeof(buf),
+		buf, sizeof(buf), 1, NULL, NULL);
+	fail_unless(ret == SRD_OK, "srd_session_send_async() failed: %d.", ret);
+	ret = srd_session_send_eof(sess);
+	fail_unless(ret != SRD_OK, "srd_session_send_eof() after a bad chunk worked.");
+	ret = srd_session_terminate_reset(sess);
+	fail_unless(ret == SRD_OK, "srd_session_terminate_reset() failed: %d.", ret);
+	srd_session_metadata_set(sess, SRD_CONF_SAMPLERATE,
+		g_variant_new_uint64(1000000));
+	srd_session_start(sess);
+	ret = srd_session_send(sess, 0, sizeof(buf), buf, sizeof(buf), 1);
+	fail_unless(ret == SRD_OK, "srd_session_send() after reset failed: %d.", ret);
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether srd_session_send_async() fails with invalid input.
+ * If it returns SRD_OK (or segfaults) this test will fail.
+ */
+START_TEST(test_session_send_async_bogus)
+{
+	int ret;
+	uint8_t buf[64];
+	struct srd_session *sess;
+
+	srd_init(NULL);
+	srd_session_new(&sess);
+	ret = srd_session_send_async(NULL, 0, sizeof(buf), buf, sizeof(buf), 1, NULL, NULL);
+	fail_unless(ret != SRD_OK, "srd_session_send_async(NULL) worked.");
+	ret = srd_session_send_async(sess, 0, sizeof(buf), NULL, sizeof(buf), 1, NULL, NULL);
+	fail_unless(ret != SRD_OK, "srd_session_send_async() with NULL buffer worked.");
+	ret = srd_session_send_async(sess, 0, sizeof(buf), buf, sizeof(buf), 0, NULL, NULL);
+	fail_unless(ret != SRD_OK, "srd_session_send_async() with unitsize 0 worked.");
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+/*
+ * Check whether srd_session_shard_options_set() fails with invalid input.
+ * If it returns SRD_OK (or segfaults) this test will fail.
+ */
+START_TEST(test_session_shard_options_set_bogus)
+{
+	int ret;
+	struct srd_session *sess;
+
+	srd_init(NULL);
+	srd_session_new(&sess);
+	ret = srd_session_shard_options_set(sess, 1000, 100, 2);
+	fail_unless(ret == SRD_OK, "srd_session_shard_options_set() failed: %d.", ret);
+	ret = srd_session_shard_options_set(NULL, 1000, 100, 2);
+	fail_unless(ret != SRD_OK, "srd_session_shard_options_set(NULL) worked.");
+	ret = srd_session_shard_options_set(sess, 0, 100, 2);
+	fail_unless(ret != SRD_OK, "srd_session_shard_options_set() with segment size 0 worked.");
+	ret = srd_session_shard_options_set(sess, 1000, 100, 0);
+	fail_unless(ret != SRD_OK, "srd_session_shard_options_set() with 0 threads worked.");
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
+/* Decode a uart capture with srd_session_send(), collect the annotations. */
+static GPtrArray *uart_decode_send(const uint8_t *buf, uint64_t num_samples)
+{
+	int ret;
+	GPtrArray *anns;
+	struct srd_session *sess;
+
+	anns = g_ptr_array_new_with_free_func(g_free);
+	srd_session_new(&sess);
+	srdtest_uart_inst_new(sess, 1000000);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, srdtest_ann_collect, anns);
+	srd_session_start(sess);
+	ret = srd_session_send(sess, 0, num_samples, buf, num_samples, 1);
+	fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.", ret);
+	ret = srd_session_send_eof(sess);
+	fail_unless(ret == SRD_OK, "srd_session_send_eof() failed: %d.", ret);
+	srd_session_destroy(sess);
+	fail_unless(anns->len > 0, "srd_session_send() yielded no annotations.");
+
+	return anns;
+}
+
+static void stitch_collect(uint64_t samplenum, uint64_t decode_start,
+		void *cb_data)
+{
+	g_array_append_val(cb_data, samplenum);
+	g_array_append_val(cb_data, decode_start);
+}
+
+/*
+ * Check whether srd_session_send_sharded() yields the same annotations
+ * as srd_session_send() of the same capture, reports the segments'
+ * boundaries, and fails with invalid input. Annotations around the
+ * segments' boundaries may arrive in a different order, since they're
+ * passed on in the order of their start segment.
+ */
+START_TEST(test_session_send_sharded)
+{
+	int ret;
+	uint8_t *buf;
+	uint64_t num_samples, i;
+	GArray *stitches;
+	GPtrArray *plain, *sharded;
+	struct srd_session *sess;
+
+	num_samples = 100000;
+	buf = g_malloc(num_samples);
+	srdtest_uart_frames_gen(buf, num_samples, 1000000);
+	sharded = g_ptr_array_new_with_free_func(g_free);
+	srd_init(DECODERS_TESTDIR);
+	plain = uart_decode_send(buf, num_samples);
+
+	srd_session_new(&sess);
+	srdtest_uart_inst_new(sess, 1000000);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, srdtest_ann_collect, sharded);
+	srd_session_shard_options_set(sess, 7000, 2000, 3);
+	stitches = g_array_new(FALSE, FALSE, sizeof(uint64_t));
+	ret = srd_session_stitch_callback_set(sess, stitch_collect, stitches);
+	fail_unless(ret == SRD_OK, "srd_session_stitch_callback_set() failed: %d.", ret);
+	srd_session_start(sess);
+	ret = srd_session_send_sharded(sess, buf, num_samples, 1);
+	fail_unless(ret == SRD_OK, "srd_session_send_sharded() failed: %d.", ret);
+	fail_unless(srdtest_ann_lists_equal(plain, sharded),
+		"srd_session_send_sharded() annotations differ.");
+	/* Segments start at multiples of 7000, decoding 2000 samples earlier. */
+	fail_unless(stitches->len == 2 * 14, "Got %u stitches instead of 14.",
+		stitches->len / 2);
+	for (i = 0; i < stitches->len / 2; i++) {
+		fail_unless(g_array_index(stitches, uint64_t, 2 * i) == (i + 1) * 7000 &&
+			g_array_index(stitches, uint64_t, 2 * i + 1) == (i + 1) * 7000 - 2000,
+			"Stitch %" PRIu64 " at sample %" PRIu64 " (from %" PRIu64 ").", i,
+			g_array_index(stitches, uint64_t, 2 * i),
+			g_array_index(stitches, uint64_t, 2 * i + 1));
+	}
+	ret = srd_session_stitch_callback_set(NULL, stitch_collect, stitches);
+	fail_unless(ret != SRD_OK, "srd_session_stitch_callback_set(NULL) worked.");
+	ret = srd_session_send_sharded(sess, NULL, num_samples, 1);
+	fail_unless(ret != SRD_OK, "srd_session_send_sharded() with NULL buffer worked.");
+	ret = srd_session_send_sharded(sess, buf, num_samples, 0);
+	fail_unless(ret != SRD_OK, "srd_session_send_sharded() with unitsize 0 worked.");
+	srd_session_destroy(sess);
+
+	srd_exit();
+	g_ptr_array_free(plain, TRUE);
+	g_ptr_array_free(sharded, TRUE);
+	g_array_free(stitches, TRUE);
+	g_free(buf);
+}
+END_TEST
+
+/*
+ * Check whether srd_session_send_rle() yields the same annotations as
+ * srd_session_send() of the same capture, and fails with invalid input.
+ */
+START_TEST(test_session_send_rle)
+{
+	int ret;
+	uint8_t values[3] = { 0x00, 0x01, 0x00 }, *buf, *run_values;
+	uint64_t lengths[3] = { 1000, 1, 1000000 }, bad_lengths[3] = { 1, 0, 1 };
+	uint64_t *run_lengths, num_samples, num_runs, half, half_samples, i;
+	GPtrArray *plain, *rle;
+	struct srd_session *sess;
+
+	num_samples = 100000;
+	buf = g_malloc(num_samples);
+	srdtest_uart_frames_gen(buf, num_samples, 1000000);
+	run_values = g_malloc(num_samples);
+	run_lengths = g_malloc(num_samples * sizeof(uint64_t));
+	num_runs = 0;
+	for (i = 0; i < num_samples; i++) {
+		if (num_runs && buf[i] == run_values[num_runs - 1]) {
+			run_lengths[num_runs - 1]++;
+			continue;
+		}
+		run_values[num_runs] = buf[i];
+		run_lengths[num_runs++] = 1;
+	}
+	rle = g_ptr_array_new_with_free_func(g_free);
+	srd_init(DECODERS_TESTDIR);
+	plain = uart_decode_send(buf, num_samples);
+
+	/* Send the runs in two chunks, which split a frame. */
+	half = num_runs / 2;
+	half_samples = 0;
+	for (i = 0; i < half; i++)
+		half_samples += run_lengths[i];
+	srd_session_new(&sess);
+	srdtest_uart_inst_new(sess, 1000000);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, srdtest_ann_collect, rle);
+	srd_session_start(sess);
+	ret = srd_session_send_rle(sess, 0, run_values, run_lengths, half, 1);
+	fail_unless(ret == SRD_OK, "srd_session_send_rle() failed: %d.", ret);
+	ret = srd_session_send_rle(sess, half_samples, run_values + half,
+		run_lengths + half, num_runs - half, 1);
+	fail_unless(ret == SRD_OK, "srd_session_send_rle() failed: %d.", ret);
+	ret = srd_session_send_eof(sess);
+	fail_unless(ret == SRD_OK, "srd_session_send_eof() failed: %d.", ret);
+	srd_session_destroy(sess);
+	fail_unless(srdtest_ann_lists_equal(plain, rle),
+		"srd_session_send_rle() annotations differ.");
+
+	srd_session_new(&sess);
+	srd_session_start(sess);
+	ret = srd_session_send_rle(sess, 0, values, lengths, 3, 1);
+	fail_unless(ret == SRD_OK, "srd_session_send_rle() failed: %d.", ret);
+	ret = srd_session_send_rle(NULL, 0, values, lengths, 3, 1);
+	fail_unless(ret != SRD_OK, "srd_session_send_rle(NULL) worked.");
+	ret = srd_session_send_rle(sess, 0, NULL, lengths, 3, 1);
+	fail_unless(ret != SRD_OK, "srd_session_send_rle() with NULL values worked.");
+	ret = srd_session_send_rle(sess, 0, values, lengths, 0, 1);
+	fail_unless(ret != SRD_OK, "srd_session_send_rle() without runs worked.");
+	ret = srd_session_send_rle(sess, 0, values, bad_lengths, 3, 1);
+	fail_unless(ret != SRD_OK, "srd_session_send_rle() with empty run worked.");
+	srd_session_destroy(sess);
+	srd_exit();
+
+	g_ptr_array_free(plain, TRUE);
+	g_ptr_array_free(rle, TRUE);
+	g_free(run_lengths);
+	g_free(run_values);
+	g_free(buf);
+}
+END_TEST
+
+/*
+ * Check whether srd_session_send_planar() yields the same annotations as
+ * srd_session_send() of the same capture, and fails with invalid input.
+ */
+START_TEST(test_session_send_planar)
+{
+	int ret;
+	unsigned int ch;
+	uint8_t plane[128] = { 0 }, *buf, *capture_planes[2];
+	const uint8_t *planes[3] = { plane, NULL, plane }, *chunk_planes[2];
+	uint64_t num_samples, half, i;
+	GPtrArray *plain, *planar;
+	struct srd_session *sess;
+
+	num_samples = 100000;
+	buf = g_malloc(num_samples);
+	srdtest_uart_frames_gen(buf, num_samples, 1000000);
+	for (ch = 0; ch < 2; ch++) {
+		capture_planes[ch] = g_malloc0((num_samples + 7) / 8);
+		for (i = 0; i < num_samples; i++) {
+			if (buf[i] & (1 << ch))
+				capture_planes[ch][i / 8] |= 1 << (i % 8);
+		}
+	}
+	planar = g_ptr_array_new_with_free_func(g_free);
+	srd_init(DECODERS_TESTDIR);
+	plain = uart_decode_send(buf, num_samples);
+
+	/* Send the planes in two chunks, which split a frame. */
+	half = num_samples / 2;
+	srd_session_new(&sess);
+	srdtest_uart_inst_new(sess, 1000000);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, srdtest_ann_collect, planar);
+	srd_session_start(sess);
+	for (ch = 0; ch < 2; ch++)
+		chunk_planes[ch] = capture_planes[ch];
+	ret = srd_session_send_planar(sess, 0, half, chunk_planes, 2);
+	fail_unless(ret == SRD_OK, "srd_session_send_planar() failed: %d.", ret);
+	for (ch = 0; ch < 2; ch++)
+		chunk_planes[ch] = capture_planes[ch] + half / 8;
+	ret = srd_session_send_planar(sess, half, num_samples, chunk_planes, 2);
+	fail_unless(ret == SRD_OK, "srd_session_send_planar() failed: %d.", ret);
+	ret = srd_session_send_eof(sess);
+	fail_unless(ret == SRD_OK, "srd_session_send_eof() failed: %d.", ret);
+	srd_session_destroy(sess);
+	fail_unless(srdtest_ann_lists_equal(plain, planar),
+		"srd_session_send_planar() annotations differ.");
+
+	srd_session_new(&sess);
+	srd_session_start(sess);
+	ret = srd_session_send_planar(sess, 0, 1000, planes, 3);
+	fail_unless(ret == SRD_OK, "srd_session_send_planar() failed: %d.", ret);
+	ret = srd_session_send_planar(NULL, 0, 1000, planes, 3);
+	fail_unless(ret != SRD_OK, "srd_session_send_planar(NULL) worked.");
+	ret = srd_session_send_planar(sess, 0, 1000, NULL, 3);
+	fail_unless(ret != SRD_OK, "srd_session_send_planar() with NULL planes worked.");
+	ret = srd_session_send_planar(sess, 0, 1000, planes, 0);
+	fail_unless(ret != SRD_OK, "srd_session_send_planar() without planes worked.");
+	ret = srd_session_send_planar(sess, 1000, 1000, planes, 3);
+	fail_unless(ret != SRD_OK, "srd_session_send_planar() without samples worked.");
+	srd_session_destroy(sess);
+	srd_exit();
+
+	g_ptr_array_free(plain, TRUE);
+	g_ptr_array_free(planar, TRUE);
+	for (ch = 0; ch < 2; ch++)
+		g_free(capture_planes[ch]);
+	g_free(buf);
+}
+END_TEST
+
+/*
+ * Check whether srd_session_send_file() yields the same annotations as
+ * srd_session_send() of the same capture behind a file header, and fails
+ * with invalid input.
+ */
+START_TEST(test_session_send_file)
+{
+	int ret, fd;
+	gchar *filename;
+	uint8_t *contents;
+	uint64_t num_samples, header_len;
+	GPtrArray *plain, *file;
+	struct srd_session *sess;
+
+	num_samples = 100000;
+	header_len = 37;
+	contents = g_malloc(header_len + num_samples);
+	memset(contents, 0xa5, header_len);
+	srdtest_uart_frames_gen(contents + header_len, num_samples, 1000000);
+	fd = g_file_open_tmp("srd-test-XXXXXX", &filename, NULL);
+	fail_unless(fd >= 0, "Failed to create a temporary file.");
+	close(fd);
+	fail_unless(g_file_set_contents(filename, (const gchar *)contents,
+		header_len + num_samples, NULL), "Failed to write a temporary file.");
+	file = g_ptr_array_new_with_free_func(g_free);
+	srd_init(DECODERS_TESTDIR);
+	plain = uart_decode_send(contents + header_len, num_samples);
+
+	srd_session_new(&sess);
+	srdtest_uart_inst_new(sess, 1000000);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, srdtest_ann_collect, file);
+	srd_session_start(sess);
+	ret = srd_session_send_file(sess, filename, header_len, 1);
+	fail_unless(ret == SRD_OK, "srd_session_send_file() failed: %d.", ret);
+	ret = srd_session_send_eof(sess);
+	fail_unless(ret == SRD_OK, "srd_session_send_eof() failed: %d.", ret);
+	srd_session_destroy(sess);
+	fail_unless(srdtest_ann_lists_equal(plain, file),
+		"srd_session_send_file() annotations differ.");
+
+	srd_session_new(&sess);
+	srd_session_start(sess);
+	ret = srd_session_send_file(sess, filename, 16, 2);
+	fail_unless(ret == SRD_OK, "srd_session_send_file() failed: %d.", ret);
+	ret = srd_session_send_file(NULL, filename, 16, 2);
+	fail_unless(ret != SRD_OK, "srd_session_send_file(NULL) worked.");
+	ret = srd_session_send_file(sess, NULL, 16, 2);
+	fail_unless(ret != SRD_OK, "srd_session_send_file() without file worked.");
+	ret = srd_session_send_file(sess, filename, 16, 0);
+	fail_unless(ret != SRD_OK, "srd_session_send_file() with unitsize 0 worked.");
+	ret = srd_session_send_file(sess, filename, header_len + num_samples, 2);
+	fail_unless(ret != SRD_OK, "srd_session_send_file() past the end worked.");
+	ret = srd_session_send_file(sess, "/nonexistent/capture.bin", 0, 2);
+	fail_unless(ret != SRD_OK, "srd_session_send_file() with missing file worked.");
+	ret = srd_session_send_fd(sess, -1, 0, 2);
+	fail_unless(ret != SRD_OK, "srd_session_send_fd() with fd -1 worked.");
+	srd_session_destroy(sess);
+	srd_exit();
+
+	g_unlink(filename);
+	g_free(filename);
+	g_ptr_array_free(plain, TRUE);
+	g_ptr_array_free(file, TRUE);
+	g_free(contents);
+}
+END_TEST
+
+/* Decode a uart capture at 4MHz in chunks, through an input filter on channel 0. */
+static GPtrArray *uart_decode_filtered(const uint8_t *buf, uint64_t num_samples,
+		int filter_type, uint64_t width)
+{
+	int ret;
+	uint64_t i, chunk;
+	GPtrArray *anns;
+	struct srd_session *sess;
+
+	anns = g_ptr_array_new_with_free_func(g_free);
+	srd_session_new(&sess);
+	srdtest_uart_inst_new(sess, 4000000);
+	srd_pd_output_callback_add(sess, SRD_OUTPUT_ANN, srdtest_ann_collect, anns);
+	if (filter_type != SRD_FILTER_NONE) {
+		ret = srd_session_filter_set(sess, 0, filter_type, width);
+		fail_unless(ret == SRD_OK, "srd_session_filter_set() failed: %d.", ret);
+	}
+	srd_session_start(sess);
+	for (i = 0; i < num_samples; i += chunk) {
+		chunk = MIN(1000, num_samples - i);
+		ret = srd_session_send(sess, i, i + chunk, buf + i, chunk, 1);
+		fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.", ret);
+	}
+	ret = srd_session_send_eof(sess);
+	fail_unless(ret == SRD_OK, "srd_session_send_eof() failed: %d.", ret);
+	srd_session_destroy(sess);
+
+	return anns;
+}
+
+/*
+ * Check whether the input filters remove glitches from the samples which
+ * a uart decoder sees, and leave the clean signal alone. The capture ends
+ * shortly after the last frame's stop bit gets sampled, which the decoder
+ * only sees when the samples which the filters hold back get flushed at
+ * the end of the stream.
+ */
+START_TEST(test_session_filter_glitches)
+{
+	uint8_t *clean, *glitchy;
+	uint64_t num_samples, frame_len, i;
+	GPtrArray *anns_clean, *anns;
+
+	/* 40 frames, and the last one up to its stop bit's sample point. */
+	frame_len = 13 * 4000000.0 / 115200;
+	num_samples = 40 * frame_len + 9.5 * 4000000 / 115200 + 6;
+	clean = g_malloc(41 * frame_len);
+	srdtest_uart_frames_gen(clean, 41 * frame_len, 4000000);
+	glitchy = g_malloc(num_samples);
+	memcpy(glitchy, clean, num_samples);
+	for (i = 0; i + frame_len <= num_samples; i += frame_len) {
+		/* A 1-sample pulse in the idle time (a false start bit)... */
+		glitchy[i + 11 * frame_len / 13] &= ~0x01;
+		/* ...and a 3-sample pulse within the start bit. */
+		glitchy[i + 10] ^= 0x01;
+		glitchy[i + 11] ^= 0x01;
+		glitchy[i + 12] ^= 0x01;
+	}
+
+	srd_init(DECODERS_TESTDIR);
+	anns_clean = uart_decode_filtered(clean, num_samples, SRD_FILTER_NONE, 0);
+	fail_unless(anns_clean->len > 0, "No annotations for the clean signal.");
+
+	anns = uart_decode_filtered(glitchy, num_samples, SRD_FILTER_NONE, 0);
+	fail_unless(!srdtest_ann_lists_equal(anns_clean, anns),
+		"The glitches didn't affect the unfiltered decoder.");
+	g_ptr_array_free(anns, TRUE);
+
+	anns = uart_decode_filtered(glitchy, num_samples, SRD_FILTER_MIN_WIDTH, 8);
+	fail_unless(srdtest_ann_lists_equal(anns_clean, anns),
+		"SRD_FILTER_MIN_WIDTH didn't remove the glitches.");
+	g_ptr_array_free(anns, TRUE);
+
+	anns = uart_decode_filtered(glitchy, num_samples, SRD_FILTER_MAJORITY, 11);
+	fail_unless(srdtest_ann_lists_equal(anns_clean, anns),
+		"SRD_FILTER_MAJORITY didn't remove the glitches.");
+	g_ptr_array_free(anns, TRUE);
+	srd_exit();
+
+	g_ptr_array_free(anns_clean, TRUE);
+	g_free(glitchy);
+	g_free(clean);
+}
+END_TEST
+
+/*
+ * Check whether srd_session_filter_set() works, and fails with invalid
+ * input or while decoding.
+ */
+START_TEST(test_session_filter_set)
+{
+	int ret;
+	uint8_t buf[100] = { 0 };
+	struct srd_session *sess;
+
+	srd_init(NULL);
+	srd_session_new(&sess);
+	ret = srd_session_filter_set(sess, 0, SRD_FILTER_MIN_WIDTH, 5);
+	fail_unless(ret == SRD_OK, "srd_session_filter_set() failed: %d.", ret);
+	ret = srd_session_filter_set(sess, 1, SRD_FILTER_MAJORITY, 3);
+	fail_unless(ret == SRD_OK, "srd_session_filter_set() failed: %d.", ret);
+	ret = srd_session_filter_set(sess, 1, SRD_FILTER_NONE, 0);
+	fail_unless(ret == SRD_OK, "srd_session_filter_set() failed: %d.", ret);
+	ret = srd_session_filter_set(NULL, 0, SRD_FILTER_MIN_WIDTH, 5);
+	fail_unless(ret != SRD_OK, "srd_session_filter_set(NULL) worked.");
+	ret = srd_session_filter_set(sess, 0, SRD_FILTER_MIN_WIDTH, 0);
+	fail_unless(ret != SRD_OK, "srd_session_filter_set() with width 0 worked.");
+	ret = srd_session_filter_set(sess, 0, SRD_FILTER_MAJORITY, 4);
+	fail_unless(ret != SRD_OK, "srd_session_filter_set() with even window worked.");
+	ret = srd_session_filter_set(sess, 0, 1234, 5);
+	fail_unless(ret != SRD_OK, "srd_session_filter_set() with bogus type worked.");
+	srd_session_start(sess);
+	ret = srd_session_send(sess, 0, sizeof(buf), buf, sizeof(buf), 1);
+	fail_unless(ret == SRD_OK, "srd_session_send() failed: %d.", ret);
+	ret = srd_session_filter_set(sess, 0, SRD_FILTER_MIN_WIDTH, 10);
+	fail_unless(ret != SRD_OK, "srd_session_filter_set() while decoding worked.");
+	ret = srd_session_send_eof(sess);
+	fail_unless(ret == SRD_OK, "srd_session_send_eof() failed: %d.", ret);
+	ret = srd_session_filter_set(sess, 0, SRD_FILTER_MIN_WIDTH, 10);
+	fail_unless(ret == SRD_OK, "srd_session_filter_set() failed: %d.", ret);
+	srd_session_destroy(sess);
+	srd_exit();
+}
+END_TEST
+
 Suite *suite_session(void)
 {
 	Suite *s;
@@ -280,6 +915,35 @@ Suite *suite_session(void)
 	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
 	tcase_add_test(tc, test_session_metadata_set);
 	tcase_add_test(tc, test_session_metadata_set_bogus);
+	tcase_add_test(tc, test_pd_annotation_batch_callback_set);
+	tcase_add_test(tc, test_session_lazy_ann_text_set);
+	suite_add_tcase(s, tc);
+
+	tc = tcase_create("async");
+	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
+	tcase_add_test(tc, test_session_queue_depth_set);
+	tcase_add_test(tc, test_session_queue_depth_set_bogus);
+	tcase_add_test(tc, test_session_send_async);
+	tcase_add_test(tc, test_session_send_async_bogus);
+	suite_add_tcase(s, tc);
+
+	tc = tcase_create("sharded");
+	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
+	tcase_add_test(tc, test_session_shard_options_set_bogus);
+	tcase_add_test(tc, test_session_send_sharded);
+	suite_add_tcase(s, tc);
+
+	tc = tcase_create("layouts");
+	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
+	tcase_add_test(tc, test_session_send_rle);
+	tcase_add_test(tc, test_session_send_planar);
+	tcase_add_test(tc, test_session_send_file);
+	suite_add_tcase(s, tc);
+
+	tc = tcase_create("filter");
+	tcase_add_checked_fixture(tc, srdtest_setup, srdtest_teardown);
+	tcase_add_test(tc, test_session_filter_set);
+	tcase_add_test(tc, test_session_filter_glitches);
 	suite_add_tcase(s, tc);
 
 	tc = tcase_create("reset");
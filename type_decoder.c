@@ -22,13 +22,26 @@
 #include "libsigrokdecode.h"
 #include <inttypes.h>
 
-/** @cond PRIVATE */
-extern SRD_PRIV GSList *sessions;
-/** @endcond */
+/* The number of distinct .wait() arguments which get cached per instance. */
+#define CONDITION_CACHE_SIZE 8
 
-typedef struct {
-        PyObject_HEAD
-} srd_Decoder;
+/*
+ * The number of Python outputs which get passed on at once to stacked
+ * decoders which implement decode_batch().
+ */
+#define PYTHON_BATCH_SIZE 256
+
+/* Block size of the arena which holds batched annotations' texts. */
+#define ANN_BATCH_ARENA_SIZE (64 * 1024)
+
+/*
+ * The maximum number of distinct texts, and of distinct lists of texts,
+ * which get interned per instance. Texts beyond that, and lists with
+ * many texts, get copied for each annotation.
+ */
+#define ANN_TEXT_TABLE_SIZE 4096
+#define ANN_TEXT_MAX_VARIANTS 16
+#define ANN_TEXT_ARENA_SIZE (16 * 1024)
 
 /* This is only used for nicer srd_dbg() output. */
 SRD_PRIV const char *output_type_name(unsigned int idx)
@@ -45,39 +58,224 @@ SRD_PRIV const char *output_type_name(unsigned int idx)
 	return names[MIN(idx, G_N_ELEMENTS(names) - 1)];
 }
 
-static void release_annotation(struct srd_proto_data_annotation *pda)
+static void release_annotation(struct srd_proto_data_annotation *pda,
+		gboolean interned)
 {
-	if (!pda)
+	if (!pda || interned)
 		return;
 	if (pda->ann_text)
 		g_strfreev(pda->ann_text);
 }
 
-static int convert_annotation(struct srd_decoder_inst *di, PyObject *obj,
-		struct srd_proto_data *pdata)
+/* Python strings are looked up by their (cached) hash and their contents. */
+static guint ann_text_string_hash(gconstpointer key)
 {
-	PyObject *py_tmp;
-	struct srd_pd_output *pdo;
-	struct srd_proto_data_annotation *pda;
+	return (guint)PyObject_Hash((PyObject *)key);
+}
+
+static gboolean ann_text_string_equal(gconstpointer a, gconstpointer b)
+{
+	return a == b || PyUnicode_Compare((PyObject *)a, (PyObject *)b) == 0;
+}
+
+/* Lists of interned texts are looked up by the texts' addresses. */
+static guint ann_text_list_hash(gconstpointer key)
+{
+	const char *const *text;
+	guint hash;
+
+	hash = 0;
+	for (text = key; *text; text++)
+		hash = hash * 31 + g_direct_hash(*text);
+
+	return hash;
+}
+
+static gboolean ann_text_list_equal(gconstpointer a, gconstpointer b)
+{
+	const char *const *text_a, *const *text_b;
+
+	for (text_a = a, text_b = b; *text_a && *text_a == *text_b; text_a++, text_b++)
+		;
+
+	return *text_a == *text_b;
+}
+
+/*
+ * Look up an annotation's list of texts in the instance's table, and
+ * add it when it's new. Returns NULL for texts which don't get interned.
+ * The caller must hold the Python interpreter lock.
+ */
+static char **intern_annotation_text(struct srd_decoder_inst *di,
+		PyObject *py_texts)
+{
+	struct srd_ann_text_table *table;
+	PyObject *py_item, *py_bytes;
+	Py_ssize_t num_texts, i;
+	char *texts[ANN_TEXT_MAX_VARIANTS + 1], *str, **list;
+
+	num_texts = PyList_Size(py_texts);
+	if (num_texts > ANN_TEXT_MAX_VARIANTS)
+		return NULL;
+
+	if (!(table = di->ann_texts)) {
+		table = g_malloc(sizeof(*table));
+		table->strings = g_hash_table_new_full(ann_text_string_hash,
+			ann_text_string_equal, (GDestroyNotify)Py_DecRef, NULL);
+		table->lists = g_hash_table_new_full(ann_text_list_hash,
+			ann_text_list_equal, g_free, NULL);
+		table->arena = g_string_chunk_new(ANN_TEXT_ARENA_SIZE);
+		di->ann_texts = table;
+	}
+
+	for (i = 0; i < num_texts; i++) {
+		py_item = PyList_GetItem(py_texts, i);
+		/* Subclasses might compare differently. */
+		if (!PyUnicode_CheckExact(py_item))
+			return NULL;
+		if ((str = g_hash_table_lookup(table->strings, py_item))) {
+			texts[i] = str;
+			continue;
+		}
+		if (g_hash_table_size(table->strings) >= ANN_TEXT_TABLE_SIZE)
+			return NULL;
+		if (!(py_bytes = PyUnicode_AsUTF8String(py_item))) {
+			/* Copying the texts reports the error. */
+			PyErr_Clear();
+			return NULL;
+		}
+		str = g_string_chunk_insert(table->arena, PyBytes_AsString(py_bytes));
+		Py_DECREF(py_bytes);
+		Py_INCREF(py_item);
+		g_hash_table_insert(table->strings, py_item, str);
+		texts[i] = str;
+	}
+	texts[num_texts] = NULL;
+
+	if (!(list = g_hash_table_lookup(table->lists, texts))) {
+		if (g_hash_table_size(table->lists) >= ANN_TEXT_TABLE_SIZE)
+			return NULL;
+		list = g_malloc(sizeof(*list) * (num_texts + 1));
+		memcpy(list, texts, sizeof(*list) * (num_texts + 1));
+		g_hash_table_insert(table->lists, list, list);
+	}
+
+	return list;
+}
+
+/* An annotation as it was submitted by a decoder, see parse_annotation(). */
+struct annotation {
 	int ann_class;
-	char **ann_text;
-	PyGILState_STATE gstate;
+	/* The list of texts (a borrowed reference), or NULL if formatted. */
+	PyObject *py_texts;
+	/* The text format and its values, or -1 for plain texts. */
+	int format;
+	unsigned int num_values;
+	int64_t values[ANN_FORMAT_MAX_VALUES];
+};
 
-	gstate = PyGILState_Ensure();
+/* Convert one of a formatted annotation's values. */
+static int parse_annotation_value(PyObject *py_value, int64_t *value)
+{
+	if (!PyLong_Check(py_value))
+		return SRD_ERR_PYTHON;
+
+	*value = PyLong_AsLongLong(py_value);
+	if (*value == -1 && PyErr_Occurred()) {
+		/* Accept the full range of unsigned 64-bit values, too. */
+		PyErr_Clear();
+		*value = (int64_t)PyLong_AsUnsignedLongLong(py_value);
+		if (PyErr_Occurred()) {
+			PyErr_Clear();
+			return SRD_ERR_PYTHON;
+		}
+	}
+
+	return SRD_OK;
+}
+
+/*
+ * Check a formatted annotation's format and values, the second and third
+ * element of [annotation class, format, value or tuple of values].
+ */
+static int parse_annotation_format(struct srd_decoder_inst *di, PyObject *obj,
+		struct annotation *ann)
+{
+	PyObject *py_tmp, *py_value;
+	struct srd_ann_format *fmt;
+	Py_ssize_t num_values, i;
+
+	py_tmp = PyList_GetItem(obj, 1);
+	if (!PyLong_Check(py_tmp)) {
+		srd_err("Protocol decoder %s submitted annotation list, but "
+			"second element was not an integer.", di->decoder->name);
+		return SRD_ERR_PYTHON;
+	}
+	ann->format = PyLong_AsLong(py_tmp);
+	if (!di->ann_formats || ann->format < 0 ||
+			(unsigned int)ann->format >= di->ann_formats->formats->len) {
+		srd_err("Protocol decoder %s submitted annotation with "
+			"unregistered format %d.", di->decoder->name, ann->format);
+		return SRD_ERR_PYTHON;
+	}
+	fmt = g_ptr_array_index(di->ann_formats->formats, ann->format);
+
+	py_tmp = PyList_GetItem(obj, 2);
+	if (PyTuple_Check(py_tmp) || PyList_Check(py_tmp)) {
+		num_values = PySequence_Size(py_tmp);
+		if (num_values != (Py_ssize_t)fmt->num_values)
+			goto err_values;
+		for (i = 0; i < num_values; i++) {
+			if (PyTuple_Check(py_tmp))
+				py_value = PyTuple_GetItem(py_tmp, i);
+			else
+				py_value = PyList_GetItem(py_tmp, i);
+			if (parse_annotation_value(py_value, &ann->values[i]) != SRD_OK)
+				goto err_values;
+		}
+	} else {
+		num_values = 1;
+		if (fmt->num_values != 1)
+			goto err_values;
+		if (parse_annotation_value(py_tmp, &ann->values[0]) != SRD_OK)
+			goto err_values;
+	}
+	ann->num_values = num_values;
+
+	return SRD_OK;
+
+err_values:
+	srd_err("Protocol decoder %s submitted annotation list, but third "
+		"element didn't match the format's %u integer values.",
+		di->decoder->name, fmt->num_values);
+
+	return SRD_ERR_PYTHON;
+}
+
+/* Check an annotation's layout. */
+static int parse_annotation(struct srd_decoder_inst *di, PyObject *obj,
+		struct annotation *ann)
+{
+	PyObject *py_tmp;
+	struct srd_pd_output *pdo;
+	Py_ssize_t size;
 
-	/* Should be a list of [annotation class, [string, ...]]. */
+	/*
+	 * Should be a list of [annotation class, [string, ...]], or of
+	 * [annotation class, format, value or tuple of values].
+	 */
 	if (!PyList_Check(obj)) {
 		srd_err("Protocol decoder %s submitted an annotation that"
 			" is not a list", di->decoder->name);
-		goto err;
+		return SRD_ERR_PYTHON;
 	}
 
-	/* Should have 2 elements. */
-	if (PyList_Size(obj) != 2) {
+	/* Should have 2 or 3 elements. */
+	size = PyList_Size(obj);
+	if (size != 2 && size != 3) {
 		srd_err("Protocol decoder %s submitted annotation list with "
-			"%zd elements instead of 2", di->decoder->name,
-			PyList_Size(obj));
-		goto err;
+			"%zd elements instead of 2 or 3", di->decoder->name, size);
+		return SRD_ERR_PYTHON;
 	}
 
 	/*
@@ -88,36 +286,163 @@ static int convert_annotation(struct srd_decoder_inst *di, PyObject *obj,
 	if (!PyLong_Check(py_tmp)) {
 		srd_err("Protocol decoder %s submitted annotation list, but "
 			"first element was not an integer.", di->decoder->name);
-		goto err;
+		return SRD_ERR_PYTHON;
 	}
-	ann_class = PyLong_AsLong(py_tmp);
-	if (!(pdo = g_slist_nth_data(di->decoder->annotations, ann_class))) {
+	ann->ann_class = PyLong_AsLong(py_tmp);
+	if (!(pdo = g_slist_nth_data(di->decoder->annotations, ann->ann_class))) {
 		srd_err("Protocol decoder %s submitted data to unregistered "
-			"annotation class %d.", di->decoder->name, ann_class);
-		goto err;
+			"annotation class %d.", di->decoder->name, ann->ann_class);
+		return SRD_ERR_PYTHON;
 	}
 
+	ann->py_texts = NULL;
+	ann->format = -1;
+	ann->num_values = 0;
+	if (size == 3)
+		return parse_annotation_format(di, obj, ann);
+
 	/* Second element must be a list. */
 	py_tmp = PyList_GetItem(obj, 1);
 	if (!PyList_Check(py_tmp)) {
 		srd_err("Protocol decoder %s submitted annotation list, but "
 			"second element was not a list.", di->decoder->name);
-		goto err;
+		return SRD_ERR_PYTHON;
 	}
-	if (py_strseq_to_char(py_tmp, &ann_text) != SRD_OK) {
+	ann->py_texts = py_tmp;
+
+	return SRD_OK;
+}
+
+/*
+ * Convert an annotation. Its values are kept in 'ann', which must stay
+ * around as long as the converted annotation does.
+ */
+static int convert_annotation(struct srd_decoder_inst *di, PyObject *obj,
+		struct srd_proto_data *pdata, struct annotation *ann,
+		gboolean *interned)
+{
+	struct srd_proto_data_annotation *pda;
+	char **ann_text;
+	PyGILState_STATE gstate;
+
+	gstate = PyGILState_Ensure();
+
+	if (parse_annotation(di, obj, ann) != SRD_OK)
+		goto err;
+	if (!ann->py_texts) {
+		/* Formatted texts are owned by the instance. */
+		ann_text = NULL;
+		if (!di->sess->ann_text_lazy)
+			ann_text = srd_inst_ann_format_text(di, ann->format, ann->values);
+		*interned = TRUE;
+	} else if ((ann_text = intern_annotation_text(di, ann->py_texts))) {
+		*interned = TRUE;
+	} else if (py_strseq_to_char(ann->py_texts, &ann_text) == SRD_OK) {
+		*interned = FALSE;
+	} else {
 		srd_err("Protocol decoder %s submitted annotation list, but "
 			"second element was malformed.", di->decoder->name);
 		goto err;
 	}
 
 	pda = pdata->data;
-	pda->ann_class = ann_class;
+	pda->ann_class = ann->ann_class;
+	pda->ann_text = ann_text;
+	pda->ann_format = ann->format;
+	pda->num_ann_values = ann->num_values;
+	pda->ann_values = ann->values;
+
+	PyGILState_Release(gstate);
+
+	return SRD_OK;
+
+err:
+	PyGILState_Release(gstate);
+
+	return SRD_ERR_PYTHON;
+}
+
+/*
+ * Add an annotation to the instance's batch. Texts which don't get
+ * interned are copied into the batch's arena, which saves allocating
+ * and freeing each of them. Formatted texts get rendered upon delivery.
+ */
+static int batch_annotation(struct srd_decoder_inst *di, PyObject *obj,
+		const struct srd_proto_data *pdata)
+{
+	PyObject *py_item, *py_bytes;
+	struct srd_ann_batch *batch;
+	struct srd_proto_data_annotation *pda;
+	struct annotation ann;
+	Py_ssize_t len, i;
+	char *str, **ann_text;
+	int64_t *values;
+	guint first;
+	PyGILState_STATE gstate;
+
+	gstate = PyGILState_Ensure();
+
+	if (parse_annotation(di, obj, &ann) != SRD_OK)
+		goto err;
+
+	if (!(batch = di->ann_batch)) {
+		batch = g_malloc0(sizeof(*batch));
+		batch->size = di->sess->ann_batch_size;
+		batch->pdata = g_malloc(sizeof(*batch->pdata) * batch->size);
+		batch->pda = g_malloc(sizeof(*batch->pda) * batch->size);
+		batch->text_index = g_malloc(sizeof(*batch->text_index) * batch->size);
+		batch->values = g_malloc(sizeof(*batch->values) *
+			ANN_FORMAT_MAX_VALUES * batch->size);
+		batch->text = g_ptr_array_new();
+		batch->arena = g_string_chunk_new(ANN_BATCH_ARENA_SIZE);
+		di->ann_batch = batch;
+	}
+
+	values = NULL;
+	if (!ann.py_texts) {
+		ann_text = NULL;
+		first = ANN_BATCH_INTERNED;
+		values = &batch->values[batch->count * ANN_FORMAT_MAX_VALUES];
+		memcpy(values, ann.values, sizeof(*values) * ann.num_values);
+	} else if ((ann_text = intern_annotation_text(di, ann.py_texts))) {
+		first = ANN_BATCH_INTERNED;
+	} else {
+		first = batch->text->len;
+		for (i = 0; i < PyList_Size(ann.py_texts); i++) {
+			py_item = PyList_GetItem(ann.py_texts, i);
+			if (!PyUnicode_Check(py_item))
+				goto err_text;
+			if (!(py_bytes = PyUnicode_AsUTF8String(py_item)))
+				goto err_text;
+			if (PyBytes_AsStringAndSize(py_bytes, &str, &len) < 0) {
+				Py_DECREF(py_bytes);
+				goto err_text;
+			}
+			g_ptr_array_add(batch->text,
+				g_string_chunk_insert_len(batch->arena, str, len));
+			Py_DECREF(py_bytes);
+		}
+		g_ptr_array_add(batch->text, NULL);
+	}
+
+	batch->pdata[batch->count] = *pdata;
+	pda = &batch->pda[batch->count];
+	pda->ann_class = ann.ann_class;
 	pda->ann_text = ann_text;
+	pda->ann_format = ann.format;
+	pda->num_ann_values = ann.num_values;
+	pda->ann_values = values;
+	batch->text_index[batch->count] = first;
+	batch->count++;
 
 	PyGILState_Release(gstate);
 
 	return SRD_OK;
 
+err_text:
+	srd_err("Protocol decoder %s submitted annotation list, but "
+		"second element was malformed.", di->decoder->name);
+	g_ptr_array_set_size(batch->text, first);
 err:
 	PyGILState_Release(gstate);
 
@@ -290,63 +615,20 @@ err:
 	return SRD_ERR_PYTHON;
 }
 
-static inline struct srd_decoder_inst *srd_sess_inst_find_by_obj(
-	struct srd_session *sess, const GSList *stack, const PyObject *obj)
-{
-	const GSList *l;
-	struct srd_decoder_inst *tmp, *di;
-
-	if (!sess)
-		return NULL;
-
-	di = NULL;
-	for (l = stack ? stack : sess->di_list; di == NULL && l != NULL; l = l->next) {
-		tmp = l->data;
-		if (tmp->py_inst == obj)
-			di = tmp;
-		else if (tmp->next_di)
-			di = srd_sess_inst_find_by_obj(sess, tmp->next_di, obj);
-	}
-
-	return di;
-}
-
 /**
  * Find a decoder instance by its Python object.
  *
  * I.e. find that instance's instantiation of the sigrokdecode.Decoder class.
- * This will recurse to find the instance anywhere in the stack tree of all
- * sessions.
+ * The object holds a reference to its decoder instance, which gets set up
+ * when the instance is created.
  *
- * @param stack Pointer to a GSList of struct srd_decoder_inst, indicating the
- *              stack to search. To start searching at the bottom level of
- *              decoder instances, pass NULL.
  * @param obj The Python class instantiation.
  *
  * @return Pointer to struct srd_decoder_inst, or NULL if not found.
- *
- * @since 0.1.0
  */
-static inline struct srd_decoder_inst *srd_inst_find_by_obj(
-		const GSList *stack, const PyObject *obj)
+static inline struct srd_decoder_inst *srd_inst_find_by_obj(PyObject *obj)
 {
-	struct srd_decoder_inst *di;
-	struct srd_session *sess;
-	GSList *l;
-
-	/* Performance shortcut: Handle the most common case first. */
-	sess = sessions->data;
-	di = sess->di_list->data;
-	if (di->py_inst == obj)
-		return di;
-
-	di = NULL;
-	for (l = sessions; di == NULL && l != NULL; l = l->next) {
-		sess = l->data;
-		di = srd_sess_inst_find_by_obj(sess, stack, obj);
-	}
-
-	return di;
+	return ((srd_Decoder *)obj)->di;
 }
 
 static int convert_meta(struct srd_proto_data *pdata, PyObject *obj)
@@ -396,6 +678,42 @@ static void release_meta(GVariant *gvar)
 	g_variant_unref(gvar);
 }
 
+/*
+ * Check whether output is enabled, before converting it. Malformed output
+ * counts as enabled, its conversion reports the error.
+ */
+static gboolean output_enabled(const struct srd_decoder_inst *di,
+		const struct srd_pd_output *pdo, PyObject *obj)
+{
+	const GArray *disabled_classes;
+	PyObject *py_class;
+
+	if (di->disabled_outputs & (1U << pdo->output_type))
+		return FALSE;
+
+	switch (pdo->output_type) {
+	case SRD_OUTPUT_ANN:
+		disabled_classes = di->disabled_ann_classes;
+		break;
+	case SRD_OUTPUT_BINARY:
+		disabled_classes = di->disabled_bin_classes;
+		break;
+	default:
+		return TRUE;
+	}
+	if (!disabled_classes)
+		return TRUE;
+
+	/* Annotations and binary output are lists of [class, data, ...]. */
+	if (!PyList_Check(obj) || PyList_Size(obj) < 2)
+		return TRUE;
+	py_class = PyList_GetItem(obj, 0);
+	if (!PyLong_Check(py_class))
+		return TRUE;
+
+	return srd_inst_class_enabled(disabled_classes, PyLong_AsLong(py_class));
+}
+
 PyDoc_STRVAR(Decoder_put_doc,
 	"Put an annotation for the specified span of samples.\n"
 	"\n"
@@ -406,15 +724,17 @@ PyDoc_STRVAR(Decoder_put_doc,
 static PyObject *Decoder_put(PyObject *self, PyObject *args)
 {
 	GSList *l;
-	PyObject *py_data, *py_res;
+	PyObject *py_data, *py_res, *py_args;
 	struct srd_decoder_inst *di, *next_di;
 	struct srd_pd_output *pdo;
 	struct srd_proto_data pdata;
 	struct srd_proto_data_annotation pda;
 	struct srd_proto_data_binary pdb;
 	struct srd_proto_data_logic pdl;
+	struct annotation ann;
 	uint64_t start_sample, end_sample;
 	int output_id;
+	gboolean interned, batched;
 	struct srd_pd_callback *cb;
 	PyGILState_STATE gstate;
 
@@ -422,7 +742,7 @@ static PyObject *Decoder_put(PyObject *self, PyObject *args)
 
 	gstate = PyGILState_Ensure();
 
-	if (!(di = srd_inst_find_by_obj(NULL, self))) {
+	if (!(di = srd_inst_find_by_obj(self))) {
 		/* Shouldn't happen. */
 		srd_dbg("put(): self instance not found.");
 		goto err;
@@ -445,6 +765,12 @@ static PyObject *Decoder_put(PyObject *self, PyObject *args)
 	}
 	pdo = l->data;
 
+	/* Drop output which was disabled, before converting it. */
+	if (!output_enabled(di, pdo, py_data)) {
+		PyGILState_Release(gstate);
+		Py_RETURN_NONE;
+	}
+
 	/* Upon SRD_OUTPUT_PYTHON for stacked PDs, we have a nicer log message later. */
 	if (pdo->output_type != SRD_OUTPUT_PYTHON && di->next_di != NULL) {
 		srd_spew("Instance %s put %" PRIu64 "-%" PRIu64 " %s on "
@@ -453,28 +779,48 @@ static PyObject *Decoder_put(PyObject *self, PyObject *args)
 			 pdo->proto_id);
 	}
 
-	pdata.start_sample = start_sample;
-	pdata.end_sample = end_sample;
+	/* Frontends get sample numbers in the timebase of the input. */
+	pdata.start_sample = start_sample * di->decimation;
+	pdata.end_sample = end_sample * di->decimation;
 	pdata.pdo = pdo;
 	pdata.data = NULL;
 
 	switch (pdo->output_type) {
 	case SRD_OUTPUT_ANN:
 		/* Annotations are only fed to callbacks. */
-		if ((cb = srd_pd_output_callback_find(di->sess, pdo->output_type))) {
+		if (di->sess->ann_batch_cb) {
+			if (batch_annotation(di, py_data, &pdata) != SRD_OK) {
+				/* An error was already logged. */
+				break;
+			}
+			if (di->ann_batch->count == di->ann_batch->size) {
+				Py_BEGIN_ALLOW_THREADS
+				srd_inst_ann_batch_deliver(di);
+				Py_END_ALLOW_THREADS
+			}
+		} else if ((cb = srd_pd_output_callback_find(di->sess, pdo->output_type))) {
 			pdata.data = &pda;
 			/* Convert from PyDict to srd_proto_data_annotation. */
-			if (convert_annotation(di, py_data, &pdata) != SRD_OK) {
+			if (convert_annotation(di, py_data, &pdata, &ann, &interned) != SRD_OK) {
 				/* An error was already logged. */
 				break;
 			}
 			Py_BEGIN_ALLOW_THREADS
+			g_mutex_lock(&di->sess->callback_mutex);
 			cb->cb(&pdata, cb->cb_data);
+			g_mutex_unlock(&di->sess->callback_mutex);
 			Py_END_ALLOW_THREADS
-			release_annotation(pdata.data);
+			release_annotation(pdata.data, interned);
+			srd_inst_ann_format_release(di);
 		}
 		break;
 	case SRD_OUTPUT_PYTHON:
+		/*
+		 * The (ss, es, data) tuple is built once. It's the arguments
+		 * of decode(), and an item of decode_batch()'s list.
+		 */
+		py_args = NULL;
+		batched = FALSE;
 		for (l = di->next_di; l; l = l->next) {
 			next_di = l->data;
 			srd_spew("Instance %s put %" PRIu64 "-%" PRIu64 " %s "
@@ -482,21 +828,43 @@ static PyObject *Decoder_put(PyObject *self, PyObject *args)
 				 start_sample,
 				 end_sample, output_type_name(pdo->output_type),
 				 output_id, pdo->proto_id, next_di->inst_id);
-			if (!(py_res = PyObject_CallMethod(
-				next_di->py_inst, "decode", "KKO", start_sample,
-				end_sample, py_data))) {
+			if (!py_args && !(py_args = Py_BuildValue("(KKO)",
+					start_sample, end_sample, py_data))) {
+				srd_exception_catch("Failed to build decode() arguments");
+				break;
+			}
+			if (next_di->decode_batched) {
+				batched = TRUE;
+				continue;
+			}
+			if (!(py_res = PyObject_Call(next_di->py_decode, py_args, NULL))) {
 				srd_exception_catch("Calling %s decode() failed",
 							next_di->inst_id);
 			}
 			Py_XDECREF(py_res);
 		}
+		if (batched) {
+			if (!di->py_pending)
+				di->py_pending = PyList_New(0);
+			if (!di->py_pending || PyList_Append(di->py_pending, py_args) < 0)
+				srd_exception_catch("Failed to batch output of %s",
+							di->inst_id);
+			else if (PyList_Size(di->py_pending) >= PYTHON_BATCH_SIZE)
+				srd_inst_python_batch_deliver(di);
+		}
+		Py_XDECREF(py_args);
 		if ((cb = srd_pd_output_callback_find(di->sess, pdo->output_type))) {
 			/*
 			 * Frontends aren't really supposed to get Python
-			 * callbacks, but it's useful for testing.
+			 * callbacks, but it's useful for testing. Don't hold
+			 * the interpreter while waiting for other callbacks.
 			 */
 			pdata.data = py_data;
+			Py_BEGIN_ALLOW_THREADS
+			g_mutex_lock(&di->sess->callback_mutex);
+			Py_END_ALLOW_THREADS
 			cb->cb(&pdata, cb->cb_data);
+			g_mutex_unlock(&di->sess->callback_mutex);
 		}
 		break;
 	case SRD_OUTPUT_BINARY:
@@ -508,7 +876,9 @@ static PyObject *Decoder_put(PyObject *self, PyObject *args)
 				break;
 			}
 			Py_BEGIN_ALLOW_THREADS
+			g_mutex_lock(&di->sess->callback_mutex);
 			cb->cb(&pdata, cb->cb_data);
+			g_mutex_unlock(&di->sess->callback_mutex);
 			Py_END_ALLOW_THREADS
 			release_binary(pdata.data);
 		}
@@ -525,9 +895,11 @@ static PyObject *Decoder_put(PyObject *self, PyObject *args)
 				srd_err("Ignored SRD_OUTPUT_LOGIC with invalid sample range.");
 				break;
 			}
-			pdl.repeat_count = (end_sample - start_sample) - 1;
+			pdl.repeat_count = (pdata.end_sample - pdata.start_sample) - 1;
 			Py_BEGIN_ALLOW_THREADS
+			g_mutex_lock(&di->sess->callback_mutex);
 			cb->cb(&pdata, cb->cb_data);
+			g_mutex_unlock(&di->sess->callback_mutex);
 			Py_END_ALLOW_THREADS
 			release_logic(pdata.data);
 		}
@@ -540,7 +912,9 @@ static PyObject *Decoder_put(PyObject *self, PyObject *args)
 				break;
 			}
 			Py_BEGIN_ALLOW_THREADS
+			g_mutex_lock(&di->sess->callback_mutex);
 			cb->cb(&pdata, cb->cb_data);
+			g_mutex_unlock(&di->sess->callback_mutex);
 			Py_END_ALLOW_THREADS
 			release_meta(pdata.data);
 		}
@@ -561,6 +935,62 @@ err:
 	return NULL;
 }
 
+PyDoc_STRVAR(Decoder_register_ann_format_doc,
+	"Register a text format for annotations.\n"
+	"\n"
+	"Arguments: list of templates, one per text variant. Templates take\n"
+	"printf() style integer conversions (%d, %i, %u, %x, %X, %o, %c).\n"
+	"Returns the format's id. Annotations which use the format are put\n"
+	"as [class, format id, value or tuple of values], their texts only\n"
+	"get rendered when needed."
+);
+
+static PyObject *Decoder_register_ann_format(PyObject *self, PyObject *args)
+{
+	struct srd_decoder_inst *di;
+	PyObject *py_templates, *py_format_id;
+	char **templates;
+	int format;
+	PyGILState_STATE gstate;
+
+	gstate = PyGILState_Ensure();
+
+	if (!(di = srd_inst_find_by_obj(self))) {
+		PyErr_SetString(PyExc_Exception, "decoder instance not found");
+		goto err;
+	}
+
+	if (!PyArg_ParseTuple(args, "O", &py_templates)) {
+		/* Let Python raise this exception. */
+		goto err;
+	}
+
+	if (!PyList_Check(py_templates) && !PyTuple_Check(py_templates)) {
+		PyErr_SetString(PyExc_TypeError, "templates must be a list");
+		goto err;
+	}
+	if (py_strseq_to_char(py_templates, &templates) != SRD_OK) {
+		PyErr_SetString(PyExc_TypeError, "templates must be strings");
+		goto err;
+	}
+	if ((format = srd_inst_ann_format_add(di, templates)) < 0) {
+		/* An error was already logged. */
+		PyErr_SetString(PyExc_ValueError, "invalid annotation format");
+		goto err;
+	}
+
+	py_format_id = Py_BuildValue("i", format);
+
+	PyGILState_Release(gstate);
+
+	return py_format_id;
+
+err:
+	PyGILState_Release(gstate);
+
+	return NULL;
+}
+
 PyDoc_STRVAR(Decoder_register_doc,
 	"Register a new output stream."
 );
@@ -587,7 +1017,7 @@ static PyObject *Decoder_register(PyObject *self,
 	meta_type_gv = NULL;
 	meta_name = meta_descr = NULL;
 
-	if (!(di = srd_inst_find_by_obj(NULL, self))) {
+	if (!(di = srd_inst_find_by_obj(self))) {
 		PyErr_SetString(PyExc_Exception, "decoder instance not found");
 		goto err;
 	}
@@ -689,6 +1119,44 @@ static int get_term_type(const char *v)
 	return -1;
 }
 
+/**
+ * Get the type of a condition term with a keyword key.
+ *
+ * @param py_key The term's key, a Python string. Must not be NULL.
+ *
+ * @return The term's type. Unknown keys are taken as "skip".
+ */
+static int get_keyword_type(PyObject *py_key)
+{
+	if (!PyUnicode_CompareWithASCIIString(py_key, "pattern"))
+		return SRD_TERM_PATTERN;
+	if (!PyUnicode_CompareWithASCIIString(py_key, "changed"))
+		return SRD_TERM_CHANGED;
+	if (!PyUnicode_CompareWithASCIIString(py_key, "min_width"))
+		return SRD_TERM_MIN_WIDTH;
+	if (!PyUnicode_CompareWithASCIIString(py_key, "max_width"))
+		return SRD_TERM_MAX_WIDTH;
+	if (!PyUnicode_CompareWithASCIIString(py_key, "stable"))
+		return SRD_TERM_STABLE;
+
+	return SRD_TERM_SKIP;
+}
+
+/**
+ * Get the mask of the channels which conditions can refer to.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ *
+ * @return Bit N is set for the decoder's channel N.
+ */
+static uint64_t condition_channels_mask(const struct srd_decoder_inst *di)
+{
+	if (di->dec_num_channels >= SRD_MAX_CONDITION_CHANNELS)
+		return UINT64_MAX;
+
+	return (UINT64_C(1) << di->dec_num_channels) - 1;
+}
+
 /**
  * Get the pin values at the current sample number.
  *
@@ -698,7 +1166,7 @@ static int get_term_type(const char *v)
  * @return A newly allocated PyTuple containing the pin values at the
  *         current sample number.
  */
-static PyObject *get_current_pinvalues(const struct srd_decoder_inst *di)
+static PyObject *get_current_pinvalues(struct srd_decoder_inst *di)
 {
 	int i;
 	uint8_t sample;
@@ -722,7 +1190,7 @@ static PyObject *get_current_pinvalues(const struct srd_decoder_inst *di)
 			/* Value of unused channel is 0xff, instead of 0 or 1. */
 			PyTuple_SetItem(py_pinvalues, i, PyLong_FromUnsignedLong(0xff));
 		} else {
-			sample_pos = di->inbuf + ((di->abs_cur_samplenum - di->abs_start_samplenum) * di->data_unitsize);
+			sample_pos = srd_inst_sample_pos(di, di->abs_cur_samplenum - di->abs_start_samplenum);
 			byte_offset = di->dec_channelmap[i] / 8;
 			bit_offset = di->dec_channelmap[i] % 8;
 			sample = *(sample_pos + byte_offset) & (1 << bit_offset) ? 1 : 0;
@@ -736,32 +1204,100 @@ static PyObject *get_current_pinvalues(const struct srd_decoder_inst *di)
 }
 
 /**
- * Create a list of terms in the specified condition.
+ * Add level terms for several channels to a compiled condition.
+ *
+ * Terms which contradict previously added level terms make the condition
+ * never match.
+ *
+ * @param cond The condition to extend. Must not be NULL.
+ * @param mask The decoder's channels which the terms refer to (bit N for
+ *             channel N).
+ * @param value The channels' levels.
+ */
+static void condition_add_levels(struct srd_condition *cond,
+	uint64_t mask, uint64_t value)
+{
+	value &= mask;
+	if ((cond->level_mask & mask) & (cond->level_value ^ value))
+		cond->always_false = TRUE;
+	cond->level_mask |= mask;
+	cond->level_value |= value;
+}
+
+/**
+ * Add a level or edge term to a compiled condition.
+ *
+ * @param cond The condition to extend. Must not be NULL.
+ * @param type The term's type (SRD_TERM_* enum value).
+ * @param channel The decoder's channel index which the term refers to.
+ */
+static void condition_add_term(struct srd_condition *cond, int type, int channel)
+{
+	uint64_t bit;
+
+	bit = UINT64_C(1) << channel;
+
+	switch (type) {
+	case SRD_TERM_HIGH:
+		condition_add_levels(cond, bit, bit);
+		break;
+	case SRD_TERM_LOW:
+		condition_add_levels(cond, bit, 0);
+		break;
+	case SRD_TERM_RISING_EDGE:
+		condition_add_levels(cond, bit, bit);
+		cond->edge_mask |= bit;
+		cond->edge_value |= bit;
+		break;
+	case SRD_TERM_FALLING_EDGE:
+		condition_add_levels(cond, bit, 0);
+		cond->edge_mask |= bit;
+		cond->edge_value |= bit;
+		break;
+	case SRD_TERM_EITHER_EDGE:
+		cond->edge_mask |= bit;
+		cond->edge_value |= bit;
+		break;
+	case SRD_TERM_NO_EDGE:
+		cond->edge_mask |= bit;
+		break;
+	default:
+		cond->always_false = TRUE;
+		break;
+	}
+}
+
+/**
+ * Create the compiled form of the terms in the specified condition.
  *
- * If there are no terms in the condition, 'term_list' will be NULL.
+ * If there are no terms in the condition, it is marked as empty.
  *
  * @param di The decoder instance to use. Must not be NULL.
  * @param py_dict A Python dict containing terms. Must not be NULL.
- * @param term_list Pointer to a GSList which will be set to the newly
- *                  created list of terms. Must not be NULL.
+ * @param cond Pointer to the condition which will receive the compiled
+ *             terms. Must not be NULL.
  *
  * @return SRD_OK upon success, a negative error code otherwise.
  */
-static int create_term_list(struct srd_decoder_inst *di,
-	PyObject *py_dict, GSList **term_list)
+static int create_condition(struct srd_decoder_inst *di,
+	PyObject *py_dict, struct srd_condition *cond)
 {
 	Py_ssize_t pos = 0;
 	PyObject *py_key, *py_value;
-	struct srd_term *term;
-	int64_t num_samples_to_skip;
+	int64_t num_samples_to_skip, width;
+	uint64_t mask, value;
+	int type, channel;
 	char *term_str;
+	gboolean has_width;
 	PyGILState_STATE gstate;
 
-	if (!py_dict || !term_list)
+	if (!py_dict || !cond)
 		return SRD_ERR_ARG;
 
-	/* "Create" an empty GSList of terms. */
-	*term_list = NULL;
+	memset(cond, 0, sizeof(*cond));
+	cond->is_empty = TRUE;
+	cond->max_width = UINT64_MAX;
+	has_width = FALSE;
 
 	gstate = PyGILState_Ensure();
 
@@ -775,32 +1311,87 @@ static int create_term_list(struct srd_decoder_inst *di,
 				srd_err("Failed to get the value.");
 				goto err;
 			}
-			term = g_malloc(sizeof(struct srd_term));
-			term->type = get_term_type(term_str);
-			term->channel = PyLong_AsLong(py_key);
-			if (term->channel < 0 || term->channel >= di->dec_num_channels)
-				term->type = SRD_TERM_ALWAYS_FALSE;
+			type = get_term_type(term_str);
 			g_free(term_str);
-		} else if (PyUnicode_Check(py_key)) {
-			/* The key is a string. */
-			/* TODO: Check if the key is "skip". */
-			if ((py_pydictitem_as_long(py_dict, py_key, &num_samples_to_skip)) != SRD_OK) {
+			channel = PyLong_AsLong(py_key);
+			if (channel < 0 || channel >= di->dec_num_channels) {
+				cond->always_false = TRUE;
+			} else if (channel >= SRD_MAX_CONDITION_CHANNELS) {
+				srd_err("Conditions support channels 0-%d only.",
+					SRD_MAX_CONDITION_CHANNELS - 1);
+				goto err;
+			} else {
+				condition_add_term(cond, type, channel);
+			}
+		} else if (PyUnicode_Check(py_key) &&
+				get_keyword_type(py_key) == SRD_TERM_PATTERN) {
+			/* The key is "pattern", the value a (mask, value) tuple. */
+			if (!PyTuple_Check(py_value) || PyTuple_Size(py_value) != 2) {
+				srd_err("Pattern is not a (mask, value) tuple.");
+				goto err;
+			}
+			mask = PyLong_AsUnsignedLongLong(PyTuple_GetItem(py_value, 0));
+			value = PyLong_AsUnsignedLongLong(PyTuple_GetItem(py_value, 1));
+			if (PyErr_Occurred()) {
+				srd_err("Failed to get the pattern's mask and value.");
+				goto err;
+			}
+			if (mask & ~condition_channels_mask(di))
+				cond->always_false = TRUE;
+			else
+				condition_add_levels(cond, mask, value);
+		} else if (PyUnicode_Check(py_key) &&
+				get_keyword_type(py_key) == SRD_TERM_CHANGED) {
+			/* The key is "changed", the value a mask. */
+			mask = PyLong_AsUnsignedLongLong(py_value);
+			if (PyErr_Occurred()) {
+				srd_err("Failed to get the mask of changed channels.");
+				goto err;
+			}
+			if (!mask || (mask & ~condition_channels_mask(di)))
+				cond->always_false = TRUE;
+			else
+				cond->any_edge_mask |= mask;
+		} else if (PyUnicode_Check(py_key) &&
+				(type = get_keyword_type(py_key)) != SRD_TERM_SKIP) {
+			/* The key is "min_width", "max_width" or "stable". */
+			if ((py_pydictitem_as_long(py_dict, py_key, &width)) != SRD_OK) {
+				srd_err("Failed to get the number of samples.");
+				goto err;
+			}
+			has_width = TRUE;
+			if (width < 0)
+				cond->always_false = TRUE;
+			else if (type == SRD_TERM_MIN_WIDTH)
+				cond->min_width = width;
+			else if (type == SRD_TERM_MAX_WIDTH)
+				cond->max_width = width;
+			else
+				cond->stable_samples = width;
+		} else if (PyUnicode_Check(py_key)) {
+			/* The key is a string, "skip" (or any other keyword). */
+			if ((py_pydictitem_as_long(py_dict, py_key, &num_samples_to_skip)) != SRD_OK) {
 				srd_err("Failed to get number of samples to skip.");
 				goto err;
 			}
-			term = g_malloc(sizeof(struct srd_term));
-			term->type = SRD_TERM_SKIP;
-			term->num_samples_to_skip = num_samples_to_skip;
-			term->num_samples_already_skipped = 0;
+			cond->has_skip = TRUE;
+			cond->num_samples_to_skip = num_samples_to_skip;
+			cond->num_samples_already_skipped = 0;
 			if (num_samples_to_skip < 0)
-				term->type = SRD_TERM_ALWAYS_FALSE;
+				cond->always_false = TRUE;
 		} else {
 			srd_err("Term key is neither a string nor a number.");
 			goto err;
 		}
 
-		/* Add the term to the list of terms. */
-		*term_list = g_slist_append(*term_list, term);
+		cond->is_empty = FALSE;
+	}
+
+	/* Width terms refer to the changes of the condition's pins. */
+	if (has_width) {
+		cond->track_mask = cond->level_mask | cond->edge_mask | cond->any_edge_mask;
+		if (!cond->track_mask)
+			cond->always_false = TRUE;
 	}
 
 	PyGILState_Release(gstate);
@@ -813,32 +1404,243 @@ err:
 	return SRD_ERR;
 }
 
+/**
+ * Set the decoder instance's current condition list.
+ *
+ * The condition list's storage gets reused across .wait() calls. Width
+ * terms count from the last change of their channels, which the instance
+ * keeps track of.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ * @param conds The conditions to copy. Must not be NULL.
+ * @param num_conds The number of conditions.
+ */
+static void condition_list_set(struct srd_decoder_inst *di,
+	const struct srd_condition *conds, guint num_conds)
+{
+	struct srd_condition *cond;
+	guint i;
+
+	if (!di->condition_list)
+		di->condition_list = g_array_sized_new(FALSE, TRUE,
+			sizeof(struct srd_condition), num_conds);
+	g_array_set_size(di->condition_list, 0);
+	g_array_append_vals(di->condition_list, conds, num_conds);
+	for (i = 0; i < num_conds; i++) {
+		cond = &g_array_index(di->condition_list, struct srd_condition, i);
+		if (cond->track_mask)
+			cond->last_change = srd_inst_last_change(di, cond->track_mask);
+	}
+}
+
+/**
+ * Check whether a condition matches a cached condition's terms.
+ *
+ * Skip counts are parameters of a condition, they don't take part in the
+ * comparison. Instead their values get copied to the compiled condition.
+ *
+ * @param py_cached The cached condition (dict). Must not be NULL.
+ * @param py_dict The condition to check. Must not be NULL.
+ * @param cond The compiled condition which receives the skip count.
+ *             Must not be NULL.
+ *
+ * @return TRUE if the terms match, FALSE otherwise.
+ */
+static gboolean condition_terms_match(PyObject *py_cached, PyObject *py_dict,
+	struct srd_condition *cond)
+{
+	Py_ssize_t pos = 0;
+	PyObject *py_key, *py_value, *py_new_value;
+	int64_t num_samples_to_skip;
+
+	if (!PyDict_Check(py_dict) || PyDict_Size(py_dict) != PyDict_Size(py_cached))
+		return FALSE;
+
+	while (PyDict_Next(py_cached, &pos, &py_key, &py_value)) {
+		if (!(py_new_value = PyDict_GetItem(py_dict, py_key)))
+			return FALSE;
+		if (PyUnicode_Check(py_key) && get_keyword_type(py_key) == SRD_TERM_SKIP) {
+			/* Negative counts (or errors) take the slow path. */
+			if (!PyLong_Check(py_new_value))
+				return FALSE;
+			num_samples_to_skip = PyLong_AsLongLong(py_new_value);
+			if (num_samples_to_skip < 0) {
+				PyErr_Clear();
+				return FALSE;
+			}
+			cond->num_samples_to_skip = num_samples_to_skip;
+		} else if (py_new_value != py_value &&
+				PyObject_RichCompareBool(py_new_value, py_value, Py_EQ) != 1) {
+			PyErr_Clear();
+			return FALSE;
+		}
+	}
+
+	return TRUE;
+}
+
+/**
+ * Set the instance's condition list from a matching condition cache entry.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ * @param entry The cache entry to check. Must not be NULL.
+ * @param py_conds The .wait() argument. Must not be NULL.
+ *
+ * @return TRUE if the entry matches and the condition list was set up,
+ *         FALSE otherwise (the condition list's content is undefined).
+ */
+static gboolean condition_cache_entry_apply(struct srd_decoder_inst *di,
+	const struct srd_condition_cache_entry *entry, PyObject *py_conds)
+{
+	struct srd_condition *conds;
+	Py_ssize_t i, num_conditions;
+
+	num_conditions = entry->condition_list->len;
+	if (PyDict_Check(entry->py_conds)) {
+		if (!PyDict_Check(py_conds))
+			return FALSE;
+	} else if (!PyList_Check(py_conds) || PyList_Size(py_conds) != num_conditions) {
+		return FALSE;
+	}
+
+	condition_list_set(di,
+		&g_array_index(entry->condition_list, struct srd_condition, 0),
+		num_conditions);
+	conds = &g_array_index(di->condition_list, struct srd_condition, 0);
+
+	if (PyDict_Check(py_conds))
+		return condition_terms_match(entry->py_conds, py_conds, &conds[0]);
+
+	for (i = 0; i < num_conditions; i++) {
+		if (!condition_terms_match(PyList_GetItem(entry->py_conds, i),
+				PyList_GetItem(py_conds, i), &conds[i]))
+			return FALSE;
+	}
+
+	return TRUE;
+}
+
+/**
+ * Set the instance's condition list from its condition cache.
+ *
+ * A hit moves the entry to the front of the cache.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ * @param py_conds The .wait() argument. Must not be NULL.
+ *
+ * @return TRUE if the conditions were found in the cache, FALSE otherwise.
+ */
+static gboolean condition_cache_apply(struct srd_decoder_inst *di,
+	PyObject *py_conds)
+{
+	GSList *l;
+
+	for (l = di->condition_cache; l; l = l->next) {
+		if (!condition_cache_entry_apply(di, l->data, py_conds))
+			continue;
+		if (l != di->condition_cache) {
+			di->condition_cache = g_slist_remove_link(di->condition_cache, l);
+			di->condition_cache = g_slist_concat(l, di->condition_cache);
+		}
+		return TRUE;
+	}
+
+	return FALSE;
+}
+
+/**
+ * Add compiled conditions to the instance's condition cache.
+ *
+ * The least recently used entry gets evicted when the cache is full.
+ * Conditions with negative skip counts don't get cached.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ * @param py_conds The .wait() argument, a dict or a list of dicts which
+ *                 was compiled successfully. Must not be NULL.
+ * @param condition_list The compiled conditions. The cache takes ownership.
+ */
+static void condition_cache_add(struct srd_decoder_inst *di,
+	PyObject *py_conds, GArray *condition_list)
+{
+	struct srd_condition_cache_entry *entry;
+	struct srd_condition *cond;
+	PyObject *py_copy, *py_dict;
+	Py_ssize_t i, num_conditions;
+	GSList *l;
+	guint j;
+
+	for (j = 0; j < condition_list->len; j++) {
+		cond = &g_array_index(condition_list, struct srd_condition, j);
+		if (cond->has_skip && (int64_t)cond->num_samples_to_skip < 0) {
+			g_array_free(condition_list, TRUE);
+			return;
+		}
+	}
+
+	/*
+	 * Keep a private copy, the decoder may modify the objects which
+	 * it passed in after .wait() returned.
+	 */
+	if (PyDict_Check(py_conds)) {
+		py_copy = PyDict_Copy(py_conds);
+	} else {
+		num_conditions = PyList_Size(py_conds);
+		py_copy = PyList_New(num_conditions);
+		for (i = 0; py_copy && i < num_conditions; i++) {
+			py_dict = PyDict_Copy(PyList_GetItem(py_conds, i));
+			if (!py_dict) {
+				Py_CLEAR(py_copy);
+				break;
+			}
+			PyList_SetItem(py_copy, i, py_dict);
+		}
+	}
+	if (!py_copy) {
+		PyErr_Clear();
+		g_array_free(condition_list, TRUE);
+		return;
+	}
+
+	entry = g_malloc(sizeof(*entry));
+	entry->py_conds = py_copy;
+	entry->condition_list = condition_list;
+	di->condition_cache = g_slist_prepend(di->condition_cache, entry);
+
+	if (g_slist_length(di->condition_cache) > CONDITION_CACHE_SIZE) {
+		l = g_slist_last(di->condition_cache);
+		condition_cache_entry_free(l->data);
+		di->condition_cache = g_slist_delete_link(di->condition_cache, l);
+	}
+}
+
 /**
  * Replace the current condition list with the new one.
  *
  * @param self TODO. Must not be NULL.
- * @param args TODO. Must not be NULL.
+ * @param py_conds The conditions argument of .wait(): None, a dict, or a
+ *                 list of dicts. Must not be NULL.
  *
  * @retval SRD_OK The new condition list was set successfully.
  * @retval SRD_ERR There was an error setting the new condition list.
  *                 The contents of di->condition_list are undefined.
  * @retval 9999 TODO.
  */
-static int set_new_condition_list(PyObject *self, PyObject *args)
+static int set_new_condition_list(PyObject *self, PyObject *py_conds)
 {
 	struct srd_decoder_inst *di;
-	GSList *term_list;
-	PyObject *py_conditionlist, *py_conds, *py_dict;
+	struct srd_condition cond;
+	GArray *condition_list;
+	PyObject *py_conditionlist, *py_dict;
 	int i, num_conditions, ret;
 	PyGILState_STATE gstate;
 
-	if (!self || !args)
+	if (!self || !py_conds)
 		return SRD_ERR_ARG;
 
 	gstate = PyGILState_Ensure();
 
 	/* Get the decoder instance. */
-	if (!(di = srd_inst_find_by_obj(NULL, self))) {
+	if (!(di = srd_inst_find_by_obj(self))) {
 		PyErr_SetString(PyExc_Exception, "decoder instance not found");
 		goto err;
 	}
@@ -853,21 +1655,22 @@ static int set_new_condition_list(PyObject *self, PyObject *args)
 	}
 
 	/*
-	 * Parse the argument of self.wait() into 'py_conds', and check
-	 * the data type. The argument is optional, None is assumed in
-	 * its absence. None or an empty dict or an empty list mean that
-	 * there is no condition, and the next available sample shall
-	 * get returned to the caller.
+	 * Check the data type of the conditions. None or an empty dict
+	 * or an empty list mean that there is no condition, and the next
+	 * available sample shall get returned to the caller.
 	 */
-	py_conds = Py_None;
-	if (!PyArg_ParseTuple(args, "|O", &py_conds)) {
-		/* Let Python raise this exception. */
-		goto err;
-	}
 	if (py_conds == Py_None) {
 		/* 'py_conds' is None. */
 		goto ret_9999;
-	} else if (PyList_Check(py_conds)) {
+	}
+
+	/* Reuse the compiled form of conditions which were seen before. */
+	if (condition_cache_apply(di, py_conds)) {
+		PyGILState_Release(gstate);
+		return SRD_OK;
+	}
+
+	if (PyList_Check(py_conds)) {
 		/* 'py_conds' is a list. */
 		py_conditionlist = py_conds;
 		num_conditions = PyList_Size(py_conditionlist);
@@ -888,12 +1691,12 @@ static int set_new_condition_list(PyObject *self, PyObject *args)
 		goto err;
 	}
 
-	/* Free the old condition list. */
-	condition_list_free(di);
+	condition_list = g_array_sized_new(FALSE, TRUE,
+		sizeof(struct srd_condition), num_conditions);
 
 	ret = SRD_OK;
 
-	/* Iterate over the conditions, set di->condition_list accordingly. */
+	/* Iterate over the conditions, compile them into condition_list. */
 	for (i = 0; i < num_conditions; i++) {
 		/* Get a condition (dict) from the condition list. */
 		py_dict = PyList_GetItem(py_conditionlist, i);
@@ -903,16 +1706,26 @@ static int set_new_condition_list(PyObject *self, PyObject *args)
 			break;
 		}
 
-		/* Create the list of terms in this condition. */
-		if ((ret = create_term_list(di, py_dict, &term_list)) < 0)
+		/* Compile the terms of this condition. */
+		if ((ret = create_condition(di, py_dict, &cond)) < 0)
 			break;
 
-		/* Add the new condition to the PD instance's condition list. */
-		di->condition_list = g_slist_append(di->condition_list, term_list);
+		/* Add the new condition to the new condition list. */
+		g_array_append_val(condition_list, cond);
 	}
 
 	Py_DecRef(py_conditionlist);
 
+	/* Make the new condition list the PD instance's current one. */
+	if (ret == SRD_OK) {
+		condition_list_set(di,
+			&g_array_index(condition_list, struct srd_condition, 0),
+			condition_list->len);
+		condition_cache_add(di, py_conds, condition_list);
+	} else {
+		g_array_free(condition_list, TRUE);
+	}
+
 	PyGILState_Release(gstate);
 
 	return ret;
@@ -939,9 +1752,9 @@ ret_9999:
  *                 The contents of di->condition_list are undefined.
  *
  * This routine is a reduced and specialized version of the @ref
- * set_new_condition_list() and @ref create_term_list() routines which
+ * set_new_condition_list() and @ref create_condition() routines which
  * gets invoked when .wait() was called without specifications for
- * conditions. This minor duplication of the SKIP term list creation
+ * conditions. This minor duplication of the SKIP condition creation
  * simplifies the logic and avoids the creation of expensive Python
  * objects with "constant" values which the caller did not pass in the
  * first place. It results in maximum sharing of match handling code
@@ -949,16 +1762,13 @@ ret_9999:
  */
 static int set_skip_condition(struct srd_decoder_inst *di, uint64_t count)
 {
-	struct srd_term *term;
-	GSList *term_list;
+	struct srd_condition cond;
 
-	condition_list_free(di);
-	term = g_malloc(sizeof(*term));
-	term->type = SRD_TERM_SKIP;
-	term->num_samples_to_skip = count;
-	term->num_samples_already_skipped = 0;
-	term_list = g_slist_append(NULL, term);
-	di->condition_list = g_slist_append(di->condition_list, term_list);
+	memset(&cond, 0, sizeof(cond));
+	cond.has_skip = TRUE;
+	cond.num_samples_to_skip = count;
+	cond.num_samples_already_skipped = 0;
+	condition_list_set(di, &cond, 1);
 
 	return SRD_OK;
 }
@@ -977,35 +1787,38 @@ PyDoc_STRVAR(Decoder_wait_doc,
 	"\n"
 	"Supported parameters for channel number keys: 'h', 'l', 'r', 'f',\n"
 	"or 'e' for level or edge conditions. Other supported keywords:\n"
-	"'skip' to advance over the given number of samples.\n"
+	"'skip' to advance over the given number of samples, 'pattern' with\n"
+	"a (mask, value) tuple to match the levels of several channels (bit N\n"
+	"for channel N), 'changed' with a mask to match a change of any of\n"
+	"the masked channels. 'min_width' and 'max_width' limit the number\n"
+	"of samples since the previous change of the condition's channels\n"
+	"(or since the start of the decoding), 'stable' requires these\n"
+	"channels to be unchanged for the given number of samples.\n"
+	"\n"
+	"Returns a tuple of pin values. When the optional 'packed' keyword\n"
+	"argument is True, the pin values are returned as an integer, bit N\n"
+	"holds the value of channel N. Unused optional channels read as low,\n"
+	"self.unused_pins has their bits set.\n"
 );
 
-static PyObject *Decoder_wait(PyObject *self, PyObject *args)
+/**
+ * Set up the condition list of a .wait() call.
+ *
+ * @param self The Python decoder object. Must not be NULL.
+ * @param di The decoder instance to use. Must not be NULL.
+ * @param py_conds The conditions argument of .wait(). Must not be NULL.
+ *
+ * @return SRD_OK upon success, a negative error code otherwise.
+ */
+static int setup_wait_conditions(PyObject *self, struct srd_decoder_inst *di,
+	PyObject *py_conds)
 {
 	int ret;
 	uint64_t skip_count;
-	unsigned int i;
-	gboolean found_match;
-	struct srd_decoder_inst *di;
-	PyObject *py_pinvalues, *py_matched, *py_samplenum;
-	PyGILState_STATE gstate;
-
-	if (!self || !args)
-		return NULL;
-
-	gstate = PyGILState_Ensure();
-
-	if (!(di = srd_inst_find_by_obj(NULL, self))) {
-		PyErr_SetString(PyExc_Exception, "decoder instance not found");
-		PyGILState_Release(gstate);
-		Py_RETURN_NONE;
-	}
 
-	ret = set_new_condition_list(self, args);
-	if (ret < 0) {
-		srd_dbg("%s: %s: Aborting wait().", di->inst_id, __func__);
-		goto err;
-	}
+	ret = set_new_condition_list(self, py_conds);
+	if (ret < 0)
+		return ret;
 	if (ret == 9999) {
 		/*
 		 * Empty condition list, automatic match. Arrange for the
@@ -1024,10 +1837,31 @@ static PyObject *Decoder_wait(PyObject *self, PyObject *args)
 		if (ret < 0) {
 			srd_dbg("%s: %s: Cannot setup condition-less wait().",
 				di->inst_id, __func__);
-			goto err;
+			return ret;
 		}
 	}
 
+	return SRD_OK;
+}
+
+/**
+ * Wait until the decoder instance's current conditions match.
+ *
+ * Blocks until a match is found in the sample data, or until EOF or the
+ * termination of the decoder was requested. Must be called with the GIL
+ * held.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ *
+ * @retval SRD_OK A match was found at di->abs_cur_samplenum. The
+ *                instance's data_mutex is locked, the caller must
+ *                unlock it.
+ * @retval SRD_ERR No match, a Python exception may have been raised.
+ */
+static int wait_for_match(struct srd_decoder_inst *di)
+{
+	gboolean found_match;
+
 	while (1) {
 
 		Py_BEGIN_ALLOW_THREADS
@@ -1051,32 +1885,8 @@ static PyObject *Decoder_wait(PyObject *self, PyObject *args)
 
 		Py_END_ALLOW_THREADS
 
-		/* If there's a match, set self.samplenum etc. and return. */
-		if (found_match) {
-			/* Set self.samplenum to the (absolute) sample number that matched. */
-			py_samplenum = PyLong_FromUnsignedLongLong(di->abs_cur_samplenum);
-			PyObject_SetAttrString(di->py_inst, "samplenum", py_samplenum);
-			Py_DECREF(py_samplenum);
-
-			if (di->match_array && di->match_array->len > 0) {
-				py_matched = PyTuple_New(di->match_array->len);
-				for (i = 0; i < di->match_array->len; i++)
-					PyTuple_SetItem(py_matched, i, PyBool_FromLong(di->match_array->data[i]));
-				PyObject_SetAttrString(di->py_inst, "matched", py_matched);
-				Py_DECREF(py_matched);
-				match_array_free(di);
-			} else {
-				PyObject_SetAttrString(di->py_inst, "matched", Py_None);
-			}
-
-			py_pinvalues = get_current_pinvalues(di);
-
-			g_mutex_unlock(&di->data_mutex);
-
-			PyGILState_Release(gstate);
-
-			return py_pinvalues;
-		}
+		if (found_match)
+			return SRD_OK;
 
 		/* No match, reset state for the next chunk. */
 		di->got_new_samples = FALSE;
@@ -1102,7 +1912,7 @@ static PyObject *Decoder_wait(PyObject *self, PyObject *args)
 				di->inst_id, __func__);
 			g_mutex_unlock(&di->data_mutex);
 			PyErr_SetString(PyExc_EOFError, "samples exhausted");
-			goto err;
+			return SRD_ERR;
 		}
 
 		/*
@@ -1113,15 +1923,423 @@ static PyObject *Decoder_wait(PyObject *self, PyObject *args)
 			srd_dbg("%s: %s: Will return from wait().",
 				di->inst_id, __func__);
 			g_mutex_unlock(&di->data_mutex);
-			goto err;
+			return SRD_ERR;
 		}
 
 		g_mutex_unlock(&di->data_mutex);
 	}
+}
+
+/**
+ * Set self.matched from the decoder instance's match array.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ */
+static void set_matched_attr(struct srd_decoder_inst *di)
+{
+	PyObject *py_matched;
+	unsigned int i;
+
+	if (di->match_array && di->match_array->len > 0) {
+		py_matched = PyTuple_New(di->match_array->len);
+		for (i = 0; i < di->match_array->len; i++)
+			PyTuple_SetItem(py_matched, i, PyBool_FromLong(g_array_index(di->match_array, gboolean, i)));
+		PyObject_SetAttrString(di->py_inst, "matched", py_matched);
+		Py_DECREF(py_matched);
+		g_array_set_size(di->match_array, 0);
+	} else {
+		PyObject_SetAttrString(di->py_inst, "matched", Py_None);
+	}
+}
+
+/**
+ * Get the pin values of the current sample as an integer.
+ *
+ * Bit N of the result holds the value of the decoder's channel N.
+ * Unused optional channels read as low.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ *
+ * @return The current sample's pin values.
+ */
+static uint64_t get_current_pins_packed(struct srd_decoder_inst *di)
+{
+	const uint8_t *sample_pos;
+	uint64_t pins;
+	int i, ch;
+
+	sample_pos = srd_inst_sample_pos(di, di->abs_cur_samplenum - di->abs_start_samplenum);
+	pins = 0;
+	for (i = 0; i < di->dec_num_channels; i++) {
+		ch = di->dec_channelmap[i];
+		if (ch == -1)
+			continue;
+		if (sample_pos[ch / 8] & (1 << (ch % 8)))
+			pins |= UINT64_C(1) << i;
+	}
+
+	return pins;
+}
+
+/**
+ * Get the conditions which matched at the current sample as an integer.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ *
+ * @return Bit N is set when condition N matched. Zero for automatic
+ *         matches of .wait() calls without conditions.
+ */
+static uint64_t get_matched_packed(const struct srd_decoder_inst *di)
+{
+	uint64_t matched;
+	unsigned int i;
+
+	matched = 0;
+	if (!di->match_array)
+		return matched;
+	for (i = 0; i < di->match_array->len && i < 64; i++) {
+		if (g_array_index(di->match_array, gboolean, i))
+			matched |= UINT64_C(1) << i;
+	}
+
+	return matched;
+}
+
+static PyObject *Decoder_wait(PyObject *self, PyObject *args, PyObject *kwargs)
+{
+	int ret, packed;
+	struct srd_decoder_inst *di;
+	PyObject *py_conds, *py_packed, *py_pinvalues, *py_samplenum;
+	char *keywords[] = { "conds", "packed", NULL };
+	PyGILState_STATE gstate;
+
+	if (!self || !args)
+		return NULL;
+
+	gstate = PyGILState_Ensure();
+
+	if (!(di = srd_inst_find_by_obj(self))) {
+		PyErr_SetString(PyExc_Exception, "decoder instance not found");
+		PyGILState_Release(gstate);
+		Py_RETURN_NONE;
+	}
+
+	/*
+	 * Parse the arguments of self.wait() into 'py_conds' and
+	 * 'py_packed'. Both are optional, None and False are assumed
+	 * in their absence.
+	 */
+	py_conds = Py_None;
+	py_packed = Py_False;
+	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "|OO", keywords,
+			&py_conds, &py_packed)) {
+		/* Let Python raise this exception. */
+		goto err;
+	}
+	if ((packed = PyObject_IsTrue(py_packed)) < 0)
+		goto err;
+	if (packed && di->dec_num_channels > SRD_MAX_CONDITION_CHANNELS) {
+		PyErr_SetString(PyExc_ValueError, "too many channels");
+		goto err;
+	}
+
+	ret = setup_wait_conditions(self, di, py_conds);
+	if (ret < 0) {
+		srd_dbg("%s: %s: Aborting wait().", di->inst_id, __func__);
+		goto err;
+	}
+
+	if (wait_for_match(di) != SRD_OK)
+		goto err;
+
+	/* Set self.samplenum to the (absolute) sample number that matched. */
+	py_samplenum = PyLong_FromUnsignedLongLong(di->abs_cur_samplenum);
+	PyObject_SetAttrString(di->py_inst, "samplenum", py_samplenum);
+	Py_DECREF(py_samplenum);
+
+	set_matched_attr(di);
+
+	if (packed)
+		py_pinvalues = PyLong_FromUnsignedLongLong(get_current_pins_packed(di));
+	else
+		py_pinvalues = get_current_pinvalues(di);
+
+	g_mutex_unlock(&di->data_mutex);
 
 	PyGILState_Release(gstate);
 
-	Py_RETURN_NONE;
+	return py_pinvalues;
+
+err:
+	PyGILState_Release(gstate);
+
+	return NULL;
+}
+
+/**
+ * Convert an array of uint64_t values to a Python array('Q').
+ *
+ * @param values The values. Must not be NULL.
+ *
+ * @return A new reference, or NULL with a Python exception set.
+ */
+static PyObject *uint64_array_to_py(const GArray *values)
+{
+	PyObject *py_mod, *py_bytes, *py_array;
+
+	py_bytes = PyBytes_FromStringAndSize(values->data,
+		values->len * sizeof(uint64_t));
+	if (!py_bytes)
+		return NULL;
+
+	if (!(py_mod = py_import_by_name("array"))) {
+		Py_DECREF(py_bytes);
+		return NULL;
+	}
+	py_array = PyObject_CallMethod(py_mod, "array", "sO", "Q", py_bytes);
+	Py_DECREF(py_mod);
+	Py_DECREF(py_bytes);
+
+	return py_array;
+}
+
+PyDoc_STRVAR(Decoder_wait_many_doc,
+	"Wait for up to 'count' occurrences of one or more conditions.\n"
+	"\n"
+	"Takes the same conditions as wait(). Blocks until the first match,\n"
+	"which is the sample wait() would return. Each further match is\n"
+	"searched from the sample after the previous match, and only taken\n"
+	"from the sample data which already is available. Returns a tuple\n"
+	"of three array('Q') with one item per match: the sample numbers,\n"
+	"the pin values, and the conditions which matched. Pin values are\n"
+	"integers like with wait(packed=True), bit N holds the value of\n"
+	"channel N. Matched conditions are integers, bit N is set when\n"
+	"condition N matched. self.samplenum and self.matched are set for\n"
+	"the last match.\n"
+);
+
+static PyObject *Decoder_wait_many(PyObject *self, PyObject *args)
+{
+	int ret;
+	Py_ssize_t count;
+	uint64_t match_samplenum, matched, value;
+	unsigned int i, num_matched_conds;
+	uint64_t *match_last_change;
+	uint8_t *match_old_pins;
+	gboolean found_match;
+	struct srd_decoder_inst *di;
+	GArray *samplenums, *pins, *matches;
+	PyObject *py_conds, *py_samplenums, *py_pins, *py_matched, *py_item;
+	PyObject *py_samplenum, *py_ret;
+	PyGILState_STATE gstate;
+
+	if (!self || !args)
+		return NULL;
+
+	gstate = PyGILState_Ensure();
+
+	if (!(di = srd_inst_find_by_obj(self))) {
+		PyErr_SetString(PyExc_Exception, "decoder instance not found");
+		goto err;
+	}
+
+	if (!PyArg_ParseTuple(args, "On", &py_conds, &count)) {
+		/* Let Python raise this exception. */
+		goto err;
+	}
+	if (count < 1) {
+		PyErr_SetString(PyExc_ValueError, "count must be positive");
+		goto err;
+	}
+	if (di->dec_num_channels > SRD_MAX_CONDITION_CHANNELS) {
+		PyErr_SetString(PyExc_ValueError, "too many channels");
+		goto err;
+	}
+
+	ret = setup_wait_conditions(self, di, py_conds);
+	if (ret < 0) {
+		srd_dbg("%s: %s: Aborting wait_many().", di->inst_id, __func__);
+		goto err;
+	}
+
+	if (wait_for_match(di) != SRD_OK)
+		goto err;
+
+	samplenums = g_array_new(FALSE, FALSE, sizeof(uint64_t));
+	pins = g_array_new(FALSE, FALSE, sizeof(uint64_t));
+	matches = g_array_new(FALSE, FALSE, sizeof(uint64_t));
+	match_old_pins = g_malloc(di->dec_num_channels);
+	match_last_change = g_malloc(SRD_MAX_CONDITION_CHANNELS * sizeof(uint64_t));
+
+	while (TRUE) {
+		g_array_append_val(samplenums, di->abs_cur_samplenum);
+		value = get_current_pins_packed(di);
+		g_array_append_val(pins, value);
+		matched = get_matched_packed(di);
+		num_matched_conds = di->match_array ? di->match_array->len : 0;
+		g_array_append_val(matches, matched);
+		if (samplenums->len == (guint)count)
+			break;
+
+		/*
+		 * Look for the next match in the remaining samples of the
+		 * current chunk, starting after the last match. Keep the
+		 * state of the last match, such that the next .wait() call
+		 * resumes from there when the chunk has no more matches.
+		 */
+		match_samplenum = di->abs_cur_samplenum;
+		if (di->old_pins_array)
+			memcpy(match_old_pins, di->old_pins_array->data, di->dec_num_channels);
+		if (di->last_change)
+			memcpy(match_last_change, di->last_change,
+				SRD_MAX_CONDITION_CHANNELS * sizeof(uint64_t));
+		if (setup_wait_conditions(self, di, py_conds) < 0) {
+			PyErr_Clear();
+			break;
+		}
+		srd_inst_condition_step(di);
+
+		Py_BEGIN_ALLOW_THREADS
+		found_match = FALSE;
+		(void)process_samples_until_condition_match(di, &found_match);
+		Py_END_ALLOW_THREADS
+
+		if (!found_match) {
+			di->abs_cur_samplenum = match_samplenum;
+			if (di->old_pins_array)
+				memcpy(di->old_pins_array->data, match_old_pins, di->dec_num_channels);
+			if (di->last_change)
+				memcpy(di->last_change, match_last_change,
+					SRD_MAX_CONDITION_CHANNELS * sizeof(uint64_t));
+			break;
+		}
+	}
+	g_free(match_old_pins);
+	g_free(match_last_change);
+
+	/* Set self.samplenum and self.matched for the last match. */
+	py_samplenum = PyLong_FromUnsignedLongLong(di->abs_cur_samplenum);
+	if (py_samplenum) {
+		PyObject_SetAttrString(di->py_inst, "samplenum", py_samplenum);
+		Py_DECREF(py_samplenum);
+	}
+
+	if (num_matched_conds > 0) {
+		py_item = PyTuple_New(num_matched_conds);
+		for (i = 0; py_item && i < num_matched_conds; i++)
+			PyTuple_SetItem(py_item, i, PyBool_FromLong(i < 64 && (matched & (UINT64_C(1) << i))));
+		if (py_item) {
+			PyObject_SetAttrString(di->py_inst, "matched", py_item);
+			Py_DECREF(py_item);
+		}
+	} else {
+		PyObject_SetAttrString(di->py_inst, "matched", Py_None);
+	}
+	if (di->match_array)
+		g_array_set_size(di->match_array, 0);
+
+	g_mutex_unlock(&di->data_mutex);
+
+	py_samplenums = uint64_array_to_py(samplenums);
+	py_pins = py_samplenums ? uint64_array_to_py(pins) : NULL;
+	py_matched = py_pins ? uint64_array_to_py(matches) : NULL;
+	g_array_free(samplenums, TRUE);
+	g_array_free(pins, TRUE);
+	g_array_free(matches, TRUE);
+	if (!py_matched) {
+		Py_XDECREF(py_samplenums);
+		Py_XDECREF(py_pins);
+		goto err;
+	}
+
+	py_ret = Py_BuildValue("(NNN)", py_samplenums, py_pins, py_matched);
+
+	PyGILState_Release(gstate);
+
+	return py_ret;
+
+err:
+	PyGILState_Release(gstate);
+
+	return NULL;
+}
+
+PyDoc_STRVAR(Decoder_edges_doc,
+	"Get the edges of a channel in the sample data which is available.\n"
+	"\n"
+	"Arguments: A channel index, and optionally the sample number to stop\n"
+	"at. Inspects the samples after self.samplenum, up to the end of the\n"
+	"currently available sample data or the given sample number. Does not\n"
+	"change the decoder's position, use wait() to advance.\n"
+	"Returns: A tuple of the channel's value at self.samplenum, and an\n"
+	"array('Q') with the sample numbers of the channel's edges. Edges\n"
+	"alternate in direction, the first edge is a rising edge when the\n"
+	"value is 0. The value is None when no sample data is available, and\n"
+	"0xff for unused optional channels.\n"
+);
+
+static PyObject *Decoder_edges(PyObject *self, PyObject *args)
+{
+	int channel, level;
+	uint64_t abs_end_samplenum;
+	struct srd_decoder_inst *di;
+	GArray *edges;
+	PyObject *py_end, *py_edges, *py_level, *py_ret;
+	PyGILState_STATE gstate;
+
+	if (!self || !args)
+		return NULL;
+
+	gstate = PyGILState_Ensure();
+
+	if (!(di = srd_inst_find_by_obj(self))) {
+		PyErr_SetString(PyExc_Exception, "decoder instance not found");
+		goto err;
+	}
+
+	py_end = Py_None;
+	if (!PyArg_ParseTuple(args, "i|O", &channel, &py_end)) {
+		/* Let Python raise this exception. */
+		goto err;
+	}
+	if (channel < 0 || channel >= di->dec_num_channels) {
+		srd_err("Invalid index %d, PD channel count %d.",
+			channel, di->dec_num_channels);
+		PyErr_SetString(PyExc_IndexError, "invalid channel index");
+		goto err;
+	}
+	abs_end_samplenum = UINT64_MAX;
+	if (py_end != Py_None) {
+		abs_end_samplenum = PyLong_AsUnsignedLongLong(py_end);
+		if (PyErr_Occurred())
+			goto err;
+	}
+
+	edges = g_array_new(FALSE, FALSE, sizeof(uint64_t));
+
+	Py_BEGIN_ALLOW_THREADS
+	g_mutex_lock(&di->data_mutex);
+	level = srd_inst_channel_edges(di, channel, abs_end_samplenum, edges);
+	g_mutex_unlock(&di->data_mutex);
+	Py_END_ALLOW_THREADS
+
+	py_edges = uint64_array_to_py(edges);
+	g_array_free(edges, TRUE);
+	if (!py_edges)
+		goto err;
+
+	if (level < 0) {
+		Py_INCREF(Py_None);
+		py_level = Py_None;
+	} else {
+		py_level = PyLong_FromLong(level);
+	}
+
+	py_ret = Py_BuildValue("(NN)", py_level, py_edges);
+
+	PyGILState_Release(gstate);
+
+	return py_ret;
 
 err:
 	PyGILState_Release(gstate);
@@ -1159,7 +2377,7 @@ static PyObject *Decoder_has_channel(PyObject *self, PyObject *args)
 
 	gstate = PyGILState_Ensure();
 
-	if (!(di = srd_inst_find_by_obj(NULL, self))) {
+	if (!(di = srd_inst_find_by_obj(self))) {
 		PyErr_SetString(PyExc_Exception, "decoder instance not found");
 		goto err;
 	}
@@ -1193,6 +2411,71 @@ err:
 	return NULL;
 }
 
+PyDoc_STRVAR(Decoder_is_ann_enabled_doc,
+	"Check whether annotations of a given class are passed on.\n"
+	"\n"
+	"Argument: An annotation class index.\n"
+	"Returns: A boolean, False if annotations of the class would be\n"
+	"dropped. Decoders can skip preparing them then.\n"
+);
+
+/**
+ * Return whether annotations of the specified class reach the frontend.
+ *
+ * @param self The decoder object. Must not be NULL.
+ * @param args The annotation class index. Must not be NULL.
+ *
+ * @retval Py_True Annotations of the class are passed on.
+ * @retval Py_False Annotations of the class are dropped.
+ * @retval NULL An error occurred.
+ */
+static PyObject *Decoder_is_ann_enabled(PyObject *self, PyObject *args)
+{
+	int ann_class;
+	gboolean enabled;
+	struct srd_decoder_inst *di;
+	PyGILState_STATE gstate;
+	PyObject *bool_ret;
+
+	if (!self || !args)
+		return NULL;
+
+	gstate = PyGILState_Ensure();
+
+	if (!(di = srd_inst_find_by_obj(self))) {
+		PyErr_SetString(PyExc_Exception, "decoder instance not found");
+		goto err;
+	}
+
+	if (!PyArg_ParseTuple(args, "i", &ann_class)) {
+		/* Let Python raise this exception. */
+		goto err;
+	}
+
+	if (ann_class < 0 || !g_slist_nth(di->decoder->annotations, ann_class)) {
+		srd_err("Invalid annotation class %d.", ann_class);
+		PyErr_SetString(PyExc_IndexError, "invalid annotation class");
+		goto err;
+	}
+
+	/* Without a frontend callback, annotations are dropped, too. */
+	enabled = !(di->disabled_outputs & (1U << SRD_OUTPUT_ANN)) &&
+		srd_inst_class_enabled(di->disabled_ann_classes, ann_class) &&
+		(di->sess->ann_batch_cb ||
+		 srd_pd_output_callback_find(di->sess, SRD_OUTPUT_ANN));
+
+	PyGILState_Release(gstate);
+
+	bool_ret = enabled ? Py_True : Py_False;
+	Py_INCREF(bool_ret);
+	return bool_ret;
+
+err:
+	PyGILState_Release(gstate);
+
+	return NULL;
+}
+
 PyDoc_STRVAR(Decoder_doc, "sigrok Decoder base class");
 
 static PyMethodDef Decoder_methods[] = {
@@ -1204,14 +2487,30 @@ static PyMethodDef Decoder_methods[] = {
 	  (PyCFunction)(void(*)(void))Decoder_register, METH_VARARGS | METH_KEYWORDS,
 	  Decoder_register_doc,
 	},
+	{ "register_ann_format",
+	  Decoder_register_ann_format, METH_VARARGS,
+	  Decoder_register_ann_format_doc,
+	},
 	{ "wait",
-	  Decoder_wait, METH_VARARGS,
+	  (PyCFunction)(void(*)(void))Decoder_wait, METH_VARARGS | METH_KEYWORDS,
 	  Decoder_wait_doc,
 	},
+	{ "wait_many",
+	  Decoder_wait_many, METH_VARARGS,
+	  Decoder_wait_many_doc,
+	},
+	{ "edges",
+	  Decoder_edges, METH_VARARGS,
+	  Decoder_edges_doc,
+	},
 	{ "has_channel",
 	  Decoder_has_channel, METH_VARARGS,
 	  Decoder_has_channel_doc,
 	},
+	{ "is_ann_enabled",
+	  Decoder_is_ann_enabled, METH_VARARGS,
+	  Decoder_is_ann_enabled_doc,
+	},
 	ALL_ZERO,
 };
 